@@ -0,0 +1,42 @@
+"""
+Compare two benchmark result files case by case:
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+from typing import Dict, Optional, Tuple
+
+CASE_FIELDS = ("path", "shape", "rows", "variant")
+
+def _cases(path: str) -> Dict[Tuple, dict]:
+    with open(path) as f:
+        report = json.load(f)
+    return {tuple(r.get(field) for field in CASE_FIELDS): r for r in report["results"]}
+
+def _change(old: Optional[float], new: Optional[float]) -> str:
+    if not old or new is None:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two PipeMan benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+    baseline = _cases(args.baseline)
+    candidate = _cases(args.candidate)
+    print(f"{'case':<70} {'rows/s':>10} {'p99':>10} {'peak rss':>10}")
+    for key in sorted(set(baseline) & set(candidate), key=str):
+        old, new = baseline[key], candidate[key]
+        print(
+            f"{' '.join(str(k) for k in key):<70} "
+            f"{_change(old.get('rows_per_second'), new.get('rows_per_second')):>10} "
+            f"{_change((old.get('latency') or {}).get('p99_ms'), (new.get('latency') or {}).get('p99_ms')):>10} "
+            f"{_change(old.get('peak_rss_mb'), new.get('peak_rss_mb')):>10}"
+        )
+    for key in sorted(set(baseline) ^ set(candidate), key=str):
+        print(f"{' '.join(str(k) for k in key):<70} only in {'baseline' if key in baseline else 'candidate'}")
+
+if __name__ == "__main__":
+    main()
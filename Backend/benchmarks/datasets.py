@@ -0,0 +1,81 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Tuple
+
+GENERATE_CHUNK_ROWS = 500_000
+
+# Column kinds per dataset shape: narrow/wide by numeric/string-heavy, plus a mixed one
+SHAPES: Dict[str, List[str]] = {
+    "narrow_numeric": ["int", "int", "float", "float"],
+    "narrow_string": ["int", "string", "string", "category"],
+    "wide_numeric": ["int"] * 20 + ["float"] * 30,
+    "wide_string": ["int"] + ["string"] * 35 + ["category"] * 14,
+    "mixed": ["int", "float", "string", "category", "datetime", "date", "int", "float", "string", "bool"],
+}
+CLICKHOUSE_TYPES = {
+    "int": "Int64", "float": "Float64", "string": "String", "category": "LowCardinality(String)",
+    "datetime": "DateTime64(3)", "date": "Date", "bool": "Bool",
+}
+STRING_POOL_SIZE = 10_000
+CATEGORY_POOL_SIZE = 20
+
+def columns(shape: str) -> List[Tuple[str, str]]:
+    # (name, kind) pairs, named c00_int, c01_float, ...
+    return [(f"c{i:02d}_{kind}", kind) for i, kind in enumerate(SHAPES[shape])]
+
+def clickhouse_columns(shape: str) -> List[Tuple[str, str]]:
+    return [(name, CLICKHOUSE_TYPES[kind]) for name, kind in columns(shape)]
+
+def _string_pool(rng: np.random.Generator, size: int, min_length: int, max_length: int) -> np.ndarray:
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789 "))
+    lengths = rng.integers(min_length, max_length + 1, size)
+    return np.array(["".join(rng.choice(letters, n)) for n in lengths], dtype=object)
+
+@lru_cache(maxsize=4)
+def _pools(seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return _string_pool(rng, STRING_POOL_SIZE, 8, 40), _string_pool(rng, CATEGORY_POOL_SIZE, 4, 12)
+
+def generate_frame(shape: str, rows: int, start: int = 0, seed: int = 0) -> pd.DataFrame:
+    """
+    Rows [start, start + rows) of a synthetic dataset. Every chunk depends only
+    on (seed, start), so datasets larger than memory are generated piecewise and
+    identically on every run.
+    """
+    strings, categories = _pools(seed)
+    rng = np.random.default_rng([seed, start])
+    ids = np.arange(start, start + rows, dtype=np.int64)
+    data = {}
+    for i, (name, kind) in enumerate(columns(shape)):
+        if kind == "int":
+            data[name] = ids if i == 0 else rng.integers(-2**31, 2**31, rows)
+        elif kind == "float":
+            data[name] = rng.normal(1000, 250, rows).round(4)
+        elif kind == "string":
+            data[name] = strings[rng.integers(0, STRING_POOL_SIZE, rows)]
+        elif kind == "category":
+            data[name] = categories[rng.integers(0, CATEGORY_POOL_SIZE, rows)]
+        elif kind == "datetime":
+            data[name] = pd.to_datetime(1_600_000_000_000 + rng.integers(0, 10**11, rows), unit="ms")
+        elif kind == "date":
+            data[name] = pd.to_datetime(18_000 + rng.integers(0, 3_000, rows), unit="D").normalize()
+        elif kind == "bool":
+            data[name] = rng.integers(0, 2, rows).astype(bool)
+    return pd.DataFrame(data)
+
+def iter_frames(
+    shape: str, rows: int, chunk_rows: int = GENERATE_CHUNK_ROWS, seed: int = 0
+) -> Iterator[pd.DataFrame]:
+    for start in range(0, rows, chunk_rows):
+        yield generate_frame(shape, min(chunk_rows, rows - start), start, seed)
+
+def write_csv(path: str, shape: str, rows: int, seed: int = 0, delimiter: str = ",") -> int:
+    """
+    Write the dataset as CSV in generated chunks and return the file size.
+    """
+    with open(path, "w", newline="") as f:
+        for i, frame in enumerate(iter_frames(shape, rows, seed=seed)):
+            frame.to_csv(f, sep=delimiter, index=False, header=i == 0)
+    return os.path.getsize(path)
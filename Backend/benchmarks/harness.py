@@ -0,0 +1,131 @@
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+
+RSS_SAMPLE_INTERVAL = 0.01
+
+def current_rss() -> Optional[int]:
+    # Resident set size in bytes, from /proc on Linux
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class RssSampler:
+    """
+    Track the peak RSS of the process while a case runs by polling it from a
+    background thread. Where /proc is unavailable this falls back to the
+    lifetime peak from getrusage, which can only grow between cases.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss() or 0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = current_rss() or 0
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if not self.peak:
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+            self.peak = usage if sys.platform == "darwin" else usage * 1024
+
+def percentiles(latencies: List[float]) -> Optional[Dict[str, float]]:
+    if not latencies:
+        return None
+    values = np.array(latencies) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+class LatencyRecorder:
+    # Thread-safe list of per-call latencies, e.g. one per inserted batch
+    def __init__(self):
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def reset(self) -> List[float]:
+        with self._lock:
+            latencies, self.latencies = self.latencies, []
+        return latencies
+
+class TimedClient:
+    """
+    Wrap a ClickHouse (or mock) client so every insert call records its
+    latency; everything else is passed through.
+    """
+
+    def __init__(self, client: Any, recorder: LatencyRecorder):
+        self._client = client
+        self._recorder = recorder
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def _timed(self, method: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return getattr(self._client, method)(*args, **kwargs)
+        finally:
+            self._recorder.record(time.perf_counter() - started)
+
+    def insert_df(self, *args, **kwargs):
+        return self._timed("insert_df", *args, **kwargs)
+
+    def insert_arrow(self, *args, **kwargs):
+        return self._timed("insert_arrow", *args, **kwargs)
+
+@contextmanager
+def measure() -> Iterator[dict]:
+    """
+    Measure wall time and peak RSS of the block into the yielded dict.
+    """
+    result = {}
+    with RssSampler() as sampler:
+        started = time.perf_counter()
+        try:
+            yield result
+        finally:
+            result["seconds"] = round(time.perf_counter() - started, 4)
+    result["peak_rss_mb"] = round(sampler.peak / (1024 * 1024), 1)
+
+def throughput(result: dict, rows: int, nbytes: Optional[int] = None) -> dict:
+    seconds = max(result["seconds"], 1e-9)
+    result["rows_per_second"] = round(rows / seconds, 1)
+    if nbytes is not None:
+        result["mb_per_second"] = round(nbytes / seconds / (1024 * 1024), 2)
+    return result
+
+def repeat(fn: Callable[[], Any], times: int) -> List[float]:
+    latencies = []
+    for _ in range(times):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return latencies
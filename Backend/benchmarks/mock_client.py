@@ -0,0 +1,139 @@
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+import pyarrow as pa
+from .datasets import clickhouse_columns, generate_frame, iter_frames
+
+MOCK_BLOCK_ROWS = 65_536
+
+class MockResult(NamedTuple):
+    column_names: List[str]
+    result_rows: List[tuple]
+
+class MockServer:
+    """
+    In-process stand-in for a ClickHouse server for offline runs. Tables are
+    registered as synthetic datasets and generated on read; inserts are
+    converted to Arrow, as a stand-in for the client's serialization cost, and
+    counted but not kept.
+    """
+
+    def __init__(self, block_rows: int = MOCK_BLOCK_ROWS, seed: int = 0):
+        self.block_rows = block_rows
+        self.seed = seed
+        self.tables: Dict[str, Tuple[str, int]] = {}
+        self.inserted_rows = 0
+        self._lock = threading.Lock()
+
+    def register_table(self, table: str, shape: str, rows: int):
+        self.tables[table] = (shape, rows)
+
+    def client(self, key=None) -> "MockClient":
+        return MockClient(self)
+
+class MockClient:
+    server_settings: Dict = {}
+
+    def __init__(self, server: MockServer):
+        self.server = server
+
+    def _table(self, sql: str) -> Tuple[str, str, int]:
+        match = re.search(r"\bFROM\s+`?([A-Za-z0-9_]+)`?|\bTABLE\s+`?([A-Za-z0-9_]+)`?", sql, re.IGNORECASE)
+        table = next(name for name in match.groups() if name) if match else ""
+        shape, rows = self.server.tables.get(table, ("narrow_numeric", 0))
+        return table, shape, rows
+
+    def _selected(self, sql: str, shape: str) -> List[str]:
+        names = [name for name, _ in clickhouse_columns(shape)]
+        match = re.match(r"\s*SELECT\s+(.*?)\s+FROM\s", sql, re.IGNORECASE | re.DOTALL)
+        if not match or match.group(1).strip() == "*":
+            return names
+        selected = [c.strip().strip("`") for c in match.group(1).split(",")]
+        return [c for c in selected if c in names] or names
+
+    def _limit(self, sql: str, rows: int) -> Tuple[int, int]:
+        limit = re.search(r"\bLIMIT\s+([0-9]+)", sql, re.IGNORECASE)
+        offset = re.search(r"\bOFFSET\s+([0-9]+)", sql, re.IGNORECASE)
+        start = min(int(offset.group(1)) if offset else 0, rows)
+        return start, min(rows, start + int(limit.group(1))) if limit else rows
+
+    def _frames(self, sql: str):
+        _, shape, rows = self._table(sql)
+        selected = self._selected(sql, shape)
+        for frame in iter_frames(shape, rows, self.server.block_rows, self.server.seed):
+            yield frame[selected]
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def command(self, sql: str, settings=None, **kwargs):
+        if re.search(r"\bcount\(\)", sql, re.IGNORECASE):
+            return self._table(sql)[2]
+        return None
+
+    def query(self, sql: str, parameters=None, settings=None, **kwargs) -> MockResult:
+        table, shape, rows = self._table(sql)
+        if re.match(r"\s*DESCRIBE\b", sql, re.IGNORECASE):
+            return MockResult(["name", "type"], [(name, col_type) for name, col_type in clickhouse_columns(shape)])
+        if re.match(r"\s*SHOW\s+TABLES", sql, re.IGNORECASE):
+            return MockResult(["name"], [(name,) for name in self.server.tables])
+        if "system.tables" in sql and "create_table_query" in sql:
+            return MockResult(["engine", "create_table_query"], [("MergeTree", f"CREATE TABLE {table} ENGINE = MergeTree")])
+        if "system.tables" in sql:
+            return MockResult(["sorting_key", "sampling_key"], [("", "")])
+        if re.search(r"\bcount\(\)", sql, re.IGNORECASE):
+            return MockResult(["count()"], [(rows,)])
+        start, stop = self._limit(sql, rows)
+        frame = generate_frame(shape, stop - start, start, self.server.seed)[self._selected(sql, shape)]
+        return MockResult(frame.columns.tolist(), list(frame.itertuples(index=False, name=None)))
+
+    @contextmanager
+    def query_row_block_stream(self, sql: str, settings=None, **kwargs) -> Iterator:
+        yield (list(frame.itertuples(index=False, name=None)) for frame in self._frames(sql))
+
+    @contextmanager
+    def query_arrow_stream(self, sql: str, settings=None, **kwargs) -> Iterator:
+        yield (
+            batch for frame in self._frames(sql)
+            for batch in pa.Table.from_pandas(frame, preserve_index=False).to_batches()
+        )
+
+    def raw_stream(self, sql: str, fmt: str = "Native", settings=None, **kwargs) -> "_RawResponse":
+        return _RawResponse(pa.Table.from_pandas(frame, preserve_index=False) for frame in self._frames(sql))
+
+    def insert_df(self, table: str = None, df=None, **kwargs):
+        pa.Table.from_pandas(df, preserve_index=False)
+        with self.server._lock:
+            self.server.inserted_rows += len(df)
+
+    def insert_arrow(self, table: str, arrow_table: pa.Table, **kwargs):
+        arrow_table.combine_chunks()
+        with self.server._lock:
+            self.server.inserted_rows += arrow_table.num_rows
+
+class _RawResponse:
+    # Arrow IPC bytes stand in for Native output: only the copy to disk is measured
+
+    def __init__(self, tables: Iterator[pa.Table]):
+        self._tables = tables
+        self._buffer = bytearray()
+
+    def read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            table = next(self._tables, None)
+            if table is None:
+                break
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            self._buffer += sink.getvalue().to_pybytes()
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+    def close(self):
+        pass
@@ -0,0 +1,277 @@
+"""
+Benchmark the ingestion, export, preview and download paths against synthetic
+datasets and write the results as JSON.
+
+    python -m benchmarks.run --backend mock --rows 100000 1000000
+    python -m benchmarks.run --backend server --host localhost --port 8123
+    python -m benchmarks.run --backend local        # throwaway `clickhouse server`
+
+Run it from the Backend directory. Compare two result files with
+`python -m benchmarks.compare old.json new.json`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from typing import List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from .datasets import SHAPES, clickhouse_columns, write_csv
+from .harness import LatencyRecorder, TimedClient, measure, percentiles, repeat, throughput
+from .mock_client import MockServer
+from .servers import local_clickhouse, wait_for_server
+
+PATHS = ["index", "ingest", "export", "preview", "download"]
+EXPORT_FORMATS = ["csv", "parquet", "arrow", "native"]
+EXPORT_EXTENSIONS = {"csv": "csv", "parquet": "parquet", "arrow": "arrow", "native": "native"}
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="PipeMan benchmark suite")
+    parser.add_argument("--backend", choices=["mock", "server", "local"], default="mock")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="8123")
+    parser.add_argument("--database", default="default")
+    parser.add_argument("--user", default="default")
+    parser.add_argument("--clickhouse-binary", default="clickhouse")
+    parser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+    parser.add_argument("--rows", nargs="+", type=int, default=[100_000])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[10_000, 100_000])
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS)
+    parser.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS, default=["csv", "parquet"])
+    parser.add_argument("--parallelism", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=30, help="requests per preview page")
+    parser.add_argument("--download-encoding", default="identity", help="Accept-Encoding for downloads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="keep datasets here and reuse them across runs")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<timestamp>.json)")
+    return parser.parse_args(argv)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Runner:
+    """
+    Runs each benchmark case through the service functions, with the client
+    pool pointed at the selected backend and every insert timed.
+    """
+
+    def __init__(self, args: argparse.Namespace, host: str, port: str, mock: Optional[MockServer]):
+        from src.clickhouse_service import client_pool
+        from src.job_service import init_jobs
+        self.args = args
+        self.host = host
+        self.port = str(port)
+        self.mock = mock
+        self.results: List[dict] = []
+        self.recorder = LatencyRecorder()
+        client_factory = mock.client if mock else client_pool.factory
+        client_pool.clear()
+        client_pool.factory = lambda key: TimedClient(client_factory(key), self.recorder)
+        init_jobs()
+
+    def connection(self) -> tuple:
+        return self.host, self.port, self.args.database, self.args.user
+
+    def progress(self):
+        from src.job_service import JobProgress
+        return JobProgress(f"benchmark-{len(self.results)}", threading.Event(), "benchmark")
+
+    def add(self, result: dict):
+        self.results.append(result)
+        latency = result.get("latency") or {}
+        print(
+            f"{result['path']:<20} {result['shape']:<15} rows={result['rows']:<10} "
+            f"{result.get('variant', ''):<18} {result['seconds']:>9.3f}s "
+            f"{result.get('rows_per_second', 0):>12,.0f} rows/s "
+            f"p99={latency.get('p99_ms', '-')}ms rss={result['peak_rss_mb']}MB",
+            flush=True
+        )
+
+    def run_shape(self, shape: str, rows: int):
+        from src.csv_index import index_csv_file, remove_row_index
+        filename = f"bench_{shape}_{rows}.csv"
+        file_path = os.path.join("Uploads", filename)
+        if not os.path.exists(file_path):
+            write_csv(file_path, shape, rows, self.args.seed)
+        size = os.path.getsize(file_path)
+        table = f"bench_{shape}_{rows}"
+        case = {"shape": shape, "rows": rows, "file_mb": round(size / (1024 * 1024), 2)}
+        paths = self.args.paths
+
+        # Index once up front so ingest and preview cases don't pay for it
+        remove_row_index(file_path)
+        with measure() as result:
+            index_csv_file(file_path)
+        if "index" in paths:
+            self.add(throughput({"path": "index_csv", **case, **result}, rows, size))
+        if "ingest" in paths or "export" in paths or "preview" in paths:
+            self.ingest(filename, table, case, size, rows)
+        if "export" in paths:
+            self.export(table, shape, case, rows)
+        if "preview" in paths:
+            self.preview(filename, table, shape, case, rows)
+        if "download" in paths:
+            self.download(filename, shape, case, size, rows)
+
+    def ingest(self, filename: str, table: str, case: dict, size: int, rows: int):
+        from src.clickhouse_service import clickhouse_client
+        from src.flatfile_service import ingest_flatfile_to_clickhouse
+        batch_sizes = self.args.batch_sizes if "ingest" in self.args.paths else self.args.batch_sizes[-1:]
+        for batch_size in batch_sizes:
+            if self.mock:
+                self.mock.register_table(table, case["shape"], rows)
+            else:
+                with clickhouse_client(*self.connection()) as client:
+                    client.command(f"DROP TABLE IF EXISTS {table}")
+            progress = self.progress()
+            self.recorder.reset()
+            with measure() as result:
+                ingest_flatfile_to_clickhouse(
+                    filename, ",", *self.connection(), table, [], batch_size=batch_size,
+                    parallelism=self.args.parallelism, progress=progress
+                )
+            if "ingest" in self.args.paths:
+                self.add(throughput({
+                    "path": "ingest_flatfile", **case, "variant": f"batch={batch_size}", "batch_size": batch_size,
+                    **result, "latency": percentiles(self.recorder.reset()), "timings": progress.timings
+                }, rows, size))
+
+    def export(self, table: str, shape: str, case: dict, rows: int):
+        from src.clickhouse_service import ingest_clickhouse_to_flatfile
+        columns = [name for name, _ in clickhouse_columns(shape)]
+        for output_format in self.args.formats:
+            output_file = f"{table}_export.{EXPORT_EXTENSIONS[output_format]}"
+            progress = self.progress()
+            with measure() as result:
+                count = ingest_clickhouse_to_flatfile(
+                    *self.connection(), table, columns, output_file, ",",
+                    output_format=output_format, progress=progress
+                )
+            size = os.path.getsize(os.path.join("Uploads", output_file))
+            self.add(throughput({
+                "path": "export_clickhouse", **case, "variant": output_format, "format": output_format,
+                "output_mb": round(size / (1024 * 1024), 2), "record_count": count, **result,
+                "timings": progress.timings
+            }, rows, size))
+            os.remove(os.path.join("Uploads", output_file))
+
+    def preview(self, filename: str, table: str, shape: str, case: dict, rows: int):
+        from src.clickhouse_service import preview_clickhouse_data
+        from src.flatfile_service import preview_flatfile_data
+        columns = [name for name, _ in clickhouse_columns(shape)]
+        page_size = 100
+        offsets = {"first": 0, "middle": rows // 2, "last": max(rows - page_size, 0)}
+        for label, offset in offsets.items():
+            with measure() as result:
+                latencies = repeat(
+                    lambda: preview_flatfile_data(filename, ",", [], page_size, offset), self.args.repeat
+                )
+            self.add(throughput({
+                "path": "preview_flatfile", **case, "variant": f"page={label}", "offset": offset,
+                **result, "latency": percentiles(latencies)
+            }, page_size * len(latencies)))
+            with measure() as result:
+                latencies = repeat(
+                    lambda: preview_clickhouse_data(
+                        *self.connection(), table, columns, page_size=page_size, offset=offset
+                    ),
+                    self.args.repeat
+                )
+            self.add(throughput({
+                "path": "preview_clickhouse", **case, "variant": f"page={label}", "offset": offset,
+                **result, "latency": percentiles(latencies)
+            }, page_size * len(latencies)))
+
+    def download(self, filename: str, shape: str, case: dict, size: int, rows: int):
+        from starlette.requests import Request
+        from src.main import download_file
+        columns = [name for name, _ in clickhouse_columns(shape)]
+        # All columns takes the byte-copy path; half of them goes through csv re-encoding
+        for variant, selected in (("all_columns", columns), ("half_columns", columns[::2])):
+            request = Request({
+                "type": "http", "method": "GET", "path": f"/api/download/{filename}", "query_string": b"",
+                "headers": [(b"accept-encoding", self.args.download_encoding.encode())]
+            })
+
+            async def consume() -> tuple:
+                response = await download_file(
+                    request, filename, columns=selected, source=None, table=None, host=None,
+                    port=None, database=None, user=None, delimiter=","
+                )
+                first_byte = None
+                total = 0
+                async for chunk in response.body_iterator:
+                    first_byte = first_byte or time.perf_counter()
+                    total += len(chunk)
+                return first_byte, total
+
+            with measure() as result:
+                started = time.perf_counter()
+                first_byte, total = asyncio.run(consume())
+            self.add(throughput({
+                "path": "download", **case, "variant": variant, "encoding": self.args.download_encoding,
+                "response_mb": round(total / (1024 * 1024), 2), **result,
+                "latency": {"time_to_first_byte_ms": round(((first_byte or started) - started) * 1000, 3)}
+            }, rows, size))
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", time.strftime("%Y%m%dT%H%M%S") + ".json"
+    ))
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="pipeman-bench-")
+    # The services resolve Uploads/ and their state store relative to the working directory
+    os.makedirs(os.path.join(workdir, "Uploads"), exist_ok=True)
+    os.chdir(workdir)
+
+    with ExitStack() as stack:
+        mock = None
+        host, port = args.host, args.port
+        if args.backend == "mock":
+            mock = MockServer(seed=args.seed)
+        elif args.backend == "local":
+            host, port = stack.enter_context(local_clickhouse(args.clickhouse_binary))
+        else:
+            wait_for_server(host, int(port), timeout=5)
+        runner = Runner(args, host, port, mock)
+        started = time.time()
+        for shape in args.shapes:
+            for rows in args.rows:
+                runner.run_shape(shape, rows)
+
+    report = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started)),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend": args.backend,
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")},
+        },
+        "results": runner.results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Wrote {len(runner.results)} results to {output}")
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
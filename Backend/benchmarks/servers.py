@@ -0,0 +1,58 @@
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+SERVER_START_TIMEOUT = 60
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_server(host: str, port: int, timeout: float = SERVER_START_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://{host}:{port}/ping", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"ClickHouse at {host}:{port} did not answer /ping within {timeout}s")
+        time.sleep(0.2)
+
+@contextmanager
+def local_clickhouse(binary: str = "clickhouse") -> Iterator[Tuple[str, int]]:
+    """
+    Run a throwaway ClickHouse server from the single `clickhouse` binary (the
+    one that also provides clickhouse-local) with its data in a temporary
+    directory, and yield its HTTP host and port.
+    """
+    if not shutil.which(binary):
+        raise RuntimeError(f"{binary} binary not found; install ClickHouse or use --backend server/mock")
+    data_dir = tempfile.mkdtemp(prefix="pipeman-bench-ch-")
+    http_port = _free_port()
+    process = subprocess.Popen(
+        [
+            binary, "server", "--",
+            f"--path={data_dir}/", f"--http_port={http_port}", f"--tcp_port={_free_port()}",
+            "--listen_host=127.0.0.1", "--logger.console=0", f"--logger.log={data_dir}/server.log",
+        ],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server("127.0.0.1", http_port)
+        yield "127.0.0.1", http_port
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,228 @@
+from fastapi import HTTPException
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Set, Tuple
+from .job_service import JobProgress
+
+PARQUET_EXTENSIONS = (".parquet",)
+ARROW_IPC_EXTENSIONS = (".arrow", ".feather", ".ipc")
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+COMPRESSED_CSV_EXTENSIONS = {".csv.gz": "gzip", ".csv.zst": "zstd"}
+ARROW_EXTENSIONS = (
+    PARQUET_EXTENSIONS + ARROW_IPC_EXTENSIONS + NDJSON_EXTENSIONS + tuple(COMPRESSED_CSV_EXTENSIONS)
+)
+
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+
+def is_arrow_format(filename: str) -> bool:
+    return filename.endswith(ARROW_EXTENSIONS)
+
+def read_arrow_schema(file_path: str, delimiter: Optional[str] = None) -> pa.Schema:
+    """
+    Schema of a columnar or compressed file. Parquet and Arrow IPC schemas come
+    from file metadata alone; text formats only parse their first block.
+    """
+    if file_path.endswith(PARQUET_EXTENSIONS):
+        return pq.read_schema(file_path)
+    if file_path.endswith(ARROW_IPC_EXTENSIONS):
+        with pa.memory_map(file_path) as source:
+            return _open_ipc(source).schema
+    if file_path.endswith(NDJSON_EXTENSIONS):
+        reader = pa_json.open_json(file_path)
+        try:
+            return reader.schema
+        finally:
+            reader.close()
+    with _open_compressed_csv(file_path, delimiter, None) as (reader, _):
+        return reader.schema
+
+def count_arrow_rows(file_path: str) -> Optional[int]:
+    """
+    Row count when it is available from metadata, otherwise None.
+    """
+    if file_path.endswith(PARQUET_EXTENSIONS):
+        return pq.ParquetFile(file_path).metadata.num_rows
+    return None
+
+def arrow_null_columns(file_path: str, delimiter: Optional[str] = None) -> Set[str]:
+    """
+    Columns holding nulls. Parquet answers from row group statistics (columns
+    without them count as nullable); the other formats are read through once,
+    since a null may first appear in any batch.
+    """
+    if file_path.endswith(PARQUET_EXTENSIONS):
+        metadata = pq.ParquetFile(file_path).metadata
+        nullable = set()
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                column = row_group.column(j)
+                stats = column.statistics
+                if stats is None or not stats.has_null_count or stats.null_count > 0:
+                    nullable.add(column.path_in_schema.split(".")[0])
+        return nullable
+    if file_path.endswith(ARROW_IPC_EXTENSIONS):
+        with pa.memory_map(file_path) as source:
+            reader = _open_ipc(source)
+            if isinstance(reader, pa.ipc.RecordBatchFileReader):
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            else:
+                batches = iter(reader)
+            return set().union(*(_null_columns(batch) for batch in batches))
+    if file_path.endswith(NDJSON_EXTENSIONS):
+        reader = pa_json.open_json(file_path)
+        try:
+            return set().union(*(_null_columns(batch) for batch in reader))
+        finally:
+            reader.close()
+    with _open_compressed_csv(file_path, delimiter, None) as (reader, _):
+        return set().union(*(_null_columns(batch) for batch in reader))
+
+def _null_columns(batch: pa.RecordBatch) -> Set[str]:
+    return {name for name, column in zip(batch.schema.names, batch.columns) if column.null_count}
+
+def iter_arrow_batches(
+    file_path: str, delimiter: Optional[str], columns: Optional[List[str]], batch_size: int,
+    progress: Optional[JobProgress] = None
+) -> Iterator[pa.Table]:
+    """
+    Yield the file as Arrow tables of at most `batch_size` rows, reading only the
+    requested columns.
+    """
+    if file_path.endswith(PARQUET_EXTENSIONS):
+        parquet_file = pq.ParquetFile(file_path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            if progress:
+                progress.advance(bytes=batch.nbytes)
+            table = pa.Table.from_batches([batch])
+            yield table.select(columns) if columns else table
+    elif file_path.endswith(ARROW_IPC_EXTENSIONS):
+        with pa.memory_map(file_path) as source:
+            reader = _open_ipc(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches)) \
+                if isinstance(reader, pa.ipc.RecordBatchFileReader) else reader
+            for batch in batches:
+                table = pa.Table.from_batches([batch])
+                yield from _rebatch(table.select(columns) if columns else table, batch_size, progress)
+    elif file_path.endswith(NDJSON_EXTENSIONS):
+        reader = pa_json.open_json(file_path)
+        try:
+            for batch in reader:
+                table = pa.Table.from_batches([batch])
+                yield from _rebatch(table.select(columns) if columns else table, batch_size, progress)
+        finally:
+            reader.close()
+    else:
+        with _open_compressed_csv(file_path, delimiter, columns) as (reader, raw):
+            position = 0
+            for batch in reader:
+                if progress:
+                    progress.advance(bytes=raw.tell() - position)
+                    position = raw.tell()
+                yield from _rebatch(pa.Table.from_batches([batch]), batch_size, None)
+
+def read_arrow_page(
+    file_path: str, delimiter: Optional[str], columns: Optional[List[str]], offset: int, limit: int
+) -> Tuple[pa.Table, Optional[int]]:
+    """
+    Rows [offset, offset + limit) and the total row count when it is known.
+    Parquet row groups and Arrow IPC record batches are located from metadata, so
+    only the blocks holding the page are read; text formats are streamed up to it.
+    """
+    if file_path.endswith(PARQUET_EXTENSIONS):
+        parquet_file = pq.ParquetFile(file_path)
+        metadata = parquet_file.metadata
+        groups, start, first_row = [], 0, None
+        for i in range(metadata.num_row_groups):
+            rows = metadata.row_group(i).num_rows
+            if start + rows > offset and start < offset + limit:
+                groups.append(i)
+                first_row = start if first_row is None else first_row
+            start += rows
+        if not groups:
+            schema = parquet_file.schema_arrow
+            schema = pa.schema([schema.field(c) for c in columns]) if columns else schema
+            return schema.empty_table(), metadata.num_rows
+        table = parquet_file.read_row_groups(groups, columns=columns)
+        table = table.select(columns) if columns else table
+        return table.slice(offset - first_row, limit), metadata.num_rows
+    if file_path.endswith(ARROW_IPC_EXTENSIONS):
+        with pa.memory_map(file_path) as source:
+            reader = _open_ipc(source)
+            if isinstance(reader, pa.ipc.RecordBatchFileReader):
+                batches, start, first_row = [], 0, None
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    if start + batch.num_rows > offset and start < offset + limit:
+                        batches.append(batch)
+                        first_row = start if first_row is None else first_row
+                    start += batch.num_rows
+                table = pa.Table.from_batches(batches, schema=reader.schema)
+                table = table.select(columns) if columns else table
+                return table.slice(offset - (first_row or 0), limit), start
+    batches, position = [], 0
+    for batch in iter_arrow_batches(file_path, delimiter, columns, limit):
+        if position + batch.num_rows > offset:
+            batches.append(batch.slice(max(offset - position, 0)))
+        position += batch.num_rows
+        if sum(b.num_rows for b in batches) >= limit:
+            break
+    if not batches:
+        schema = read_arrow_schema(file_path, delimiter)
+        schema = pa.schema([schema.field(c) for c in columns]) if columns else schema
+        return schema.empty_table(), None
+    return pa.concat_tables(batches).slice(0, limit), None
+
+def _rebatch(table: pa.Table, batch_size: int, progress: Optional[JobProgress]) -> Iterator[pa.Table]:
+    for offset in range(0, table.num_rows, batch_size):
+        chunk = table.slice(offset, batch_size)
+        if progress:
+            progress.advance(bytes=chunk.nbytes)
+        yield chunk
+
+def _open_ipc(source):
+    # .arrow/.feather files use the IPC file format; fall back to the stream format
+    try:
+        return pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return pa.ipc.open_stream(source)
+
+@contextmanager
+def _open_compressed_csv(
+    file_path: str, delimiter: Optional[str], columns: Optional[List[str]]
+) -> Iterator[Tuple[pa_csv.CSVStreamingReader, pa.NativeFile]]:
+    """
+    Streaming, multi-threaded pyarrow CSV reader over a gzip/zstd file. Also yields
+    the raw file so callers can report compressed bytes consumed.
+    """
+    if not delimiter:
+        raise HTTPException(status_code=400, detail="Delimiter required for CSV")
+    compression = next(c for ext, c in COMPRESSED_CSV_EXTENSIONS.items() if file_path.endswith(ext))
+    with pa.OSFile(file_path, "rb") as raw, pa.CompressedInputStream(raw, compression) as stream:
+        reader = pa_csv.open_csv(
+            stream,
+            read_options=pa_csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_SIZE),
+            parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+            convert_options=pa_csv.ConvertOptions(include_columns=columns)
+        )
+        yield reader, raw
+
+def conform_to_clickhouse_types(table: pa.Table, column_types: List[str]) -> pa.Table:
+    """
+    Cast columns that ClickHouse can't read natively (lists, structs, times, ...)
+    to strings so they land in the String columns chosen for them.
+    """
+    for i, (field, column_type) in enumerate(zip(table.schema, column_types)):
+        if column_type in ("String", "Nullable(String)") and not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+                                            or pa.types.is_binary(field.type)):
+            try:
+                column = pc.cast(table.column(i), pa.string())
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                column = pa.array([None if v is None else str(v) for v in table.column(i).to_pylist()], pa.string())
+            table = table.set_column(i, field.name, column)
+    return table
@@ -0,0 +1,387 @@
+from fastapi import HTTPException
+import fnmatch
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional
+import pandas as pd
+import pyarrow as pa
+from .arrow_readers import conform_to_clickhouse_types, count_arrow_rows, is_arrow_format, iter_arrow_batches, read_arrow_schema
+from .csv_index import MappedCSVReader
+from .flatfile_service import check_flatfile_type, create_ingest_table, iter_flatfile_chunks, resolve_flatfile_columns
+from .ingest_manifest import begin_load, complete_load, dedup_token, file_sha256, record_chunk
+from .insert_pipeline import run_insert_pipeline
+from .job_service import JobCancelled, JobProgress, stage_timer, timed_iter
+from .metrics import BATCH_INSERT_SECONDS, BATCH_ROWS
+from .models import TableSpec
+from .table_spec import sort_arrow_table, sort_columns, sort_frame
+from .type_inference import convert_chunk_to_clickhouse_types
+
+PARSE_PROCESSES = int(os.getenv("PIPEMAN_PARSE_PROCESSES", str(os.cpu_count() or 1)))
+MAX_BATCH_FILES = int(os.getenv("PIPEMAN_MAX_BATCH_FILES", "1000"))
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+class _BatchAborted(HTTPException):
+    # A file failed under the abort policy; never recorded as a per-file failure itself
+    pass
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by all batch jobs for parsing CSV row ranges. Workers
+    are spawned rather than forked because the server process runs threads.
+    """
+    global _parse_pool
+    with _pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
+def parse_csv_rows(
+    file_path: str, delimiter: str, start: int, stop: int, column_names: List[str], column_types: List[str]
+) -> pd.DataFrame:
+    # Runs in a parse process, which finds the row index in the sidecar written by the parent
+    try:
+        with MappedCSVReader(file_path, delimiter) as reader:
+            chunk = reader.read_rows(start, stop, column_names, dtype=str)
+        return convert_chunk_to_clickhouse_types(chunk, column_types)
+    except HTTPException as e:
+        # HTTPException doesn't survive the trip back through pickle and would break the pool
+        raise ValueError(e.detail) from None
+
+def resolve_batch_files(filenames: Optional[List[str]], pattern: Optional[str]) -> List[str]:
+    if bool(filenames) == bool(pattern):
+        raise HTTPException(status_code=400, detail="Either filenames or a pattern required")
+    if pattern:
+        if not re.match(r"^[a-zA-Z0-9_\-\.\*\?\[\]!]+$", pattern):
+            raise HTTPException(status_code=400, detail="Invalid pattern")
+        filenames = sorted(
+            name for name in os.listdir("Uploads")
+            if not name.startswith(".") and fnmatch.fnmatchcase(name, pattern)
+            and os.path.isfile(os.path.join("Uploads", name))
+        )
+        if not filenames:
+            raise HTTPException(status_code=404, detail=f"No files match {pattern}")
+    for name in filenames:
+        if not re.match(r"^[a-zA-Z0-9_\-\.]+$", name):
+            raise HTTPException(status_code=400, detail=f"Invalid filename: {name}")
+        if not os.path.exists(os.path.join("Uploads", name)):
+            raise HTTPException(status_code=404, detail=f"File not found: {name}")
+    if len(set(filenames)) != len(filenames):
+        raise HTTPException(status_code=400, detail="Duplicate filenames")
+    if len(filenames) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+    return filenames
+
+def _file_format(filename: str) -> str:
+    if filename.endswith(".csv"):
+        return "csv"
+    if is_arrow_format(filename):
+        return "arrow"
+    return "excel"
+
+def check_batch_schema(
+    filenames: List[str], delimiter: Optional[str], readers: Dict[str, MappedCSVReader]
+) -> List[str]:
+    """
+    Check once, before anything is loaded, that every file has the same format
+    and the same columns as the first one, in any order. CSV readers opened on
+    the way are added to `readers`; they also index files not indexed yet.
+    Returns the first file's columns.
+    """
+    formats = {_file_format(name) for name in filenames}
+    if len(formats) > 1:
+        raise HTTPException(status_code=400, detail="Files in a batch must share one format")
+    first = None
+    for name in filenames:
+        check_flatfile_type(name, delimiter)
+        file_path = os.path.join("Uploads", name)
+        if name.endswith(".csv"):
+            readers[name] = MappedCSVReader(file_path, delimiter)
+            header = readers[name].header
+        elif is_arrow_format(name):
+            header = read_arrow_schema(file_path, delimiter).names
+        else:
+            header = pd.read_excel(file_path, nrows=0).columns.tolist()
+        if first is None:
+            first = header
+            continue
+        missing = [col for col in first if col not in header]
+        extra = [col for col in header if col not in first]
+        if missing or extra:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Schema of {name} does not match {filenames[0]}: "
+                       f"missing {', '.join(missing) or 'none'}; extra {', '.join(extra) or 'none'}"
+            )
+    return first
+
+def ingest_flatfiles_batch(
+    filenames: Optional[List[str]], pattern: Optional[str], delimiter: str, host: str, port: str,
+    database: str, user: str, table: str, columns: Optional[List[str]],
+    batch_size: int = 10000, sample_rows: int = 10000, parallelism: int = 1,
+    parse_processes: Optional[int] = None, column_types: Optional[Dict[str, str]] = None,
+    table_spec: Optional[TableSpec] = None, idempotent: bool = False, on_error: str = "abort",
+    progress: Optional[JobProgress] = None
+) -> dict:
+    """
+    Load several flat files with one schema into one table. The schema is
+    checked and the table created once; CSV row ranges of all files are parsed
+    in the shared process pool and every batch goes through one insert
+    pipeline on pooled clients. A failing file stops the whole load under the
+    "abort" policy, while "skip" records it and carries on with the others;
+    rows it inserted before failing stay unless the load is idempotent and
+    rerun.
+    """
+    readers: Dict[str, MappedCSVReader] = {}
+    pending = deque()
+    try:
+        from .clickhouse_service import _connection_key, client_pool, clickhouse_client
+        if not re.match(r"^[a-zA-Z0-9_]+$", table):
+            raise HTTPException(status_code=400, detail="Invalid table name")
+        filenames = resolve_batch_files(filenames, pattern)
+        header = check_batch_schema(filenames, delimiter, readers)
+        if columns:
+            unknown = [col for col in columns if col not in header]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        # Types come from a sample of the first file; a file whose values don't fit fails on its own
+        column_names, column_types, order_by = resolve_flatfile_columns(
+            filenames[0], delimiter, columns, sample_rows, column_types, table_spec
+        )
+        presort = sort_columns(order_by, column_names)
+        create_ingest_table(
+            host, port, database, user, table, column_names, column_types, table_spec, order_by, idempotent
+        )
+
+        lock = threading.Lock()
+        files = {
+            name: {"filename": name, "status": "pending", "record_count": 0, "skipped_batches": 0, "error": None}
+            for name in filenames
+        }
+        # Batches of each file not yet inserted or dropped, plus one while the file is being read
+        outstanding = {name: 1 for name in filenames}
+        loads = {name: {"batch_size": batch_size, "committed": set()} for name in filenames}
+        if idempotent:
+            connection = "|".join(_connection_key(host, port, database, user)[:4])
+            for name in filenames:
+                with stage_timer("hash", progress):
+                    file_hash = file_sha256(os.path.join("Uploads", name))
+                loads[name] = {"file_hash": file_hash, **begin_load(
+                    connection, table, file_hash, name, batch_size, columns or []
+                )}
+                files[name]["skipped_batches"] = len(loads[name]["committed"])
+
+        def report():
+            if progress:
+                with lock:
+                    snapshot = [dict(f) for f in files.values()]
+                progress.update(
+                    files=snapshot,
+                    completed_files=sum(f["status"] == "completed" for f in snapshot),
+                    failed_files=sum(f["status"] == "failed" for f in snapshot)
+                )
+
+        def failed(name: str) -> bool:
+            return files[name]["status"] == "failed"
+
+        def fail(name: str, error: Exception):
+            if isinstance(error, (JobCancelled, _BatchAborted, BrokenProcessPool)):
+                raise error
+            detail = error.detail if isinstance(error, HTTPException) else str(error)
+            if on_error == "abort":
+                raise _BatchAborted(status_code=500, detail=f"Failed to load {name}: {detail}")
+            with lock:
+                files[name]["status"] = "failed"
+                files[name]["error"] = detail
+            report()
+
+        def settle(name: str):
+            with lock:
+                outstanding[name] -= 1
+                done = outstanding[name] == 0 and not failed(name)
+                if done:
+                    files[name]["status"] = "completed"
+            if done and idempotent:
+                complete_load(connection, table, loads[name]["file_hash"])
+            report()
+
+        if progress:
+            counts = [
+                readers[name].row_count if name in readers
+                else count_arrow_rows(os.path.join("Uploads", name)) if is_arrow_format(name) else None
+                for name in filenames
+            ]
+            progress.set_total(
+                rows=None if None in counts else sum(counts),
+                bytes=sum(os.path.getsize(os.path.join("Uploads", name)) for name in filenames)
+            )
+            report()
+        pool = get_parse_pool() if readers else None
+        # Ranges in flight for this job: its share of the shared pool, twice over so workers never idle
+        lookahead = min(parse_processes or PARSE_PROCESSES, PARSE_PROCESSES) * 2
+
+        def parsed() -> Optional[tuple]:
+            # Oldest range first, so each file's batches reach the inserts in order
+            name, key, future = pending.popleft()
+            try:
+                with stage_timer("parse", progress):
+                    chunk = future.result()
+            except BrokenProcessPool:
+                # A parse process died; the next job starts a fresh pool
+                shutdown_parse_pool()
+                raise
+            except Exception as e:
+                fail(name, e)
+                chunk = None
+            if chunk is None or failed(name):
+                settle(name)
+                return None
+            return name, key, chunk
+
+        def batches() -> Iterator[tuple]:
+            for name in filenames:
+                file_path = os.path.join("Uploads", name)
+                load = loads[name]
+                with lock:
+                    files[name]["status"] = "running"
+                report()
+                try:
+                    if name in readers:
+                        reader = readers[name]
+                        for start, stop in reader.row_ranges(load["batch_size"]):
+                            key = f"rows-{start}-{stop}"
+                            if failed(name):
+                                break
+                            if key in load["committed"]:
+                                continue
+                            if progress:
+                                begin, end = reader.byte_range(start, stop)
+                                progress.advance(bytes=end - begin)
+                            with lock:
+                                outstanding[name] += 1
+                            pending.append((name, key, pool.submit(
+                                parse_csv_rows, os.path.abspath(file_path), delimiter, start, stop,
+                                column_names, column_types
+                            )))
+                            while len(pending) >= lookahead:
+                                item = parsed()
+                                if item:
+                                    yield item
+                    else:
+                        if is_arrow_format(name):
+                            chunks = timed_iter(
+                                iter_arrow_batches(file_path, delimiter, column_names, load["batch_size"], progress),
+                                "parse", progress
+                            )
+                        else:
+                            chunks = iter_flatfile_chunks(
+                                file_path, delimiter, column_names, load["batch_size"], column_types, progress
+                            )
+                        for n, chunk in enumerate(chunks):
+                            key = f"batch-{n}"
+                            if failed(name):
+                                break
+                            if key in load["committed"]:
+                                continue
+                            with lock:
+                                outstanding[name] += 1
+                            yield name, key, chunk
+                except Exception as e:
+                    fail(name, e)
+                finally:
+                    settle(name)
+            while pending:
+                item = parsed()
+                if item:
+                    yield item
+
+        def insert_batch(worker_client, item) -> int:
+            name, key, chunk = item
+            try:
+                if failed(name):
+                    return 0
+                settings = None
+                if idempotent:
+                    settings = {"insert_deduplication_token": dedup_token(loads[name]["file_hash"], table, key)}
+                if isinstance(chunk, pa.Table):
+                    with stage_timer("sort", progress):
+                        chunk = sort_arrow_table(chunk, presort)
+                    with stage_timer("type_mapping", progress):
+                        chunk = conform_to_clickhouse_types(chunk, column_types)
+                    with stage_timer("insert", progress), BATCH_INSERT_SECONDS.time():
+                        worker_client.insert_arrow(table, chunk, settings=settings)
+                    rows = chunk.num_rows
+                else:
+                    with stage_timer("sort", progress):
+                        chunk = sort_frame(chunk, presort)
+                    with stage_timer("insert", progress), BATCH_INSERT_SECONDS.time():
+                        worker_client.insert_df(table=table, df=chunk, settings=settings)
+                    rows = len(chunk)
+                BATCH_ROWS.observe(rows)
+                if idempotent:
+                    record_chunk(connection, table, loads[name]["file_hash"], key, rows)
+                with lock:
+                    files[name]["record_count"] += rows
+                if progress:
+                    progress.advance(rows=rows)
+                return rows
+            except Exception as e:
+                fail(name, e)
+                return 0
+            finally:
+                settle(name)
+
+        started = time.monotonic()
+        try:
+            total_rows = run_insert_pipeline(
+                batches(),
+                lambda: clickhouse_client(host, port, database, user),
+                insert_batch,
+                parallelism=min(parallelism, client_pool.job_capacity)
+            )
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to insert data: {str(e)}")
+        elapsed = max(time.monotonic() - started, 1e-9)
+
+        results = [dict(f) for f in files.values()]
+        failures = [f for f in results if f["status"] == "failed"]
+        if len(failures) == len(results):
+            raise HTTPException(
+                status_code=500, detail=f"All files failed; first error: {failures[0]['error']}"
+            )
+        return {
+            "record_count": total_rows,
+            "files": results,
+            "completed_files": len(results) - len(failures),
+            "failed_files": len(failures),
+            "order_by": order_by,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(total_rows / elapsed, 1)
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch ingestion failed: {str(e)}")
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+        for reader in readers.values():
+            reader.close()
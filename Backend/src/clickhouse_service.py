@@ -1,54 +1,110 @@
 from fastapi import HTTPException
 from clickhouse_connect import get_client
-import pandas as pd
+from clickhouse_connect.driver.exceptions import DatabaseError, OperationalError
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import csv
 import re
 import os
-from typing import List, Optional
+import time
+from typing import Iterator, List, Optional
+from .models import JoinTable
+from .connection_pool import ClientPool, PoolTimeout
+from .metadata_cache import metadata_cache
+from .job_service import JobProgress, stage_timer, timed_iter
+from .metrics import STAGE_SECONDS
+from .file_writers import write_export_file
+from .partitioned_export import (
+    PartitionProgress, get_sorting_key, merge_part_files, part_file_path, partition_states, plan_partitions
+)
+from .query_export import plan_join_query, read_only_settings, validate_select_query
+from .preview_query import compile_filters, encode_cursor, keyset_condition
+from .watermark_store import begin_run, checkpoint_run, complete_run, get_watermark, reset_watermark, watermark_literal
+
+SECURE_PORTS = ["8443", "9440"]
+STREAM_CHUNK_SIZE = 64 * 1024
 
 def get_clickhouse_client(host: str, port: str, database: str, user: str):
     try:
-        client = get_client(
+        # get_client queries the server on creation, so no separate ping is needed
+        return get_client(
             host=host,
             port=int(port),
             database=database,
             user=user,
-            secure=port in ["8443", "9440"]
+            secure=str(port) in SECURE_PORTS
         )
-        # Test the connection
-        client.ping()
-        return client
-    except clickhouse_connect.exceptions.NetworkError as ne:
+    except OperationalError as ne:
         raise HTTPException(status_code=500, detail=f"Connection failed: {str(ne)}")
-    except clickhouse_connect.exceptions.DatabaseError as de:
+    except DatabaseError as de:
         raise HTTPException(status_code=500, detail=f"Database error: {str(de)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Client initialization failed: {str(e)}")
 
-def get_clickhouse_tables(host: str, port: str, database: str, user: str) -> List[str]:
+def _connection_key(host: str, port: str, database: str, user: str) -> tuple:
+    return (host, str(port), database, user, str(port) in SECURE_PORTS)
+
+client_pool = ClientPool(lambda key: get_clickhouse_client(*key[:4]), discard_on=(OperationalError,))
+
+@contextmanager
+def clickhouse_client(host: str, port: str, database: str, user: str) -> Iterator:
+    """
+    Borrow a client from the process-wide pool for the duration of the block.
+    """
     try:
-        client = get_clickhouse_client(host, port, database, user)
-        tables = client.query("SHOW TABLES").result_rows
+        started = time.perf_counter()
+        with client_pool.connection(_connection_key(host, port, database, user)) as client:
+            # Mostly pool wait; includes the handshake when a new client is created
+            STAGE_SECONDS.labels("connect").observe(time.perf_counter() - started)
+            yield client
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Connection pool exhausted: {str(e)}")
+
+def get_clickhouse_tables(host: str, port: str, database: str, user: str) -> List[str]:
+    def load_tables() -> List[str]:
+        with clickhouse_client(host, port, database, user) as client:
+            tables = client.query("SHOW TABLES").result_rows
         return [t[0] for t in tables]
-    except clickhouse_connect.exceptions.DatabaseError as de:
+
+    try:
+        return metadata_cache.get_or_load(("tables", _connection_key(host, port, database, user)), load_tables)
+    except DatabaseError as de:
         raise HTTPException(status_code=500, detail=f"Table fetch failed: {str(de)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Table fetch failed: {str(e)}")
 
-def get_clickhouse_columns(host: str, port: str, database: str, user: str, table: str) -> List[str]:
+def get_clickhouse_column_types(host: str, port: str, database: str, user: str, table: str) -> List[dict]:
+    def load_columns() -> List[dict]:
+        with clickhouse_client(host, port, database, user) as client:
+            columns = client.query(f"DESCRIBE TABLE {table}").result_rows
+        return [{"name": c[0], "type": c[1]} for c in columns]
+
     try:
         if not table or not re.match(r"^[a-zA-Z0-9_]+$", table):
             raise HTTPException(status_code=400, detail="Invalid table name")
-        client = get_clickhouse_client(host, port, database, user)
-        columns = client.query(f"DESCRIBE TABLE {table}").result_rows
-        return [c[0] for c in columns]
-    except clickhouse_connect.exceptions.DatabaseError as de:
+        key = ("columns", _connection_key(host, port, database, user), table)
+        return metadata_cache.get_or_load(key, load_columns)
+    except HTTPException as e:
+        raise e
+    except DatabaseError as de:
         raise HTTPException(status_code=500, detail=f"Column fetch failed: {str(de)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Column fetch failed: {str(e)}")
 
+def get_clickhouse_columns(host: str, port: str, database: str, user: str, table: str) -> List[str]:
+    return [c["name"] for c in get_clickhouse_column_types(host, port, database, user, table)]
+
+def invalidate_clickhouse_table(host: str, port: str, database: str, user: str, table: str):
+    key = _connection_key(host, port, database, user)
+    metadata_cache.invalidate(("tables", key))
+    metadata_cache.invalidate(("columns", key, table))
+
 def ingest_clickhouse_to_flatfile(
     host: str, port: str, database: str, user: str,
-    table: str, columns: List[str], output_file: str, delimiter: str
+    table: str, columns: List[str], output_file: str, delimiter: str,
+    output_format: str = "csv", row_group_size: Optional[int] = None,
+    compression: Optional[str] = None, compression_level: Optional[int] = None,
+    progress: Optional[JobProgress] = None
 ) -> int:
     try:
         if not table or not columns:
@@ -58,35 +114,386 @@ def ingest_clickhouse_to_flatfile(
         if not re.match(r"^[a-zA-Z0-9_]+$", table):
             raise HTTPException(status_code=400, detail=f"Invalid table name: {table}")
         
-        client = get_clickhouse_client(host, port, database, user)
         query = f"SELECT {', '.join(columns)} FROM {table}"
-        result = client.query(query)
-        df = pd.DataFrame(result.result_rows, columns=columns)
         
         output_path = os.path.join("Uploads", output_file)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        df.to_csv(output_path, sep=delimiter, index=False)
-        return len(df)
-    except clickhouse_connect.exceptions.DatabaseError as de:
+        with clickhouse_client(host, port, database, user) as client:
+            if progress:
+                with stage_timer("query", progress):
+                    progress.set_total(rows=client.command(f"SELECT count() FROM {table}"))
+            return write_export_file(
+                client, query, columns, output_path, output_format, delimiter,
+                row_group_size, compression, compression_level, progress
+            )
+    except HTTPException as e:
+        raise e
+    except DatabaseError as de:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(de)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
 
+def export_clickhouse_query(
+    host: str, port: str, database: str, user: str, output_file: str, delimiter: str,
+    query: Optional[str] = None, joins: Optional[List[JoinTable]] = None,
+    output_format: str = "csv", row_group_size: Optional[int] = None,
+    compression: Optional[str] = None, compression_level: Optional[int] = None,
+    progress: Optional[JobProgress] = None
+) -> dict:
+    """
+    Export the result of a read-only SELECT, or of a join planned from `joins`,
+    so the join runs inside ClickHouse and only its result is transferred. The
+    query runs with readonly settings; outer joins fill missing values with NULL.
+    """
+    try:
+        if bool(query) == bool(joins):
+            raise HTTPException(status_code=400, detail="Provide either a query or joins")
+        if not re.match(r"^[a-zA-Z0-9_\-\.]+$", os.path.basename(output_file)):
+            raise HTTPException(status_code=400, detail="Invalid output filename")
+        
+        if joins:
+            table_columns = {
+                t.table: get_clickhouse_columns(host, port, database, user, t.table) for t in joins
+            }
+            query, columns = plan_join_query(joins, table_columns)
+        else:
+            query = validate_select_query(query)
+            columns = None
+        
+        output_path = os.path.join("Uploads", output_file)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with clickhouse_client(host, port, database, user) as client:
+            settings = read_only_settings(client)
+            if joins:
+                settings["join_use_nulls"] = 1
+            if columns is None:
+                columns = [c[0] for c in client.query(f"DESCRIBE TABLE ({query})", settings=settings).result_rows]
+            count = write_export_file(
+                client, query, columns, output_path, output_format, delimiter,
+                row_group_size, compression, compression_level, progress, settings
+            )
+        return {"record_count": count, "columns": columns, "query": query}
+    except HTTPException as e:
+        raise e
+    except DatabaseError as de:
+        raise HTTPException(status_code=500, detail=f"Query export failed: {str(de)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query export failed: {str(e)}")
+
+def export_clickhouse_partitioned(
+    host: str, port: str, database: str, user: str,
+    table: str, columns: List[str], output_file: str, delimiter: str,
+    partitions: int, strategy: str = "hash", partition_column: Optional[str] = None,
+    merge: bool = True, ordered: bool = False, parallelism: Optional[int] = None,
+    output_format: str = "csv", row_group_size: Optional[int] = None,
+    compression: Optional[str] = None, compression_level: Optional[int] = None,
+    progress: Optional[JobProgress] = None
+) -> dict:
+    """
+    Export `table` as `partitions` concurrent range queries, each on its own pooled
+    connection, into numbered part files next to `output_file`. With `merge` the
+    parts are then concatenated in partition order into `output_file` itself.
+
+    With `ordered` every partition is sorted by the partition column (or the
+    table's sorting key), so the output is deterministic; range partitions are
+    also contiguous, which makes a merged file globally sorted.
+    """
+    try:
+        if not table or not columns:
+            raise HTTPException(status_code=400, detail="Table and columns required")
+        if not re.match(r"^[a-zA-Z0-9_\-\.]+$", os.path.basename(output_file)):
+            raise HTTPException(status_code=400, detail="Invalid output filename")
+        if not re.match(r"^[a-zA-Z0-9_]+$", table):
+            raise HTTPException(status_code=400, detail=f"Invalid table name: {table}")
+        if partition_column and not re.match(r"^[a-zA-Z0-9_]+$", partition_column):
+            raise HTTPException(status_code=400, detail=f"Invalid partition column: {partition_column}")
+
+        output_path = os.path.join("Uploads", output_file)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with clickhouse_client(host, port, database, user) as client:
+            sorting_key = get_sorting_key(client, table)
+            column = partition_column or (sorting_key[0] if sorting_key else None)
+            if strategy == "hash" and not column:
+                column = columns[0]
+            if strategy == "range" and not column:
+                raise HTTPException(status_code=400, detail="Partition column required for range partitioning")
+            with stage_timer("query", progress):
+                predicates, planned_rows = plan_partitions(client, table, strategy, partitions, column)
+                if progress:
+                    progress.set_total(rows=client.command(f"SELECT count() FROM {table}"))
+
+        order_by = ""
+        if ordered:
+            keys = [partition_column] if partition_column else sorting_key or [column or columns[0]]
+            order_by = f" ORDER BY {', '.join(keys)}"
+        base_query = f"SELECT {', '.join(columns)} FROM {table}"
+        states = partition_states(predicates)
+        part_paths = [part_file_path(output_path, i) for i in range(len(predicates))]
+        if progress:
+            progress.update(partitions=states)
+
+        def export_partition(index: int) -> int:
+            partition_progress = PartitionProgress(progress, states, index)
+            partition_progress.set_status("running")
+            with clickhouse_client(host, port, database, user) as client:
+                rows = write_export_file(
+                    client, f"{base_query} WHERE {predicates[index]}{order_by}", columns, part_paths[index],
+                    output_format, delimiter, row_group_size, compression, compression_level, partition_progress
+                )
+            partition_progress.set_status("completed")
+            return rows
+
+        # Each partition streams on one client for its whole query; the pool's reserve stays free
+        workers = min(parallelism or len(predicates), len(predicates), client_pool.job_capacity)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeman-export") as executor:
+            futures = [executor.submit(export_partition, i) for i in range(len(predicates))]
+            try:
+                counts = [f.result() for f in futures]
+            except BaseException:
+                for f in futures:
+                    f.cancel()
+                raise
+        if planned_rows is not None and sum(counts) != planned_rows:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Exported {sum(counts)} of {planned_rows} rows; the table's data parts changed "
+                       f"during the export (e.g. a background merge), retry it"
+            )
+
+        files = part_paths
+        if merge:
+            merge_part_files(part_paths, output_path, output_format, compression, compression_level)
+            for path in part_paths:
+                os.remove(path)
+            files = [output_path]
+        return {
+            "record_count": sum(counts),
+            "partitions": len(predicates),
+            "partition_counts": counts,
+            "files": [os.path.relpath(f, "Uploads") for f in files]
+        }
+    except HTTPException as e:
+        raise e
+    except DatabaseError as de:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(de)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
+
+def export_clickhouse_incremental(
+    host: str, port: str, database: str, user: str,
+    table: str, columns: List[str], output_file: str, delimiter: str,
+    watermark_column: str, append: bool = True, reset: bool = False,
+    progress: Optional[JobProgress] = None
+) -> dict:
+    """
+    Export only rows whose `watermark_column` is above the high-water mark stored
+    for (connection, table, output_file), then advance the mark. Rows are read in
+    watermark order and a checkpoint (file offset + watermark) is committed after
+    every block, at the last change of watermark value so ties are never split.
+    An interrupted run is resumed by truncating its file back to the checkpoint.
+    """
+    try:
+        if not table or not columns:
+            raise HTTPException(status_code=400, detail="Table and columns required")
+        if not re.match(r"^[a-zA-Z0-9_\-\.]+$", os.path.basename(output_file)):
+            raise HTTPException(status_code=400, detail="Invalid output filename")
+        if not re.match(r"^[a-zA-Z0-9_]+$", table):
+            raise HTTPException(status_code=400, detail=f"Invalid table name: {table}")
+        if not watermark_column or not re.match(r"^[a-zA-Z0-9_]+$", watermark_column):
+            raise HTTPException(status_code=400, detail="Valid watermark column required for incremental export")
+
+        connection = "|".join(_connection_key(host, port, database, user)[:4])
+        if reset:
+            reset_watermark(connection, table, output_file)
+        state = get_watermark(connection, table, output_file)
+        if state and state["column_name"] != watermark_column:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Output is tracked by watermark column {state['column_name']}; reset the watermark to change it"
+            )
+        resumed = bool(state and state["status"] == "running" and state["run_file"])
+
+        with clickhouse_client(host, port, database, user) as client:
+            if resumed:
+                run_file = state["run_file"]
+                run_path = os.path.join("Uploads", run_file)
+                target = state["run_target"]
+                floor = state["checkpoint_watermark"] or state["watermark"]
+                if os.path.exists(run_path):
+                    os.truncate(run_path, min(state["checkpoint_offset"] or 0, os.path.getsize(run_path)))
+            else:
+                floor = state["watermark"] if state else None
+                where = f" WHERE {watermark_column} > {floor}" if floor else ""
+                high, new_rows = client.query(
+                    f"SELECT max({watermark_column}), count() FROM {table}{where}"
+                ).result_rows[0]
+                if not new_rows:
+                    return {"record_count": 0, "watermark": floor, "output_file": output_file, "resumed": False}
+                target = watermark_literal(high)
+                run_file = output_file
+                if not append:
+                    stem, ext = os.path.splitext(output_file)
+                    run_file = f"{stem}.{time.strftime('%Y%m%d%H%M%S')}{ext}"
+                run_path = os.path.join("Uploads", run_file)
+                os.makedirs(os.path.dirname(run_path), exist_ok=True)
+                start_offset = os.path.getsize(run_path) if os.path.exists(run_path) else 0
+                begin_run(connection, table, output_file, watermark_column, run_file, target, start_offset)
+
+            conditions = [f"{watermark_column} > {floor}"] if floor else []
+            conditions.append(f"{watermark_column} <= {target}")
+            where = " AND ".join(conditions)
+            if progress:
+                with stage_timer("query", progress):
+                    progress.set_total(rows=client.command(f"SELECT count() FROM {table} WHERE {where}"))
+            select_columns = columns if watermark_column in columns else columns + [watermark_column]
+            mark = select_columns.index(watermark_column)
+            query = f"SELECT {', '.join(select_columns)} FROM {table} WHERE {where} ORDER BY {watermark_column}"
+
+            total_rows = 0
+            uncommitted = 0
+            with open(run_path, "a", newline="") as f:
+                writer = csv.writer(f, delimiter=delimiter)
+                if f.tell() == 0:
+                    writer.writerow(columns)
+                position = f.tell()
+                with client.query_row_block_stream(query) as stream:
+                    for block in timed_iter(stream, "fetch", progress):
+                        if not block:
+                            continue
+                        # Rows sharing the block's last watermark may continue in the next block
+                        split = len(block)
+                        while split > 0 and block[split - 1][mark] == block[-1][mark]:
+                            split -= 1
+                        if split:
+                            writer.writerows(row[:len(columns)] for row in block[:split])
+                            f.flush()
+                            os.fsync(f.fileno())
+                            checkpoint_run(
+                                connection, table, output_file, f.tell(),
+                                watermark_literal(block[split - 1][mark]), uncommitted + split
+                            )
+                            uncommitted = 0
+                        writer.writerows(row[:len(columns)] for row in block[split:])
+                        uncommitted += len(block) - split
+                        total_rows += len(block)
+                        if progress:
+                            progress.advance(rows=len(block), bytes=f.tell() - position)
+                            position = f.tell()
+                f.flush()
+                os.fsync(f.fileno())
+            complete_run(connection, table, output_file, target, uncommitted)
+        return {"record_count": total_rows, "watermark": target, "output_file": run_file, "resumed": resumed}
+    except HTTPException as e:
+        raise e
+    except DatabaseError as de:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(de)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
+
+def stream_clickhouse_csv(
+    host: str, port: str, database: str, user: str,
+    table: str, columns: List[str], delimiter: str
+) -> Iterator[bytes]:
+    """
+    Validate the export eagerly, then return a generator of CSV bytes read straight
+    from ClickHouse's CSVWithNames output, so rows are never decoded in Python.
+    """
+    if not table or not columns:
+        raise HTTPException(status_code=400, detail="Table and columns required")
+    if not re.match(r"^[a-zA-Z0-9_]+$", table):
+        raise HTTPException(status_code=400, detail=f"Invalid table name: {table}")
+    unknown = set(columns) - set(get_clickhouse_columns(host, port, database, user, table))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(sorted(unknown))}")
+    query = f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM {table}"
+    settings = {"format_csv_delimiter": delimiter, "format_csv_null_representation": ""}
+
+    def generate() -> Iterator[bytes]:
+        with clickhouse_client(host, port, database, user) as client:
+            response = client.raw_stream(query, settings=settings, fmt="CSVWithNames")
+            try:
+                while True:
+                    chunk = response.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                response.close()
+
+    return generate()
+
 def preview_clickhouse_data(
     host: str, port: str, database: str, user: str,
-    table: str, columns: List[str]
+    table: str, columns: List[str], filters: Optional[list] = None,
+    order_by: Optional[List[str]] = None, descending: bool = False,
+    page_size: int = 100, offset: int = 0, cursor: Optional[str] = None, sample: Optional[float] = None
 ) -> dict:
+    """
+    One page of a table. Filters are bound as typed query parameters. With
+    `order_by`, the response carries a keyset cursor for the next page, which
+    avoids scanning skipped rows the way OFFSET does. `sample` uses the table's
+    SAMPLE clause when it has a sampling key and random row selection otherwise.
+    """
     try:
         if not table or not columns:
             raise HTTPException(status_code=400, detail="Table and columns required")
         if not re.match(r"^[a-zA-Z0-9_]+$", table):
             raise HTTPException(status_code=400, detail=f"Invalid table name: {table}")
+        column_types = {c["name"]: c["type"] for c in get_clickhouse_column_types(host, port, database, user, table)}
+        order_by = order_by or []
+        unknown = [c for c in columns + order_by if c not in column_types]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        if cursor and not order_by:
+            raise HTTPException(status_code=400, detail="Cursor pagination requires order_by")
+        
+        conditions, parameters = compile_filters(filters, column_types)
+        if cursor:
+            condition, cursor_parameters = keyset_condition(order_by, column_types, cursor, descending)
+            conditions.append(condition)
+            parameters.update(cursor_parameters)
+        # Sort-key columns are fetched to build the next cursor even when not displayed
+        select_columns = columns + [c for c in order_by if c not in columns]
+        
+        with clickhouse_client(host, port, database, user) as client:
+            source = table
+            if sample:
+                sampling_key = client.query(
+                    "SELECT sampling_key FROM system.tables WHERE database = currentDatabase() AND name = {table:String}",
+                    parameters={"table": table}
+                ).result_rows
+                if sampling_key and sampling_key[0][0]:
+                    source = f"{table} SAMPLE {float(sample)}"
+                else:
+                    conditions.append(f"randCanonical() < {float(sample)}")
+            query = f"SELECT {', '.join(f'`{c}`' for c in select_columns)} FROM {source}"
+            if conditions:
+                query += " WHERE " + " AND ".join(f"({c})" for c in conditions)
+            if order_by:
+                direction = "DESC" if descending else "ASC"
+                query += " ORDER BY " + ", ".join(f"`{c}` {direction}" for c in order_by)
+            query += f" LIMIT {page_size + 1}"
+            if offset and not cursor:
+                query += f" OFFSET {offset}"
+            with stage_timer("query"):
+                result = client.query(query, parameters=parameters)
         
-        client = get_clickhouse_client(host, port, database, user)
-        query = f"SELECT {', '.join(columns)} FROM {table} LIMIT 100"
-        result = client.query(query)
-        return {"data": result.result_rows, "columns": columns}
-    except clickhouse_connect.exceptions.DatabaseError as de:
+        rows = result.result_rows
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = None
+        if has_more and order_by:
+            positions = [select_columns.index(c) for c in order_by]
+            next_cursor = encode_cursor([rows[-1][i] for i in positions])
+        return {
+            "data": [list(row[:len(columns)]) for row in rows], "columns": columns,
+            "offset": offset, "page_size": page_size, "has_more": has_more,
+            "next_offset": offset + len(rows) if has_more and not cursor else None,
+            "next_cursor": next_cursor
+        }
+    except HTTPException as e:
+        raise e
+    except DatabaseError as de:
         raise HTTPException(status_code=500, detail=f"Preview failed: {str(de)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Preview failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Preview failed: {str(e)}")
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator
+
+POOL_MAX_SIZE = int(os.getenv("PIPEMAN_POOL_MAX_SIZE", "8"))
+POOL_IDLE_TIMEOUT = float(os.getenv("PIPEMAN_POOL_IDLE_TIMEOUT", "300"))
+POOL_HEALTH_CHECK_AFTER = float(os.getenv("PIPEMAN_POOL_HEALTH_CHECK_AFTER", "30"))
+POOL_CHECKOUT_TIMEOUT = float(os.getenv("PIPEMAN_POOL_CHECKOUT_TIMEOUT", "30"))
+# Clients per key that a single job never takes, so previews and table listings don't wait on it
+POOL_RESERVED_CLIENTS = int(os.getenv("PIPEMAN_POOL_RESERVED_CLIENTS", "2"))
+
+class PoolTimeout(Exception):
+    pass
+
+class _KeyPool:
+    def __init__(self):
+        self.idle = deque()  # (client, last_used), most recently used on the right
+        self.in_use = 0
+
+class ClientPool:
+    """
+    Process-wide pool of reusable clients keyed by connection parameters.
+
+    At most `max_size` clients (idle + checked out) exist per key; checkout blocks
+    for up to `checkout_timeout` seconds when a key is exhausted. Clients idle for
+    longer than `idle_timeout` are closed, and a client is only pinged on checkout
+    when it has been idle for more than `health_check_after` seconds. Clients that
+    raised one of `discard_on` while checked out are closed instead of returned.
+
+    `max_size` is the cap across all jobs and requests on a key. A single job
+    runs at most `job_capacity` concurrent clients, leaving `reserved` free.
+    """
+
+    def __init__(
+        self, factory: Callable[[Hashable], Any], max_size: int = POOL_MAX_SIZE,
+        idle_timeout: float = POOL_IDLE_TIMEOUT, health_check_after: float = POOL_HEALTH_CHECK_AFTER,
+        checkout_timeout: float = POOL_CHECKOUT_TIMEOUT, discard_on: tuple = (Exception,),
+        reserved: int = POOL_RESERVED_CLIENTS
+    ):
+        self.factory = factory
+        self.max_size = max_size
+        self.reserved = reserved
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+        self.discard_on = discard_on
+        self._pools: Dict[Hashable, _KeyPool] = {}
+        self._lock = threading.Condition()
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0, "health_check_failures": 0, "timeouts": 0}
+
+    @property
+    def job_capacity(self) -> int:
+        return max(1, self.max_size - self.reserved)
+
+    def checkout(self, key: Hashable) -> Any:
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._lock:
+            pool = self._pools.setdefault(key, _KeyPool())
+            while True:
+                self._evict_expired(pool)
+                if pool.idle:
+                    client, last_used = pool.idle.pop()
+                    pool.in_use += 1
+                    self._metrics["hits"] += 1
+                    break
+                if pool.in_use < self.max_size:
+                    client, last_used = None, None
+                    pool.in_use += 1
+                    self._metrics["misses"] += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeout(f"No free connection after {self.checkout_timeout}s")
+                self._lock.wait(remaining)
+
+        # Connecting and pinging happen outside the lock
+        try:
+            if client is not None and time.monotonic() - last_used > self.health_check_after:
+                if not client.ping():
+                    self._close(client)
+                    with self._lock:
+                        self._metrics["health_check_failures"] += 1
+                        self._metrics["evictions"] += 1
+                    client = None
+            if client is None:
+                client = self.factory(key)
+            return client
+        except BaseException:
+            self._release_slot(key)
+            raise
+
+    def checkin(self, key: Hashable, client: Any, discard: bool = False):
+        if discard:
+            self._close(client)
+            self._release_slot(key)
+            return
+        with self._lock:
+            pool = self._pools.setdefault(key, _KeyPool())
+            pool.in_use -= 1
+            pool.idle.append((client, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, key: Hashable) -> Iterator[Any]:
+        client = self.checkout(key)
+        try:
+            yield client
+        except BaseException as e:
+            # After a transport failure the connection state is unknown, so don't reuse it
+            self.checkin(key, client, discard=isinstance(e, self.discard_on))
+            raise
+        else:
+            self.checkin(key, client)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._metrics,
+                "in_use": sum(p.in_use for p in self._pools.values()),
+                "idle": sum(len(p.idle) for p in self._pools.values()),
+                "keys": len(self._pools),
+                "max_size": self.max_size
+            }
+
+    def clear(self):
+        with self._lock:
+            for pool in self._pools.values():
+                while pool.idle:
+                    self._close(pool.idle.popleft()[0])
+                    self._metrics["evictions"] += 1
+
+    def _evict_expired(self, pool: _KeyPool):
+        cutoff = time.monotonic() - self.idle_timeout
+        # Least recently used clients sit on the left
+        while pool.idle and pool.idle[0][1] < cutoff:
+            self._close(pool.idle.popleft()[0])
+            self._metrics["evictions"] += 1
+
+    def _release_slot(self, key: Hashable):
+        with self._lock:
+            self._pools[key].in_use -= 1
+            self._lock.notify()
+
+    @staticmethod
+    def _close(client: Any):
+        try:
+            client.close()
+        except Exception:
+            pass
@@ -0,0 +1,307 @@
+from fastapi import HTTPException
+import codecs
+import csv
+import io
+import json
+import mmap
+import os
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+from .job_service import JobProgress, submit_job
+
+INDEX_DIR = os.getenv("PIPEMAN_INDEX_DIR", os.path.join("Uploads", ".pipeman", "index"))
+ROW_INDEX_STRIDE = int(os.getenv("PIPEMAN_ROW_INDEX_STRIDE", "1000"))
+ROW_INDEX_CACHE_SIZE = 16
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+DETECT_SAMPLE_SIZE = 64 * 1024
+CANDIDATE_DELIMITERS = ",;\t|"
+INDEX_VERSION = 2
+
+class RowIndex(NamedTuple):
+    # offsets[i] is the byte offset of data row i * stride; data_start is the first data row
+    stride: int
+    offsets: np.ndarray
+    row_count: int
+    data_start: int
+    header: List[str]
+    delimiter: str
+    encoding: str
+    column_stats: Optional[List[dict]]
+
+_cache: "OrderedDict[tuple, RowIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+def _sidecar_paths(file_path: str) -> Tuple[str, str]:
+    name = os.path.basename(file_path)
+    return os.path.join(INDEX_DIR, f"{name}.json"), os.path.join(INDEX_DIR, f"{name}.offsets.npy")
+
+def detect_encoding(sample: bytes) -> str:
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        raise HTTPException(status_code=400, detail="UTF-16 CSV files are not supported")
+    try:
+        # A multi-byte character may be cut at the end of a full sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < DETECT_SAMPLE_SIZE)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+def detect_delimiter(text: str) -> str:
+    try:
+        return csv.Sniffer().sniff(text, delimiters=CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        return ","
+
+def build_row_index(
+    file_path: str, stride: int = ROW_INDEX_STRIDE, progress: Optional[JobProgress] = None
+) -> RowIndex:
+    """
+    Scan a CSV file once through mmap and record the byte offset of every
+    `stride`-th data row, with the detected encoding and delimiter. Newlines are
+    located with numpy; a newline only ends a row when the number of quotes
+    before it is even, so quoted newlines stay inside their field. As in the CSV
+    dialect, only quotes next to a field boundary or another quote count: a
+    stray one inside an unquoted field, like 12" pipe, is literal text. Blank
+    lines are not rows, matching the parser.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        sample = f.read(DETECT_SAMPLE_SIZE)
+        encoding = detect_encoding(sample)
+        f.seek(0)
+        header_line = f.readline()
+        while header_line.count(b'"') % 2:
+            line = f.readline()
+            if not line:
+                break
+            header_line += line
+        data_start = f.tell()
+    text = sample.decode(encoding, errors="replace")
+    delimiter = detect_delimiter(text)
+    header = next(csv.reader([header_line.decode(encoding, errors="replace").rstrip("\r\n")], delimiter=delimiter), [])
+
+    offsets = [data_start] if data_start < size else []
+    row_count = 1 if data_start < size else 0
+    if size > data_start:
+        boundaries = np.array([ord(delimiter), ord("\n"), ord("\r"), ord('"')], dtype=np.uint8)
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8)
+            parity = 0
+            position = data_start
+            while position < size:
+                end = min(position + SCAN_BLOCK_SIZE, size)
+                block = data[position:end]
+                quotes = np.zeros(block.size, dtype=np.uint8)
+                quote_positions = np.flatnonzero(block == ord('"')) + position
+                if quote_positions.size:
+                    opens = (quote_positions == data_start) | np.isin(data[np.maximum(quote_positions - 1, 0)], boundaries)
+                    closes = (quote_positions == size - 1) | \
+                        np.isin(data[np.minimum(quote_positions + 1, size - 1)], boundaries)
+                    quotes[quote_positions[opens | closes] - position] = 1
+                newlines = np.flatnonzero(block == ord("\n"))
+                if newlines.size:
+                    # uint8 wraps at 256, which keeps the parity intact
+                    quote_parity = (np.cumsum(quotes, dtype=np.uint8)[newlines] + parity) & 1
+                    row_starts = newlines[quote_parity == 0] + position + 1
+                    row_starts = row_starts[row_starts < size]
+                    row_starts = row_starts[~np.isin(data[row_starts], boundaries[1:3])]
+                    numbers = row_count + np.arange(row_starts.size)
+                    offsets.extend(row_starts[numbers % stride == 0].tolist())
+                    row_count += row_starts.size
+                parity = (parity + int(np.count_nonzero(quotes))) & 1
+                del block, quotes
+                if progress:
+                    progress.advance(bytes=end - position)
+                position = end
+            # Views into the mmap must be gone before it closes
+            del data
+    return RowIndex(stride, np.asarray(offsets, dtype=np.int64), row_count, data_start, header, delimiter, encoding, None)
+
+def save_row_index(file_path: str, index: RowIndex):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    meta_path, offsets_path = _sidecar_paths(file_path)
+    stat = os.stat(file_path)
+    with open(offsets_path + ".tmp", "wb") as f:
+        np.save(f, index.offsets)
+    os.replace(offsets_path + ".tmp", offsets_path)
+    meta = {
+        "version": INDEX_VERSION, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+        "stride": index.stride, "row_count": index.row_count, "data_start": index.data_start,
+        "header": index.header, "delimiter": index.delimiter, "encoding": index.encoding,
+        "column_stats": index.column_stats
+    }
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+def load_row_index(file_path: str) -> Optional[RowIndex]:
+    meta_path, offsets_path = _sidecar_paths(file_path)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        stat = os.stat(file_path)
+        if meta.get("version") != INDEX_VERSION or meta["mtime_ns"] != stat.st_mtime_ns \
+                or meta["size"] != stat.st_size:
+            return None
+        offsets = np.load(offsets_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return RowIndex(
+        meta["stride"], offsets, meta["row_count"], meta["data_start"], meta["header"],
+        meta["delimiter"], meta["encoding"], meta.get("column_stats")
+    )
+
+def index_csv_file(file_path: str, progress: Optional[JobProgress] = None) -> RowIndex:
+    """
+    Build and save the sidecar index for an uploaded CSV, including column
+    statistics from a sampled type inference.
+    """
+    from .type_inference import infer_clickhouse_types, sample_flatfile_text
+    index = build_row_index(file_path, progress=progress)
+    sample = sample_flatfile_text(file_path, index.delimiter, encoding=index.encoding)
+    index = index._replace(column_stats=infer_clickhouse_types(sample))
+    save_row_index(file_path, index)
+    _remember(file_path, index)
+    return index
+
+def _remember(file_path: str, index: RowIndex):
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        _cache[key] = index
+        while len(_cache) > ROW_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def find_row_index(file_path: str) -> Optional[RowIndex]:
+    # An up-to-date index from memory or the sidecar, without building one
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    index = load_row_index(file_path)
+    if index is not None:
+        _remember(file_path, index)
+    return index
+
+def get_row_index(file_path: str) -> RowIndex:
+    """
+    The file's row index, built and saved now if the upload-time job hasn't
+    finished or the file changed since.
+    """
+    return find_row_index(file_path) or index_csv_file(file_path)
+
+def submit_index_job(file_path: str) -> Optional[str]:
+    """
+    Index an uploaded CSV in the background so previews and ingestion find the
+    sidecar ready. Returns the job id, or None for other file types.
+    """
+    if not file_path.endswith(".csv"):
+        return None
+
+    def run(progress: JobProgress) -> dict:
+        progress.set_total(bytes=os.path.getsize(file_path))
+        index = index_csv_file(file_path, progress)
+        return {
+            "row_count": index.row_count, "delimiter": index.delimiter,
+            "encoding": index.encoding, "stride": index.stride
+        }
+
+    return submit_job("index", {"filename": os.path.basename(file_path)}, run)
+
+def remove_row_index(file_path: str):
+    for path in _sidecar_paths(file_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+class MappedCSVReader:
+    """
+    Random access to the rows of an indexed CSV through a read-only mmap. Reads
+    parse only the index blocks spanning the requested rows and project columns
+    by position. Instances are safe to share between threads.
+    """
+
+    def __init__(self, file_path: str, delimiter: Optional[str] = None):
+        self.index = get_row_index(file_path)
+        self.delimiter = delimiter or self.index.delimiter
+        self.header = self.index.header
+        if delimiter and delimiter != self.index.delimiter:
+            self.header = pd.read_csv(file_path, sep=delimiter, nrows=0, encoding=self.index.encoding) \
+                .columns.tolist()
+        self._file = open(file_path, "rb")
+        self._size = os.path.getsize(file_path)
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+
+    @property
+    def row_count(self) -> int:
+        return self.index.row_count
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def positions(self, columns: Optional[List[str]]) -> Optional[List[int]]:
+        if not columns:
+            return None
+        unknown = [col for col in columns if col not in self.header]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        return [self.header.index(col) for col in columns]
+
+    def byte_range(self, start: int, stop: int) -> Tuple[int, int]:
+        # Byte span of the index blocks covering rows [start, stop)
+        stride = self.index.stride
+        first = start // stride
+        last = -(-stop // stride)
+        begin = int(self.index.offsets[first])
+        end = int(self.index.offsets[last]) if last < len(self.index.offsets) else self._size
+        return begin, end
+
+    def read_rows(
+        self, start: int, stop: int, columns: Optional[List[str]] = None, dtype=None
+    ) -> pd.DataFrame:
+        stop = min(stop, self.row_count)
+        if start >= stop:
+            return pd.DataFrame(columns=columns or self.header)
+        begin, end = self.byte_range(start, stop)
+        first = start // self.index.stride * self.index.stride
+        expected = min(-(-stop // self.index.stride) * self.index.stride, self.row_count) - first
+        # The whole span is parsed, so rows the index scan miscounted can't go missing silently
+        df = pd.read_csv(
+            io.BytesIO(self._mm[begin:end]), sep=self.delimiter, header=None, names=self.header,
+            usecols=self.positions(columns), dtype=dtype, encoding=self.index.encoding
+        )
+        if len(df) != expected:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Rows {first}-{first + expected} of the file parse as {len(df)} rows; "
+                       f"check it for unbalanced quotes"
+            )
+        df = df.iloc[start - first:stop - first].reset_index(drop=True)
+        return df[columns] if columns else df
+
+    def row_ranges(self, chunk_rows: int) -> Iterator[Tuple[int, int]]:
+        """
+        Split the rows into ranges of about `chunk_rows`. Ranges are aligned to
+        index blocks so no rows have to be skipped, which rounds `chunk_rows`
+        down to a multiple of the index stride, and up to one stride at least.
+        """
+        stride = self.index.stride
+        chunk_rows = max(stride, chunk_rows // stride * stride)
+        for start in range(0, self.row_count, chunk_rows):
+            yield start, min(start + chunk_rows, self.row_count)
+
+    def raw_bytes(self, begin: int, end: int) -> bytes:
+        return self._mm[begin:end] if self._mm is not None else b""
@@ -0,0 +1,141 @@
+from fastapi import HTTPException
+import csv
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List, Optional
+from .job_service import JobProgress, stage_timer, timed_iter
+
+RAW_CHUNK_SIZE = 1024 * 1024
+
+def write_export_file(
+    client, query: str, columns: List[str], output_path: str, output_format: str = "csv",
+    delimiter: str = ",", row_group_size: Optional[int] = None, compression: Optional[str] = None,
+    compression_level: Optional[int] = None, progress: Optional[JobProgress] = None,
+    settings: Optional[dict] = None
+) -> int:
+    """
+    Write the result of `query` to `output_path` in the requested format and
+    return the number of rows written. `settings` are ClickHouse query settings.
+    """
+    if output_format == "csv":
+        with open(output_path, "w", newline="") as f:
+            return write_rows_as_csv(client, query, columns, f, delimiter, progress, settings)
+    if output_format in ("parquet", "arrow"):
+        return write_arrow_file(
+            client, query, output_path, output_format, row_group_size, compression, compression_level,
+            progress, settings
+        )
+    if output_format == "native":
+        return write_native_file(client, query, output_path, progress, settings)
+    raise HTTPException(status_code=400, detail=f"Unsupported output format: {output_format}")
+
+def write_rows_as_csv(
+    client, query: str, columns: List[str], f, delimiter: str, progress: Optional[JobProgress] = None,
+    settings: Optional[dict] = None
+) -> int:
+    """
+    Stream the result of `query` into the open text file `f` block by block,
+    so memory stays bounded by one ClickHouse block rather than the whole table.
+    """
+    writer = csv.writer(f, delimiter=delimiter)
+    writer.writerow(columns)
+    total_rows = 0
+    position = f.tell()
+    with client.query_row_block_stream(query, settings=settings) as stream:
+        for block in timed_iter(stream, "fetch", progress):
+            with stage_timer("file_write", progress):
+                writer.writerows(block)
+            total_rows += len(block)
+            if progress:
+                progress.advance(rows=len(block), bytes=f.tell() - position)
+                position = f.tell()
+    return total_rows
+
+def write_arrow_file(
+    client, query: str, output_path: str, output_format: str, row_group_size: Optional[int] = None,
+    compression: Optional[str] = None, compression_level: Optional[int] = None,
+    progress: Optional[JobProgress] = None, settings: Optional[dict] = None
+) -> int:
+    """
+    Fetch `query` as an Arrow stream and write the record batches to a Parquet or
+    Arrow IPC file without converting values to Python objects. Parquet batches
+    are buffered up to `row_group_size` rows so row groups are not limited to the
+    ClickHouse block size.
+    """
+    total_rows = 0
+    pending: List[pa.RecordBatch] = []
+    pending_rows = 0
+    writer = None
+    with client.query_arrow_stream(query, settings=settings) as stream:
+        try:
+            for batch in timed_iter(stream, "fetch", progress):
+                if writer is None:
+                    writer = _open_arrow_writer(
+                        output_path, output_format, batch.schema, compression, compression_level
+                    )
+                if output_format == "arrow" or row_group_size is None:
+                    with stage_timer("file_write", progress):
+                        writer.write_batch(batch)
+                else:
+                    pending.append(batch)
+                    pending_rows += batch.num_rows
+                    if pending_rows >= row_group_size:
+                        # Write whole row groups and carry the remainder into the next one
+                        table = pa.Table.from_batches(pending)
+                        full_rows = pending_rows - pending_rows % row_group_size
+                        with stage_timer("file_write", progress):
+                            writer.write_table(table.slice(0, full_rows), row_group_size=row_group_size)
+                        pending = table.slice(full_rows).to_batches()
+                        pending_rows -= full_rows
+                total_rows += batch.num_rows
+                if progress:
+                    progress.advance(rows=batch.num_rows, bytes=batch.nbytes)
+            if writer is None:
+                # Empty result: still write a valid file carrying the schema
+                writer = _open_arrow_writer(
+                    output_path, output_format, stream.gen.schema, compression, compression_level
+                )
+            if pending:
+                writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_size)
+        finally:
+            if writer is not None:
+                writer.close()
+    return total_rows
+
+def _open_arrow_writer(
+    output_path: str, output_format: str, schema: pa.Schema,
+    compression: Optional[str], compression_level: Optional[int]
+):
+    if output_format == "parquet":
+        return pq.ParquetWriter(
+            output_path, schema, compression=compression or "snappy", compression_level=compression_level
+        )
+    options = None
+    if compression and compression != "none":
+        options = pa.ipc.IpcWriteOptions(compression=pa.Codec(compression, compression_level))
+    return pa.ipc.new_file(output_path, schema, options=options)
+
+def write_native_file(
+    client, query: str, output_path: str, progress: Optional[JobProgress] = None,
+    settings: Optional[dict] = None
+) -> int:
+    """
+    Copy ClickHouse Native output to disk byte for byte. The stream carries no
+    row count the client can read, so rows are counted with a separate query.
+    """
+    with stage_timer("query", progress):
+        total_rows = int(client.command(f"SELECT count() FROM ({query})", settings=settings))
+    response = client.raw_stream(query, fmt="Native", settings=settings)
+    try:
+        with open(output_path, "wb") as f:
+            chunks = timed_iter(iter(lambda: response.read(RAW_CHUNK_SIZE), b""), "fetch", progress)
+            for chunk in chunks:
+                with stage_timer("file_write", progress):
+                    f.write(chunk)
+                if progress:
+                    progress.advance(bytes=len(chunk))
+    finally:
+        response.close()
+    if progress:
+        progress.advance(rows=total_rows)
+    return total_rows
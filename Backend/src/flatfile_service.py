@@ -1,9 +1,40 @@
 from fastapi import HTTPException, UploadFile
 import pandas as pd
+import codecs
+import csv
+import io
+import openpyxl
 import os
+import random
 import re
-from typing import List, Optional
-from .utils import map_pandas_to_clickhouse_types
+import shutil
+import time
+from typing import Dict, Iterator, List, Optional
+import pyarrow as pa
+from .utils import map_arrow_to_clickhouse_types
+from .type_inference import (
+    INFERENCE_HEAD_ROWS, INFERENCE_RANDOM_ROWS, apply_type_overrides, convert_chunk_to_clickhouse_types,
+    infer_clickhouse_types, random_csv_lines, sample_flatfile_text
+)
+from .csv_index import DETECT_SAMPLE_SIZE, MappedCSVReader, detect_encoding, find_row_index
+from .arrow_readers import (
+    COMPRESSED_CSV_EXTENSIONS, arrow_null_columns, conform_to_clickhouse_types, count_arrow_rows, is_arrow_format,
+    iter_arrow_batches, read_arrow_page, read_arrow_schema
+)
+from .insert_pipeline import run_insert_pipeline
+from .models import TableSpec
+from .table_spec import (
+    arrow_column_stats, build_create_table_sql, resolve_order_by, sort_arrow_table, sort_columns, sort_frame
+)
+from .metadata_cache import metadata_cache
+from .job_service import JobProgress, stage_timer, timed_iter
+from .metrics import BATCH_INSERT_SECONDS, BATCH_ROWS
+from .ingest_manifest import (
+    DEDUPLICATION_WINDOW, begin_load, complete_load, dedup_token, file_sha256, record_chunk, reset_load
+)
+
+PANDAS_EXTENSIONS = (".csv", ".xlsx", ".xls")
+STREAM_BUFFER_SIZE = 64 * 1024
 
 def save_uploaded_file(file: UploadFile, upload_dir: str = "Uploads") -> str:
     try:
@@ -12,11 +43,37 @@ def save_uploaded_file(file: UploadFile, upload_dir: str = "Uploads") -> str:
         if not re.match(r"^[a-zA-Z0-9_\-\.]+$", file.filename):
             raise HTTPException(status_code=400, detail="Invalid filename")
         with open(file_path, "wb") as f:
-            f.write(file.file.read())
+            shutil.copyfileobj(file.file, f, STREAM_BUFFER_SIZE)
+        metadata_cache.invalidate(("flatfile", file.filename))
         return file_path
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
+def get_flatfile_index(filename: str) -> dict:
+    file_path = os.path.join("Uploads", filename)
+    if not re.match(r"^[a-zA-Z0-9_\-\.]+$", filename):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not filename.endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Only CSV files are indexed")
+    index = find_row_index(file_path)
+    if index is None:
+        raise HTTPException(status_code=404, detail="File is not indexed yet")
+    return {
+        "filename": filename, "row_count": index.row_count, "stride": index.stride,
+        "header": index.header, "delimiter": index.delimiter, "encoding": index.encoding,
+        "column_stats": index.column_stats
+    }
+
+def check_flatfile_type(filename: str, delimiter: Optional[str]):
+    if filename.endswith((".csv",) + tuple(COMPRESSED_CSV_EXTENSIONS)) and not delimiter:
+        raise HTTPException(status_code=400, detail="Delimiter required for CSV")
+    if not filename.endswith(PANDAS_EXTENSIONS) and not is_arrow_format(filename):
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+
 def test_flatfile_config(filename: str, delimiter: str = None) -> dict:
     if not filename:
         raise HTTPException(status_code=400, detail="Filename required")
@@ -24,33 +81,187 @@ def test_flatfile_config(filename: str, delimiter: str = None) -> dict:
         raise HTTPException(status_code=400, detail="Delimiter must be a single character")
     return {"status": "File configuration validated"}
 
-def get_flatfile_schema(filename: str, delimiter: str = None) -> List[str]:
+def get_flatfile_column_types(
+    filename: str, delimiter: str = None,
+    head_rows: int = INFERENCE_HEAD_ROWS, random_rows: int = INFERENCE_RANDOM_ROWS
+) -> List[dict]:
     try:
         file_path = os.path.join("Uploads", filename)
         if not re.match(r"^[a-zA-Z0-9_\-\.]+$", filename):
             raise HTTPException(status_code=400, detail="Invalid filename")
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
+        check_flatfile_type(filename, delimiter)
         
-        if filename.endswith((".xlsx", ".xls")):
-            df = pd.read_excel(file_path, nrows=1)
-        elif filename.endswith(".csv"):
-            if not delimiter:
-                raise HTTPException(status_code=400, detail="Delimiter required for CSV")
-            df = pd.read_csv(file_path, sep=delimiter, nrows=1)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+        def load_column_types() -> List[dict]:
+            if is_arrow_format(filename):
+                schema = read_arrow_schema(file_path, delimiter)
+                column_types = map_arrow_to_clickhouse_types(schema, arrow_null_columns(file_path, delimiter))
+                return [{"name": name, "type": col_type} for name, col_type in zip(schema.names, column_types)]
+            encoding = None
+            if filename.endswith(".csv"):
+                index = find_row_index(file_path)
+                if index is None:
+                    with open(file_path, "rb") as f:
+                        encoding = detect_encoding(f.read(DETECT_SAMPLE_SIZE))
+                else:
+                    encoding = index.encoding
+                # The upload-time index already sampled the file with the default sizes
+                if index and index.column_stats and index.delimiter == delimiter \
+                        and (head_rows, random_rows) == (INFERENCE_HEAD_ROWS, INFERENCE_RANDOM_ROWS):
+                    return index.column_stats
+            return infer_clickhouse_types(
+                sample_flatfile_text(file_path, delimiter, None, head_rows, random_rows, encoding=encoding)
+            )
         
-        return df.columns.tolist()
+        # mtime and size in the key make a re-uploaded file miss the cache
+        stat = os.stat(file_path)
+        key = ("flatfile", filename, stat.st_mtime_ns, stat.st_size, delimiter, head_rows, random_rows)
+        return metadata_cache.get_or_load(key, load_column_types)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Flat file schema fetch failed: {str(e)}")
 
+def get_flatfile_schema(filename: str, delimiter: str = None) -> List[str]:
+    return [c["name"] for c in get_flatfile_column_types(filename, delimiter)]
+
+def iter_flatfile_chunks(
+    file_path: str, delimiter: str, columns: Optional[List[str]],
+    chunk_size: int, column_types: List[str], progress: Optional[JobProgress] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield the file as DataFrames of at most `chunk_size` rows, read as text and
+    converted to the ClickHouse column types. Excel has no chunked reader, so
+    workbooks are loaded once and sliced.
+    """
+    with open(file_path, "rb") as f:
+        if file_path.endswith((".xlsx", ".xls")):
+            df = pd.read_excel(f, usecols=columns, dtype=str)
+            chunks = (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+        else:
+            chunks = pd.read_csv(f, sep=delimiter, usecols=columns, chunksize=chunk_size, dtype=str)
+        position = 0
+        for chunk in timed_iter(chunks, "parse", progress):
+            if progress:
+                # The parser reads ahead in buffers, so this is approximate
+                progress.advance(bytes=f.tell() - position)
+                position = f.tell()
+            if columns:
+                chunk = chunk[columns]
+            with stage_timer("type_mapping", progress):
+                chunk = convert_chunk_to_clickhouse_types(chunk, column_types)
+            yield chunk
+
+def resolve_flatfile_columns(
+    filename: str, delimiter: str, columns: Optional[List[str]], sample_rows: int,
+    overrides: Optional[Dict[str, str]], table_spec: Optional[TableSpec]
+) -> tuple:
+    """
+    Column names and ClickHouse types for loading a flat file, plus the sort
+    key of the table to create. Returns (column_names, column_types, order_by).
+    """
+    file_path = os.path.join("Uploads", filename)
+    if is_arrow_format(filename):
+        # Columnar sources carry their own schema; batches go to ClickHouse as Arrow
+        schema = read_arrow_schema(file_path, delimiter)
+        if columns:
+            unknown = [col for col in columns if col not in schema.names]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+            schema = pa.schema([schema.field(col) for col in columns])
+        column_names = schema.names
+        mapped = map_arrow_to_clickhouse_types(schema, arrow_null_columns(file_path, delimiter))
+        column_types = [
+            c["type"] for c in apply_type_overrides(
+                [{"name": n, "type": t} for n, t in zip(column_names, mapped)], overrides
+            )
+        ]
+        column_stats = []
+        if table_spec and table_spec.suggest_order_by and not table_spec.order_by:
+            first = next(iter_arrow_batches(file_path, delimiter, columns, sample_rows), None)
+            column_stats = arrow_column_stats(first, column_types) if first is not None else []
+        return column_names, column_types, resolve_order_by(table_spec, column_stats)
+    # Infer types from a sample so the table schema stays stable across chunks
+    inferred = get_flatfile_column_types(filename, delimiter, head_rows=sample_rows)
+    if columns:
+        by_name = {c["name"]: c for c in inferred}
+        unknown = [col for col in columns if col not in by_name]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        inferred = [by_name[col] for col in columns]
+    inferred = apply_type_overrides(inferred, overrides)
+    return [c["name"] for c in inferred], [c["type"] for c in inferred], resolve_order_by(table_spec, inferred)
+
+def create_ingest_table(
+    host: str, port: str, database: str, user: str, table: str, column_names: List[str],
+    column_types: List[str], table_spec: Optional[TableSpec], order_by: Optional[List[str]], idempotent: bool = False
+):
+    from .clickhouse_service import clickhouse_client, invalidate_clickhouse_table
+    engine = (table_spec.engine if table_spec else None) or "MergeTree"
+    settings = None
+    if idempotent:
+        if not engine.endswith("MergeTree"):
+            raise HTTPException(status_code=400, detail=f"Idempotent loads need a MergeTree engine, not {engine}")
+        if not engine.startswith("Replicated"):
+            # Plain MergeTree tables only honour dedup tokens inside this window
+            settings = {"non_replicated_deduplication_window": DEDUPLICATION_WINDOW}
+    create_table = build_create_table_sql(table, column_names, column_types, table_spec, order_by, settings)
+    try:
+        with clickhouse_client(host, port, database, user) as client:
+            client.command(create_table)
+            if idempotent:
+                ensure_deduplication_window(client, table)
+        invalidate_clickhouse_table(host, port, database, user, table)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create table: {str(e)}")
+
+def ensure_deduplication_window(client, table: str):
+    """
+    Make an existing target table honour dedup tokens for idempotent loads.
+    The window of a plain MergeTree table is raised to DEDUPLICATION_WINDOW
+    but never lowered; replicated tables deduplicate by default.
+    """
+    rows = client.query(
+        "SELECT engine, create_table_query FROM system.tables WHERE database = currentDatabase() AND name = {table:String}",
+        parameters={"table": table}
+    ).result_rows
+    if not rows or rows[0][0].startswith("Replicated"):
+        return
+    engine, create_query = rows[0]
+    if not engine.endswith("MergeTree"):
+        raise HTTPException(
+            status_code=400, detail=f"Idempotent loads need a MergeTree table; {table} uses {engine}"
+        )
+    current = re.search(r"non_replicated_deduplication_window\s*=\s*(\d+)", create_query)
+    if current and int(current.group(1)) >= DEDUPLICATION_WINDOW:
+        return
+    try:
+        client.command(
+            f"ALTER TABLE {table} MODIFY SETTING non_replicated_deduplication_window = {DEDUPLICATION_WINDOW}"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to enable insert deduplication on {table}: {str(e)}")
+
 def ingest_flatfile_to_clickhouse(
     filename: str, delimiter: str, host: str, port: str, database: str,
-    user: str, table: str, columns: List[str]
-) -> int:
+    user: str, table: str, columns: List[str],
+    batch_size: int = 10000, sample_rows: int = 10000, parallelism: int = 1,
+    column_types: Optional[Dict[str, str]] = None, table_spec: Optional[TableSpec] = None,
+    idempotent: bool = False, reset_manifest: bool = False, progress: Optional[JobProgress] = None
+) -> dict:
+    """
+    Load a flat file into a table, creating it from the file's schema. An
+    idempotent load gives every batch a dedup token derived from the file hash
+    and the batch's position and records committed batches in the local
+    manifest, so a rerun after a failure only inserts what is missing.
+    Uncompressed CSV batches follow the row index, so `batch_size` is rounded
+    to a multiple of its stride (ROW_INDEX_STRIDE rows).
+    """
     try:
-        from .clickhouse_service import get_clickhouse_client
+        from .clickhouse_service import _connection_key, client_pool, clickhouse_client
         file_path = os.path.join("Uploads", filename)
         if not re.match(r"^[a-zA-Z0-9_\-\.]+$", filename):
             raise HTTPException(status_code=400, detail="Invalid filename")
@@ -59,70 +270,252 @@ def ingest_flatfile_to_clickhouse(
         if not re.match(r"^[a-zA-Z0-9_]+$", table):
             raise HTTPException(status_code=400, detail="Invalid table name")
         
-        # Read data
-        if filename.endswith((".xlsx", ".xls")):
-            df = pd.read_excel(file_path, usecols=columns)
-        elif filename.endswith(".csv"):
-            if not delimiter:
-                raise HTTPException(status_code=400, detail="Delimiter required for CSV")
-            df = pd.read_csv(file_path, sep=delimiter, usecols=columns)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
-        
-        if columns:
-            df = df[columns]
-        
-        # Map pandas dtypes to ClickHouse types
-        column_types = map_pandas_to_clickhouse_types(df.dtypes)
-        column_defs = ", ".join([f"`{col}` {col_type}" for col, col_type in zip(df.columns, column_types)])
+        check_flatfile_type(filename, delimiter)
+        overrides = column_types
+        reader = None
+        committed = set()
+        if idempotent:
+            connection = "|".join(_connection_key(host, port, database, user)[:4])
+            with stage_timer("hash", progress):
+                file_hash = file_sha256(file_path)
+            if reset_manifest:
+                reset_load(connection, table, file_hash)
+            load = begin_load(connection, table, file_hash, filename, batch_size, columns or [])
+            batch_size = load["batch_size"]
+            committed = load["committed"]
         
-        # Create table
-        client = get_clickhouse_client(host, port, database, user)
-        try:
-            client.command(f"""
-                CREATE TABLE IF NOT EXISTS {table} ({column_defs})
-                ENGINE = MergeTree() ORDER BY tuple()
-            """)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to create table: {str(e)}")
+        column_names, column_types, order_by = resolve_flatfile_columns(
+            filename, delimiter, columns, sample_rows, overrides, table_spec
+        )
+        presort = sort_columns(order_by, column_names)
+        if is_arrow_format(filename):
+            batches = timed_iter(
+                iter_arrow_batches(file_path, delimiter, columns, batch_size, progress), "parse", progress
+            )
+            
+            def insert_batch(worker_client, batch: pa.Table, settings: Optional[dict] = None) -> int:
+                with stage_timer("sort", progress):
+                    batch = sort_arrow_table(batch, presort)
+                with stage_timer("type_mapping", progress):
+                    batch = conform_to_clickhouse_types(batch, column_types)
+                with stage_timer("insert", progress), BATCH_INSERT_SECONDS.time():
+                    worker_client.insert_arrow(table, batch, settings=settings)
+                BATCH_ROWS.observe(batch.num_rows)
+                if progress:
+                    progress.advance(rows=batch.num_rows)
+                return batch.num_rows
+        else:
+            if filename.endswith(".csv"):
+                # Batches are row ranges of the mmap-backed index, parsed by the insert
+                # workers themselves so parsing runs in parallel too
+                reader = MappedCSVReader(file_path, delimiter)
+                batches = reader.row_ranges(batch_size)
+            else:
+                batches = iter_flatfile_chunks(file_path, delimiter, columns, batch_size, column_types, progress)
+            
+            def insert_batch(worker_client, chunk, settings: Optional[dict] = None) -> int:
+                if reader is not None:
+                    start, stop = chunk
+                    if progress:
+                        begin, end = reader.byte_range(start, stop)
+                        progress.advance(bytes=end - begin)
+                    with stage_timer("parse", progress):
+                        chunk = reader.read_rows(start, stop, column_names, dtype=str)
+                    with stage_timer("type_mapping", progress):
+                        chunk = convert_chunk_to_clickhouse_types(chunk, column_types)
+                # Parts arrive sorted by the key, so merges don't have to re-sort them
+                with stage_timer("sort", progress):
+                    chunk = sort_frame(chunk, presort)
+                with stage_timer("insert", progress), BATCH_INSERT_SECONDS.time():
+                    worker_client.insert_df(table=table, df=chunk, settings=settings)
+                BATCH_ROWS.observe(len(chunk))
+                if progress:
+                    progress.advance(rows=len(chunk))
+                return len(chunk)
+        create_ingest_table(
+            host, port, database, user, table, column_names, column_types, table_spec, order_by, idempotent
+        )
         
-        # Insert data in batches
-        batch_size = 10000
-        total_rows = 0
+        if progress:
+            if is_arrow_format(filename):
+                total_rows = count_arrow_rows(file_path)
+            else:
+                total_rows = reader.row_count if reader is not None else None
+            progress.set_total(rows=total_rows, bytes=os.path.getsize(file_path))
+        if idempotent:
+            # CSV batches are row ranges, so committed ones are skipped without being read
+            keyed = (
+                (f"rows-{batch[0]}-{batch[1]}" if reader is not None else f"batch-{n}", batch)
+                for n, batch in enumerate(batches)
+            )
+            batches = (item for item in keyed if item[0] not in committed)
+            insert_chunk = insert_batch
+
+            def insert_batch(worker_client, item) -> int:
+                key, batch = item
+                settings = {"insert_deduplication_token": dedup_token(file_hash, table, key)}
+                rows = insert_chunk(worker_client, batch, settings)
+                record_chunk(connection, table, file_hash, key, rows)
+                return rows
+            if progress:
+                progress.update(skipped_batches=len(committed))
+        started = time.monotonic()
         try:
-            for start in range(0, len(df), batch_size):
-                batch = df.iloc[start:start + batch_size]
-                client.insert_df(table=table, df=batch)
-                total_rows += len(batch)
+            # Parse ahead of the inserts while worker clients upload batches in parallel
+            total_rows = run_insert_pipeline(
+                batches,
+                lambda: clickhouse_client(host, port, database, user),
+                insert_batch,
+                # Workers check clients out per batch and leave the pool's reserve to other requests
+                parallelism=min(parallelism, client_pool.job_capacity)
+            )
+        except HTTPException as e:
+            raise e
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to insert data: {str(e)}")
+        finally:
+            if reader is not None:
+                reader.close()
+        elapsed = max(time.monotonic() - started, 1e-9)
+        if idempotent:
+            complete_load(connection, table, file_hash)
         
-        return total_rows
+        return {
+            "record_count": total_rows,
+            "skipped_batches": len(committed),
+            "order_by": order_by,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(total_rows / elapsed, 1),
+            "mb_per_second": round(os.path.getsize(file_path) / elapsed / (1024 * 1024), 2)
+        }
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
 
-def preview_flatfile_data(filename: str, delimiter: str, columns: List[str]) -> dict:
+def stream_flatfile_csv(filename: str, delimiter: str, columns: List[str]) -> Iterator[bytes]:
+    """
+    Validate the header eagerly, then return a generator that re-encodes the
+    selected columns in buffers of about STREAM_BUFFER_SIZE bytes. A UTF-8 file
+    downloaded with all its columns is copied without parsing.
+    """
+    file_path = os.path.join("Uploads", filename)
+    if not re.match(r"^[a-zA-Z0-9_\-\.]+$", filename):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    with open(file_path, "rb") as f:
+        encoding = detect_encoding(f.read(DETECT_SAMPLE_SIZE))
+    with open(file_path, "r", newline="", encoding=encoding) as source_file:
+        header = next(csv.reader(source_file, delimiter=delimiter), [])
+    unknown = [col for col in columns if col not in header]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+    # Project by position instead of building a dict per row
+    indexes = [header.index(col) for col in columns]
+
+    def copy_file() -> Iterator[bytes]:
+        # All columns in file order: the UTF-8 bytes go out as they are
+        with open(file_path, "rb") as source_file:
+            if encoding == "utf-8-sig":
+                source_file.seek(len(codecs.BOM_UTF8))
+            yield from iter(lambda: source_file.read(STREAM_BUFFER_SIZE), b"")
+
+    def generate() -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=delimiter)
+        writer.writerow(columns)
+        with open(file_path, "r", newline="", encoding=encoding) as source_file:
+            reader = csv.reader(source_file, delimiter=delimiter)
+            next(reader, None)
+            for row in reader:
+                writer.writerow([row[i] if i < len(row) else "" for i in indexes])
+                if buffer.tell() >= STREAM_BUFFER_SIZE:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+
+    if indexes == list(range(len(header))) and encoding in ("utf-8", "utf-8-sig"):
+        return copy_file()
+    return generate()
+
+def preview_flatfile_data(
+    filename: str, delimiter: str, columns: List[str],
+    page_size: int = 100, offset: int = 0, sample: Optional[float] = None
+) -> dict:
+    """
+    One page of a flat file. CSV pages are read through the mmap-backed row index and
+    Parquet/Arrow pages through file metadata, so deep pages cost the same as the
+    first; xlsx rows are streamed read-only. `sample` returns randomly picked CSV
+    rows instead of a page.
+    """
     try:
         file_path = os.path.join("Uploads", filename)
         if not re.match(r"^[a-zA-Z0-9_\-\.]+$", filename):
             raise HTTPException(status_code=400, detail="Invalid filename")
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
+        check_flatfile_type(filename, delimiter)
+        if sample and not filename.endswith(".csv"):
+            raise HTTPException(status_code=400, detail="Sampled previews of flat files are only supported for CSV")
         
-        if filename.endswith((".xlsx", ".xls")):
-            df = pd.read_excel(file_path, usecols=columns, nrows=100)
-        elif filename.endswith(".csv"):
-            if not delimiter:
-                raise HTTPException(status_code=400, detail="Delimiter required for CSV")
-            df = pd.read_csv(file_path, sep=delimiter, usecols=columns, nrows=100)
+        total_rows = None
+        if is_arrow_format(filename):
+            page, total_rows = read_arrow_page(file_path, delimiter, columns or None, offset, page_size)
+            names = page.column_names
+            rows = [list(row.values()) for row in page.to_pylist()]
+        elif filename.endswith(".xlsx"):
+            names, rows, total_rows = read_xlsx_page(file_path, columns, offset, page_size)
         else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
-        
-        if columns:
-            df = df[columns]
+            if filename.endswith(".xls"):
+                df = pd.read_excel(file_path, usecols=columns or None, skiprows=range(1, offset + 1), nrows=page_size)
+            elif sample:
+                with open(file_path, "rb") as f:
+                    encoding = detect_encoding(f.read(DETECT_SAMPLE_SIZE))
+                header = pd.read_csv(file_path, sep=delimiter, nrows=0, encoding=encoding).columns
+                lines = random_csv_lines(file_path, delimiter, len(header), page_size, random.randrange(2**32))
+                df = pd.read_csv(io.BytesIO(b"".join(lines)), sep=delimiter, header=None, names=header, encoding=encoding) \
+                    if lines else pd.DataFrame(columns=header)
+            else:
+                with MappedCSVReader(file_path, delimiter) as reader:
+                    total_rows = reader.row_count
+                    df = reader.read_rows(offset, offset + page_size, columns or None)
+            if columns:
+                df = df[columns]
+            names = df.columns.tolist()
+            rows = df.astype(object).where(df.notna(), None).values.tolist()
         
-        return {"data": df.values.tolist(), "columns": df.columns.tolist()}
+        has_more = not sample and (
+            offset + len(rows) < total_rows if total_rows is not None else len(rows) == page_size
+        )
+        return {
+            "data": rows, "columns": names, "offset": offset, "page_size": page_size,
+            "total_rows": total_rows, "has_more": has_more,
+            "next_offset": offset + len(rows) if has_more else None
+        }
+    except HTTPException as e:
+        raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Preview failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Preview failed: {str(e)}")
+
+def read_xlsx_page(file_path: str, columns: List[str], offset: int, limit: int) -> tuple:
+    # Read-only mode streams the sheet XML instead of loading the whole workbook
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        header = [str(v) for v in next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())]
+        rows = [
+            list(row) for row in
+            sheet.iter_rows(min_row=offset + 2, max_row=offset + limit + 1, values_only=True)
+        ]
+        total_rows = sheet.max_row - 1 if sheet.max_row else None
+    finally:
+        workbook.close()
+    if columns:
+        unknown = [c for c in columns if c not in header]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        positions = [header.index(c) for c in columns]
+        return columns, [[row[i] for i in positions] for row in rows], total_rows
+    return header, rows, total_rows
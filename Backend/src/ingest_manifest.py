@@ -0,0 +1,124 @@
+from fastapi import HTTPException
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set
+from .state_store import ensure_schema, state_db
+
+DEDUPLICATION_WINDOW = int(os.getenv("PIPEMAN_DEDUPLICATION_WINDOW", "10000"))
+HASH_BUFFER_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_loads (
+    connection TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    batch_size INTEGER NOT NULL,
+    columns TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (connection, table_name, file_hash)
+);
+CREATE TABLE IF NOT EXISTS ingest_chunks (
+    connection TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    chunk_key TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    committed_at REAL NOT NULL,
+    PRIMARY KEY (connection, table_name, file_hash, chunk_key)
+);
+"""
+
+_hashes: Dict[tuple, str] = {}
+_lock = threading.Lock()
+
+def init_manifest():
+    ensure_schema(_SCHEMA)
+
+def file_sha256(file_path: str) -> str:
+    """
+    Content hash of a file, remembered per (path, mtime, size) so reruns of an
+    unchanged file don't read it twice.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if key in _hashes:
+            return _hashes[key]
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+            hasher.update(block)
+    with _lock:
+        _hashes[key] = hasher.hexdigest()
+    return _hashes[key]
+
+def dedup_token(file_hash: str, table: str, chunk_key: str) -> str:
+    return f"pipeman-{file_hash}-{table}-{chunk_key}"
+
+def begin_load(
+    connection: str, table: str, file_hash: str, filename: str, batch_size: int, columns: List[str]
+) -> dict:
+    """
+    Start or resume the load of a file into a table. A resumed load keeps its
+    original batch size, so its chunks and their dedup tokens line up with the
+    ones already committed. Returns the load's batch size and the committed
+    chunk keys.
+    """
+    with state_db() as conn:
+        row = conn.execute(
+            "SELECT * FROM ingest_loads WHERE connection = ? AND table_name = ? AND file_hash = ?",
+            (connection, table, file_hash)
+        ).fetchone()
+        if row is not None and json.loads(row["columns"]) != columns:
+            raise HTTPException(
+                status_code=409,
+                detail=f"{row['filename']} was already loaded into {table} with different columns; "
+                       f"reset the manifest to load it again"
+            )
+        if row is not None:
+            batch_size = row["batch_size"]
+        conn.execute(
+            "INSERT INTO ingest_loads (connection, table_name, file_hash, filename, batch_size, columns, status, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?, 'running', ?) "
+            "ON CONFLICT (connection, table_name, file_hash) DO UPDATE SET filename = excluded.filename, "
+            "status = 'running', updated_at = excluded.updated_at",
+            (connection, table, file_hash, filename, batch_size, json.dumps(columns), time.time())
+        )
+    return {"batch_size": batch_size, "committed": committed_chunks(connection, table, file_hash)}
+
+def committed_chunks(connection: str, table: str, file_hash: str) -> Set[str]:
+    with state_db() as conn:
+        rows = conn.execute(
+            "SELECT chunk_key FROM ingest_chunks WHERE connection = ? AND table_name = ? AND file_hash = ?",
+            (connection, table, file_hash)
+        ).fetchall()
+    return {row["chunk_key"] for row in rows}
+
+def record_chunk(connection: str, table: str, file_hash: str, chunk_key: str, rows: int):
+    with state_db() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO ingest_chunks (connection, table_name, file_hash, chunk_key, rows, committed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (connection, table, file_hash, chunk_key, rows, time.time())
+        )
+
+def complete_load(connection: str, table: str, file_hash: str):
+    with state_db() as conn:
+        conn.execute(
+            "UPDATE ingest_loads SET status = 'completed', updated_at = ? "
+            "WHERE connection = ? AND table_name = ? AND file_hash = ?",
+            (time.time(), connection, table, file_hash)
+        )
+
+def reset_load(connection: str, table: str, file_hash: Optional[str] = None):
+    # Forget committed chunks, e.g. after the target table was truncated
+    condition = "connection = ? AND table_name = ?" + (" AND file_hash = ?" if file_hash else "")
+    params = (connection, table, file_hash) if file_hash else (connection, table)
+    with state_db() as conn:
+        conn.execute(f"DELETE FROM ingest_chunks WHERE {condition}", params)
+        conn.execute(f"DELETE FROM ingest_loads WHERE {condition}", params)
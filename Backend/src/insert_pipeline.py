@@ -0,0 +1,64 @@
+import queue
+import threading
+from typing import Any, Callable, ContextManager, Iterable, List
+
+_DONE = object()
+
+def run_insert_pipeline(
+    batches: Iterable[Any],
+    connect: Callable[[], ContextManager[Any]],
+    insert_batch: Callable[[Any, Any], int],
+    parallelism: int = 1,
+    queue_size: int = None
+) -> int:
+    """
+    Parse batches in the calling thread while `parallelism` worker threads insert
+    them. Workers take a client from `connect()` for each batch rather than for
+    the whole run, so a long load shares a pooled connection with other requests.
+    The bounded queue lets parsing run ahead of the inserts by at most
+    `queue_size` batches. Returns the number of rows inserted and re-raises the
+    first worker error.
+    """
+    parallelism = max(1, parallelism)
+    pending = queue.Queue(maxsize=queue_size or parallelism * 2)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    counts = [0] * parallelism
+
+    def worker(index: int):
+        try:
+            while True:
+                batch = pending.get()
+                if batch is _DONE:
+                    return
+                if stop.is_set():
+                    continue
+                with connect() as client:
+                    counts[index] += insert_batch(client, batch)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+            # Keep draining so the producer never blocks on a full queue
+            while pending.get() is not _DONE:
+                pass
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(parallelism)]
+    for t in workers:
+        t.start()
+    try:
+        for batch in batches:
+            if stop.is_set():
+                break
+            pending.put(batch)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        for _ in workers:
+            pending.put(_DONE)
+        for t in workers:
+            t.join()
+
+    if errors:
+        raise errors[0]
+    return sum(counts)
@@ -0,0 +1,260 @@
+from fastapi import HTTPException
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from .metrics import BYTES_PROCESSED, JOBS_FINISHED, JOBS_IN_FLIGHT, ROWS_PROCESSED, STAGE_SECONDS
+from .state_store import ensure_schema, state_db
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_JOBS = int(os.getenv("PIPEMAN_MAX_CONCURRENT_JOBS", "2"))
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+"""
+
+class JobCancelled(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=499, detail="Job cancelled")
+
+class JobProgress:
+    """
+    Progress handle passed to long-running work. Worker threads call `advance`,
+    which also raises JobCancelled once the job has been cancelled; state is
+    flushed to the store at most once per PROGRESS_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, job_id: str, cancel_event: threading.Event, kind: str = "job"):
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self.kind = kind
+        self.rows_done = 0
+        self.bytes_done = 0
+        self.total_rows: Optional[int] = None
+        self.total_bytes: Optional[int] = None
+        self.extra: Dict = {}
+        self.timings: Dict[str, float] = {}
+        self.started = time.monotonic()
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def set_total(self, rows: Optional[int] = None, bytes: Optional[int] = None):
+        with self._lock:
+            if rows is not None:
+                self.total_rows = rows
+            if bytes is not None:
+                self.total_bytes = bytes
+
+    def advance(self, rows: int = 0, bytes: int = 0):
+        self.check_cancelled()
+        if rows:
+            ROWS_PROCESSED.labels(self.kind).inc(rows)
+        if bytes:
+            BYTES_PROCESSED.labels(self.kind).inc(bytes)
+        with self._lock:
+            self.rows_done += rows
+            self.bytes_done += bytes
+            now = time.monotonic()
+            if now - self._last_flush < PROGRESS_FLUSH_INTERVAL:
+                return
+            self._last_flush = now
+        self.flush()
+
+    def update(self, **extra):
+        with self._lock:
+            self.extra.update(extra)
+
+    def add_timing(self, stage: str, seconds: float):
+        # Summed across worker threads, so stages can add up to more than the wall time
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            rows_per_second = self.rows_done / elapsed
+            bytes_per_second = self.bytes_done / elapsed
+            eta = None
+            fraction = None
+            if self.total_rows:
+                fraction = min(self.rows_done / self.total_rows, 1.0)
+            elif self.total_bytes:
+                fraction = min(self.bytes_done / self.total_bytes, 1.0)
+            if fraction:
+                eta = elapsed * (1 - fraction) / fraction
+            return {
+                "rows_done": self.rows_done,
+                "bytes_done": self.bytes_done,
+                "total_rows": self.total_rows,
+                "total_bytes": self.total_bytes,
+                "percent": round(fraction * 100, 1) if fraction is not None else None,
+                "rows_per_second": round(rows_per_second, 1),
+                "bytes_per_second": round(bytes_per_second, 1),
+                "elapsed_seconds": round(elapsed, 3),
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "timings": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+                **self.extra
+            }
+
+    def flush(self):
+        with state_db() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ?",
+                (json.dumps(self.snapshot(), default=str), self.job_id)
+            )
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="pipeman-job")
+_cancel_events: Dict[str, threading.Event] = {}
+_progress: Dict[str, JobProgress] = {}
+_lock = threading.Lock()
+_END = object()
+
+def init_jobs():
+    """
+    Create the jobs table and mark work that was queued or running when the
+    process stopped as interrupted, so its outcome can still be reported.
+    """
+    ensure_schema(_SCHEMA)
+    with state_db() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'interrupted', finished_at = ?, error = ? "
+            "WHERE status IN ('queued', 'running')",
+            (time.time(), "Server restarted before the job finished")
+        )
+
+def submit_job(kind: str, params: dict, work: Callable[[JobProgress], dict]) -> str:
+    job_id = uuid.uuid4().hex
+    with state_db() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, params, created_at) VALUES (?, ?, 'queued', ?, ?)",
+            (job_id, kind, json.dumps(params, default=str), time.time())
+        )
+    cancel_event = threading.Event()
+    with _lock:
+        _cancel_events[job_id] = cancel_event
+    _executor.submit(_run_job, job_id, kind, work, cancel_event)
+    return job_id
+
+@contextmanager
+def stage_timer(stage: str, progress: Optional[JobProgress] = None) -> Iterator[None]:
+    """
+    Time a pipeline stage into the stage histogram and, for jobs, the job's
+    per-stage totals.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        if progress:
+            progress.add_timing(stage, elapsed)
+
+def timed_iter(items: Iterable, stage: str, progress: Optional[JobProgress] = None) -> Iterator:
+    # Time spent producing each item, e.g. waiting on the next block from the server
+    iterator = iter(items)
+    while True:
+        with stage_timer(stage, progress):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+def _run_job(job_id: str, kind: str, work: Callable[[JobProgress], dict], cancel_event: threading.Event):
+    progress = JobProgress(job_id, cancel_event, kind)
+    with _lock:
+        _progress[job_id] = progress
+    JOBS_IN_FLIGHT.labels(kind).inc()
+    try:
+        if cancel_event.is_set():
+            raise JobCancelled()
+        with state_db() as conn:
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), job_id))
+        result = work(progress)
+        _finish_job(job_id, progress, "completed", result=result)
+    except JobCancelled:
+        _finish_job(job_id, progress, "cancelled", error="Job cancelled")
+    except HTTPException as e:
+        if cancel_event.is_set():
+            _finish_job(job_id, progress, "cancelled", error="Job cancelled")
+        else:
+            _finish_job(job_id, progress, "failed", error=str(e.detail))
+    except Exception as e:
+        logger.exception(f"Job {job_id} failed")
+        _finish_job(job_id, progress, "failed", error=str(e))
+    finally:
+        JOBS_IN_FLIGHT.labels(kind).dec()
+        with _lock:
+            _progress.pop(job_id, None)
+            _cancel_events.pop(job_id, None)
+
+def _finish_job(job_id: str, progress: JobProgress, status: str, result: dict = None, error: str = None):
+    JOBS_FINISHED.labels(progress.kind, status).inc()
+    with state_db() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (
+                status, json.dumps(progress.snapshot(), default=str),
+                json.dumps(result, default=str) if result is not None else None,
+                error, time.time(), job_id
+            )
+        )
+
+def _row_to_job(row) -> dict:
+    job = dict(row)
+    for field in ("params", "progress", "result"):
+        job[field] = json.loads(job[field]) if job[field] else None
+    with _lock:
+        live = _progress.get(job["id"])
+    if live is not None:
+        job["progress"] = live.snapshot()
+    return job
+
+def get_job(job_id: str) -> dict:
+    with state_db() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _row_to_job(row)
+
+def list_jobs(limit: int = 50, status: Optional[str] = None) -> List[dict]:
+    with state_db() as conn:
+        if status:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+def cancel_job(job_id: str) -> dict:
+    job = get_job(job_id)
+    if job["status"] not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    with _lock:
+        cancel_event = _cancel_events.get(job_id)
+    if cancel_event is not None:
+        cancel_event.set()
+    return {"job_id": job_id, "status": "cancelling"}
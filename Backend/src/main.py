@@ -1,16 +1,26 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Response
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request, Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
-from .models import ConnectionRequest, IngestionRequest
-from .clickhouse_service import get_clickhouse_tables, get_clickhouse_columns, ingest_clickhouse_to_flatfile, preview_clickhouse_data
-from .flatfile_service import save_uploaded_file, get_flatfile_schema, ingest_flatfile_to_clickhouse, preview_flatfile_data
-from typing import Optional, List
+from .models import BatchIngestRequest, ConnectionRequest, FailurePolicy, IngestionRequest, OutputFormat, PartitionStrategy, PreviewRequest, SchemaPreviewRequest, UploadInitRequest
+from .metadata_cache import metadata_cache
+from .clickhouse_service import client_pool, get_clickhouse_tables, get_clickhouse_column_types, export_clickhouse_incremental, export_clickhouse_query, export_clickhouse_partitioned, ingest_clickhouse_to_flatfile, preview_clickhouse_data, stream_clickhouse_csv
+from .flatfile_service import save_uploaded_file, get_flatfile_column_types, get_flatfile_index, ingest_flatfile_to_clickhouse, preview_flatfile_data, stream_flatfile_csv
+from .job_service import JobProgress, cancel_job, get_job, init_jobs, list_jobs, submit_job
+from .watermark_store import init_watermarks
+from .ingest_manifest import init_manifest
+from .type_inference import INFERENCE_HEAD_ROWS, INFERENCE_RANDOM_ROWS, apply_type_overrides
+from .table_spec import suggest_order_by
+from .csv_index import submit_index_job
+from .batch_ingest import ingest_flatfiles_batch, resolve_batch_files, shutdown_parse_pool
+from .upload_service import ChunkWriter, abort_upload, complete_upload, get_upload_status, init_upload, init_uploads
+from .utils import encode_stream, negotiate_content_encoding
+from .metrics import HTTP_REQUEST_SECONDS, register_stats, render_metrics
+from typing import Iterator, Optional, List
 import os
-import csv
-import tempfile
-import io
-import asyncio
+import codecs
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +31,20 @@ os.makedirs("Uploads", exist_ok=True)
 
 app = FastAPI(title="ClickHouse-FlatFile Ingestion API")
 
+@app.on_event("startup")
+def init_stores():
+    # Set up the job, export watermark, upload and ingest manifest stores, and report jobs cut short by a
+    # restart. Runs in the server process only: spawned parse workers import this module too, and must not
+    # mark the server's running jobs as interrupted.
+    init_jobs()
+    init_watermarks()
+    init_uploads()
+    init_manifest()
+
+@app.on_event("shutdown")
+def stop_workers():
+    shutdown_parse_pool()
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -30,20 +54,98 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Pool and cache counters are read from their stats() on every scrape
+register_stats("pool", client_pool.stats)
+register_stats("cache", metadata_cache.stats)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so ids in paths don't create new series
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 async def root():
     return {"message": "ClickHouse-FlatFile Ingestion API is running"}
 
+@app.get("/api/pool/stats")
+async def get_pool_stats():
+    return client_pool.stats()
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return metadata_cache.stats()
+
 @app.post("/api/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
         file_path = save_uploaded_file(file)
-        return {"filename": file.filename, "path": file_path}
+        # CSVs get their row index built in the background
+        return {"filename": file.filename, "path": file_path, "index_job_id": submit_index_job(file_path)}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+@app.post("/api/uploads")
+async def start_chunked_upload(request: UploadInitRequest):
+    try:
+        return await run_in_threadpool(init_upload, request.filename, request.size, request.sha256)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@app.put("/api/uploads/{upload_id}/chunks")
+async def put_upload_chunk(
+    upload_id: str, request: Request, offset: int = Query(...), sha256: Optional[str] = Query(None)
+):
+    try:
+        writer = await run_in_threadpool(ChunkWriter, upload_id, offset, sha256)
+        try:
+            async for data in request.stream():
+                if data:
+                    await run_in_threadpool(writer.write, data)
+        finally:
+            writer.close()
+        return await run_in_threadpool(writer.commit)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chunk upload failed: {str(e)}")
+
+@app.get("/api/uploads/{upload_id}")
+async def get_chunked_upload(upload_id: str):
+    return await run_in_threadpool(get_upload_status, upload_id)
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_chunked_upload(upload_id: str, sha256: Optional[str] = Query(None)):
+    try:
+        result = await run_in_threadpool(complete_upload, upload_id, sha256)
+        return {**result, "index_job_id": submit_index_job(result["path"])}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+@app.delete("/api/uploads/{upload_id}")
+async def abort_chunked_upload(upload_id: str):
+    return await run_in_threadpool(abort_upload, upload_id)
+
+@app.get("/api/files/{filename}/index")
+async def get_file_index(filename: str):
+    return await run_in_threadpool(get_flatfile_index, filename)
+
 @app.post("/api/tables")
 async def get_tables(request: ConnectionRequest):
     try:
@@ -64,15 +166,21 @@ async def get_columns(request: ConnectionRequest, table: Optional[str] = None):
         if request.source == "clickhouse":
             if not table:
                 raise HTTPException(status_code=400, detail="Table name required")
-            columns = get_clickhouse_columns(
+            column_types = get_clickhouse_column_types(
                 request.host, request.port, request.database, request.user, table
             )
-            return {"source": "clickhouse", "table": table, "columns": columns}
+            return {
+                "source": "clickhouse", "table": table,
+                "columns": [c["name"] for c in column_types], "column_types": column_types
+            }
         elif request.source == "flatfile":
             if not request.filename:
                 raise HTTPException(status_code=400, detail="Filename required")
-            columns = get_flatfile_schema(request.filename, request.delimiter)
-            return {"source": "flatfile", "columns": columns}
+            column_types = get_flatfile_column_types(request.filename, request.delimiter)
+            return {
+                "source": "flatfile",
+                "columns": [c["name"] for c in column_types], "column_types": column_types
+            }
         else:
             raise HTTPException(status_code=400, detail="Invalid source")
     except HTTPException as e:
@@ -80,51 +188,160 @@ async def get_columns(request: ConnectionRequest, table: Optional[str] = None):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Column fetch failed: {str(e)}")
 
+@app.post("/api/schema/preview")
+async def preview_schema(request: SchemaPreviewRequest):
+    try:
+        if request.source != "flatfile" or not request.filename:
+            raise HTTPException(status_code=400, detail="Schema preview requires a flat file")
+        head_rows = request.head_rows or INFERENCE_HEAD_ROWS
+        random_rows = request.random_rows if request.random_rows is not None else INFERENCE_RANDOM_ROWS
+        column_types = await run_in_threadpool(
+            get_flatfile_column_types, request.filename, request.delimiter, head_rows, random_rows
+        )
+        column_types = apply_type_overrides(column_types, request.column_types)
+        return {
+            "source": "flatfile", "filename": request.filename,
+            "head_rows": head_rows, "random_rows": random_rows,
+            "column_types": column_types, "suggested_order_by": suggest_order_by(column_types)
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Schema preview failed: {str(e)}")
+
 @app.post("/api/ingest")
 async def ingest_data(request: IngestionRequest):
     try:
         if request.source == "clickhouse":
-            if not request.table or not request.output_file:
-                raise HTTPException(status_code=400, detail="Table and output file required")
-            try:
+            if not (request.table or request.joins or request.query) or not request.output_file:
+                raise HTTPException(status_code=400, detail="Table, joins or query and output file required")
+            if (request.joins or request.query) and (request.incremental or (request.partitions or 1) > 1):
+                raise HTTPException(
+                    status_code=400, detail="Join and query exports cannot be incremental or partitioned"
+                )
+            
+            if request.incremental and (request.output_format or OutputFormat.csv) != OutputFormat.csv:
+                raise HTTPException(status_code=400, detail="Incremental export only supports CSV output")
+            if request.incremental and request.partitions and request.partitions > 1:
+                raise HTTPException(status_code=400, detail="Incremental export cannot be partitioned")
+            
+            def run(progress: JobProgress) -> dict:
+                if request.joins or request.query:
+                    return export_clickhouse_query(
+                        request.host, request.port, request.database, request.user,
+                        request.output_file, request.delimiter or ",", query=request.query, joins=request.joins,
+                        output_format=(request.output_format or OutputFormat.csv).value,
+                        row_group_size=request.row_group_size, compression=request.output_compression,
+                        compression_level=request.output_compression_level, progress=progress
+                    )
+                if request.incremental:
+                    return export_clickhouse_incremental(
+                        request.host, request.port, request.database, request.user,
+                        request.table, request.columns or [], request.output_file, request.delimiter or ",",
+                        request.watermark_column, append=request.append_output is not False,
+                        reset=bool(request.reset_watermark), progress=progress
+                    )
+                if request.partitions and request.partitions > 1:
+                    return export_clickhouse_partitioned(
+                        request.host, request.port, request.database, request.user,
+                        request.table, request.columns or [], request.output_file, request.delimiter or ",",
+                        request.partitions, strategy=(request.partition_strategy or PartitionStrategy.hash).value,
+                        partition_column=request.partition_column, merge=request.merge_partitions is not False,
+                        ordered=bool(request.ordered), parallelism=request.parallelism,
+                        output_format=(request.output_format or OutputFormat.csv).value,
+                        row_group_size=request.row_group_size, compression=request.output_compression,
+                        compression_level=request.output_compression_level, progress=progress
+                    )
                 count = ingest_clickhouse_to_flatfile(
                     request.host, request.port, request.database, request.user,
-                    request.table, request.columns or [], request.output_file, request.delimiter or ","
+                    request.table, request.columns or [], request.output_file, request.delimiter or ",",
+                    output_format=(request.output_format or OutputFormat.csv).value,
+                    row_group_size=request.row_group_size, compression=request.output_compression,
+                    compression_level=request.output_compression_level, progress=progress
                 )
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"ClickHouse ingestion failed: {str(e)}")
+                return {"record_count": count}
         elif request.source == "flatfile":
             if not request.filename or not request.table:
                 raise HTTPException(status_code=400, detail="Filename and table required")
-            try:
-                count = ingest_flatfile_to_clickhouse(
+            
+            def run(progress: JobProgress) -> dict:
+                return ingest_flatfile_to_clickhouse(
                     request.filename, request.delimiter, request.host, request.port,
-                    request.database, request.user, request.table, request.columns
+                    request.database, request.user, request.table, request.columns,
+                    batch_size=request.batch_size or 10000, sample_rows=request.sample_rows or 10000,
+                    parallelism=request.parallelism or 1, column_types=request.column_types,
+                    table_spec=request.table_spec, idempotent=bool(request.idempotent),
+                    reset_manifest=bool(request.reset_manifest), progress=progress
                 )
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Flat file ingestion failed: {str(e)}")
         else:
             raise HTTPException(status_code=400, detail="Invalid source")
-        return {"status": "completed", "record_count": count}
+        job_id = submit_job("ingest", request.dict(), run)
+        return {"status": "queued", "job_id": job_id}
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
 
+@app.post("/api/ingest/batch")
+async def ingest_batch(request: BatchIngestRequest):
+    try:
+        # Resolve the files now so a bad list or pattern fails the request rather than the job
+        resolve_batch_files(request.filenames, request.pattern)
+        
+        def run(progress: JobProgress) -> dict:
+            return ingest_flatfiles_batch(
+                request.filenames, request.pattern, request.delimiter, request.host, request.port,
+                request.database, request.user, request.table, request.columns,
+                batch_size=request.batch_size or 10000, sample_rows=request.sample_rows or 10000,
+                parallelism=request.parallelism or 1, parse_processes=request.parse_processes,
+                column_types=request.column_types, table_spec=request.table_spec,
+                idempotent=bool(request.idempotent), on_error=(request.on_error or FailurePolicy.abort).value,
+                progress=progress
+            )
+        job_id = submit_job("batch_ingest", request.dict(), run)
+        return {"status": "queued", "job_id": job_id}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch ingestion failed: {str(e)}")
+
+@app.get("/api/jobs")
+async def get_jobs(limit: int = Query(50, ge=1, le=500), status: Optional[str] = Query(None)):
+    return {"jobs": list_jobs(limit, status)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    return get_job(job_id)
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job_request(job_id: str):
+    return cancel_job(job_id)
+
 @app.post("/api/preview")
-async def preview_data(request: IngestionRequest):
+async def preview_data(request: PreviewRequest):
     try:
+        page_size = request.page_size or 100
+        offset = request.offset or 0
         if request.source == "clickhouse":
             if not request.table:
                 raise HTTPException(status_code=400, detail="Table required")
-            return preview_clickhouse_data(
+            return await run_in_threadpool(
+                preview_clickhouse_data,
                 request.host, request.port, request.database, request.user,
-                request.table, request.columns or []
+                request.table, request.columns or [], request.filters, request.order_by,
+                bool(request.descending), page_size, offset, request.cursor, request.sample
             )
         elif request.source == "flatfile":
             if not request.filename:
                 raise HTTPException(status_code=400, detail="Filename required")
-            return preview_flatfile_data(request.filename, request.delimiter, request.columns or [])
+            if request.filters or request.order_by or request.cursor:
+                raise HTTPException(
+                    status_code=400, detail="Filters, ordering and cursors are only supported for ClickHouse previews"
+                )
+            return await run_in_threadpool(
+                preview_flatfile_data, request.filename, request.delimiter, request.columns or [],
+                page_size, offset, request.sample
+            )
         else:
             raise HTTPException(status_code=400, detail="Invalid source")
     except HTTPException as e:
@@ -134,6 +351,7 @@ async def preview_data(request: IngestionRequest):
 
 @app.get("/api/download/{filename}")
 async def download_file(
+    request: Request,
     filename: str,
     columns: Optional[List[str]] = Query(None),
     source: Optional[str] = Query(None),
@@ -150,76 +368,40 @@ async def download_file(
     try:
         if not columns:
             raise HTTPException(status_code=400, detail="No columns selected for download")
-
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=delimiter)
+        if not delimiter or len(delimiter) != 1:
+            raise HTTPException(status_code=400, detail="Delimiter must be a single character")
         
+        # Validation runs before the response starts; rows are only read while streaming
         if source == "clickhouse":
             if not all([table, host, port, database]):
                 raise HTTPException(
                     status_code=400, 
                     detail="Missing required parameters for ClickHouse source"
                 )
-            
-            try:
-                logger.info(f"Fetching data from ClickHouse table: {table}")
-                data = preview_clickhouse_data(host, port, database, user or 'default', table, columns)
-                
-                # Write header
-                writer.writerow(columns)
-                # Write data
-                writer.writerows(data)
-                logger.info(f"Successfully fetched {len(data)} rows from ClickHouse")
-                
-            except Exception as e:
-                logger.error(f"ClickHouse data fetch error: {str(e)}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to fetch data from ClickHouse: {str(e)}"
-                )
-            
+            logger.info(f"Streaming data from ClickHouse table: {table}")
+            chunks = await run_in_threadpool(
+                stream_clickhouse_csv, host, str(port), database, user or 'default', table, columns, delimiter
+            )
         else:  # Flatfile source
-            file_path = os.path.join("Uploads", filename)
-            if not os.path.exists(file_path):
-                logger.error(f"File not found: {file_path}")
-                raise HTTPException(status_code=404, detail="File not found")
-            
-            try:
-                with open(file_path, 'r', newline='') as source_file:
-                    reader = csv.DictReader(source_file, delimiter=delimiter)
-                    
-                    # Write header
-                    writer.writerow(columns)
-                    
-                    # Write selected columns
-                    row_count = 0
-                    for row in reader:
-                        filtered_row = [row[col] for col in columns if col in row]
-                        writer.writerow(filtered_row)
-                        row_count += 1
-                    
-                    logger.info(f"Successfully processed {row_count} rows from file")
-                    
-            except Exception as e:
-                logger.error(f"File processing error: {str(e)}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to process file: {str(e)}"
-                )
+            chunks = await run_in_threadpool(stream_flatfile_csv, filename, delimiter, columns)
         
-        # Prepare the response
-        output.seek(0)
-        content = output.getvalue().encode('utf-8-sig')
+        def with_bom(body: Iterator[bytes]) -> Iterator[bytes]:
+            yield codecs.BOM_UTF8
+            yield from body
         
-        # Create response with proper headers
+        encoding = negotiate_content_encoding(request.headers.get("accept-encoding"))
+        # A sync iterator is consumed one chunk per send, which gives backpressure
         response = StreamingResponse(
-            iter([content]),
+            encode_stream(with_bom(chunks), encoding),
             media_type='text/csv'
         )
         
         response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
         response.headers["Content-Type"] = "text/csv; charset=utf-8"
         response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
         
         logger.info("Successfully prepared download response")
         return response
@@ -230,7 +412,3 @@ async def download_file(
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
-    finally:
-        if 'output' in locals():
-            output.close()
-            logger.info("Cleaned up resources")
\ No newline at end of file
@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("PIPEMAN_METADATA_CACHE_MAX_ENTRIES", "1024"))
+METADATA_CACHE_TTL = float(os.getenv("PIPEMAN_METADATA_CACHE_TTL", "60"))
+
+class MetadataCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL for schema lookups.
+
+    Keys are tuples so related entries can be dropped together by prefix, e.g.
+    ("columns", connection_key) drops every cached column listing for a server.
+    """
+
+    def __init__(self, max_entries: int = METADATA_CACHE_MAX_ENTRIES, ttl: float = METADATA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get_or_load(self, key: Tuple, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._metrics["hits"] += 1
+                return entry[1]
+            self._metrics["misses"] += 1
+
+        # Load outside the lock; concurrent misses for one key may both load
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics["evictions"] += 1
+        return value
+
+    def invalidate(self, prefix: Tuple = ()):
+        with self._lock:
+            stale = [key for key in self._entries if key[:len(prefix)] == prefix]
+            for key in stale:
+                del self._entries[key]
+            self._metrics["invalidations"] += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._metrics, "entries": len(self._entries), "max_entries": self.max_entries}
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,46 @@
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from typing import Callable
+
+# Stage labels used with job_service.stage_timer: connect, query, fetch, hash,
+# parse, type_mapping, sort, insert and file_write
+
+ROWS_PROCESSED = Counter("pipeman_rows_processed_total", "Rows read or written by jobs", ["kind"])
+BYTES_PROCESSED = Counter("pipeman_bytes_processed_total", "Bytes read or written by jobs", ["kind"])
+STAGE_SECONDS = Histogram(
+    "pipeman_stage_seconds", "Time spent in each pipeline stage", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+BATCH_INSERT_SECONDS = Histogram(
+    "pipeman_batch_insert_seconds", "Latency of one batch insert into ClickHouse",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+BATCH_ROWS = Histogram(
+    "pipeman_batch_rows", "Rows per inserted batch", buckets=(100, 1000, 5000, 10000, 50000, 100000, 500000)
+)
+JOBS_IN_FLIGHT = Gauge("pipeman_jobs_in_flight", "Jobs currently running", ["kind"])
+JOBS_FINISHED = Counter("pipeman_jobs_finished_total", "Jobs that finished, by outcome", ["kind", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "pipeman_http_request_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+
+class StatsCollector:
+    """
+    Expose a component's `stats()` dict as gauges read at scrape time, e.g.
+    pipeman_pool_in_use from the connection pool.
+    """
+
+    def __init__(self, name: str, stats: Callable[[], dict]):
+        self.name = name
+        self.stats = stats
+
+    def collect(self):
+        for key, value in self.stats().items():
+            if isinstance(value, (int, float)):
+                yield GaugeMetricFamily(f"pipeman_{self.name}_{key}", f"{self.name} {key}", value=value)
+
+def register_stats(name: str, stats: Callable[[], dict]):
+    REGISTRY.register(StatsCollector(name, stats))
+
+def render_metrics() -> tuple:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
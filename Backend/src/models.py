@@ -1,11 +1,27 @@
 from pydantic import BaseModel, validator
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from enum import Enum
+import re
 
 class SourceType(str, Enum):
     clickhouse = "clickhouse"
     flatfile = "flatfile"
 
+class OutputFormat(str, Enum):
+    csv = "csv"
+    parquet = "parquet"
+    arrow = "arrow"
+    native = "native"
+
+class PartitionStrategy(str, Enum):
+    hash = "hash"
+    part = "part"
+    range = "range"
+
+PARQUET_COMPRESSIONS = ["none", "snappy", "gzip", "brotli", "lz4", "zstd"]
+ARROW_COMPRESSIONS = ["none", "lz4", "zstd"]
+LEVELED_COMPRESSIONS = ["gzip", "brotli", "lz4", "zstd"]
+
 class ConnectionRequest(BaseModel):
     source: SourceType
     host: Optional[str] = "localhost"
@@ -27,7 +43,192 @@ class ConnectionRequest(BaseModel):
             raise ValueError("Delimiter must be a single character")
         return v
 
+class TableSpec(BaseModel):
+    engine: Optional[str] = "MergeTree"
+    engine_params: Optional[List[str]] = None
+    order_by: Optional[List[str]] = None
+    partition_by: Optional[str] = None
+    codecs: Optional[Dict[str, str]] = None
+    ttl: Optional[str] = None
+    suggest_order_by: Optional[bool] = False
+
+class JoinType(str, Enum):
+    inner = "inner"
+    left = "left"
+    right = "right"
+    full = "full"
+
+class JoinTable(BaseModel):
+    table: str
+    columns: Optional[List[str]] = None
+    join_type: Optional[JoinType] = JoinType.inner
+    # Column of this table -> "table.column" of a table earlier in the list
+    on: Optional[Dict[str, str]] = None
+
 class IngestionRequest(ConnectionRequest):
     table: Optional[str] = None
     columns: Optional[List[str]] = None
-    output_file: Optional[str] = None
\ No newline at end of file
+    output_file: Optional[str] = None
+    batch_size: Optional[int] = 10000
+    sample_rows: Optional[int] = 10000
+    parallelism: Optional[int] = 1
+    output_format: Optional[OutputFormat] = OutputFormat.csv
+    row_group_size: Optional[int] = None
+    output_compression: Optional[str] = None
+    output_compression_level: Optional[int] = None
+    partitions: Optional[int] = None
+    partition_strategy: Optional[PartitionStrategy] = PartitionStrategy.hash
+    partition_column: Optional[str] = None
+    merge_partitions: Optional[bool] = True
+    ordered: Optional[bool] = False
+    incremental: Optional[bool] = False
+    watermark_column: Optional[str] = None
+    append_output: Optional[bool] = True
+    reset_watermark: Optional[bool] = False
+    column_types: Optional[Dict[str, str]] = None
+    table_spec: Optional[TableSpec] = None
+    joins: Optional[List[JoinTable]] = None
+    query: Optional[str] = None
+    idempotent: Optional[bool] = False
+    reset_manifest: Optional[bool] = False
+
+    @validator("batch_size", "sample_rows", "parallelism", "row_group_size", "partitions")
+    def validate_positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Must be a positive integer")
+        return v
+
+    @validator("output_compression")
+    def validate_output_compression(cls, v, values):
+        if v is None:
+            return v
+        output_format = values.get("output_format")
+        if output_format == OutputFormat.parquet and v not in PARQUET_COMPRESSIONS:
+            raise ValueError(f"Parquet compression must be one of {', '.join(PARQUET_COMPRESSIONS)}")
+        if output_format == OutputFormat.arrow and v not in ARROW_COMPRESSIONS:
+            raise ValueError(f"Arrow compression must be one of {', '.join(ARROW_COMPRESSIONS)}")
+        if output_format not in (OutputFormat.parquet, OutputFormat.arrow):
+            raise ValueError("Compression is only supported for parquet and arrow output")
+        return v
+
+    @validator("output_compression_level")
+    def validate_output_compression_level(cls, v, values):
+        if v is None or "output_compression" not in values:
+            return v
+        # Parquet writes snappy unless told otherwise, and neither it nor "none" takes a level
+        compression = values.get("output_compression")
+        if values.get("output_format") == OutputFormat.parquet:
+            compression = compression or "snappy"
+        if compression not in LEVELED_COMPRESSIONS:
+            raise ValueError(
+                f"Compression level requires output_compression to be one of {', '.join(LEVELED_COMPRESSIONS)}"
+            )
+        return v
+
+class FailurePolicy(str, Enum):
+    abort = "abort"
+    skip = "skip"
+
+class BatchIngestRequest(ConnectionRequest):
+    source: SourceType = SourceType.flatfile
+    # Either an explicit list of uploaded files or a glob over Uploads, e.g. "sales_*.csv"
+    filenames: Optional[List[str]] = None
+    pattern: Optional[str] = None
+    table: str
+    columns: Optional[List[str]] = None
+    batch_size: Optional[int] = 10000
+    sample_rows: Optional[int] = 10000
+    parallelism: Optional[int] = 1
+    parse_processes: Optional[int] = None
+    column_types: Optional[Dict[str, str]] = None
+    table_spec: Optional[TableSpec] = None
+    idempotent: Optional[bool] = False
+    on_error: Optional[FailurePolicy] = FailurePolicy.abort
+
+    @validator("batch_size", "sample_rows", "parallelism", "parse_processes")
+    def validate_positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Must be a positive integer")
+        return v
+
+class SchemaPreviewRequest(ConnectionRequest):
+    head_rows: Optional[int] = None
+    random_rows: Optional[int] = None
+    column_types: Optional[Dict[str, str]] = None
+
+    @validator("head_rows")
+    def validate_head_rows(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Must be a positive integer")
+        return v
+
+    @validator("random_rows")
+    def validate_random_rows(cls, v):
+        if v is not None and v < 0:
+            raise ValueError("Must not be negative")
+        return v
+
+class FilterOperator(str, Enum):
+    eq = "eq"
+    ne = "ne"
+    lt = "lt"
+    le = "le"
+    gt = "gt"
+    ge = "ge"
+    in_ = "in"
+    not_in = "not_in"
+    contains = "contains"
+    starts_with = "starts_with"
+    is_null = "is_null"
+    is_not_null = "is_not_null"
+
+class PreviewFilter(BaseModel):
+    column: str
+    op: FilterOperator
+    value: Optional[Any] = None
+
+class PreviewRequest(ConnectionRequest):
+    table: Optional[str] = None
+    columns: Optional[List[str]] = None
+    filters: Optional[List[PreviewFilter]] = None
+    order_by: Optional[List[str]] = None
+    descending: Optional[bool] = False
+    page_size: Optional[int] = 100
+    offset: Optional[int] = 0
+    cursor: Optional[str] = None
+    sample: Optional[float] = None
+
+    @validator("page_size")
+    def validate_page_size(cls, v):
+        if v is not None and not 1 <= v <= 1000:
+            raise ValueError("Page size must be between 1 and 1000")
+        return v
+
+    @validator("offset")
+    def validate_offset(cls, v):
+        if v is not None and v < 0:
+            raise ValueError("Offset must not be negative")
+        return v
+
+    @validator("sample")
+    def validate_sample(cls, v):
+        if v is not None and not 0 < v <= 1:
+            raise ValueError("Sample must be a fraction between 0 and 1")
+        return v
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+    @validator("size")
+    def validate_size(cls, v):
+        if v < 0:
+            raise ValueError("Size must not be negative")
+        return v
+
+    @validator("sha256")
+    def validate_sha256(cls, v):
+        if v and not re.match(r"^[a-fA-F0-9]{64}$", v):
+            raise ValueError("sha256 must be a 64 character hex digest")
+        return v
@@ -0,0 +1,156 @@
+from fastapi import HTTPException
+from clickhouse_connect.driver.binding import format_query_value
+import os
+import shutil
+import threading
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, List, Optional, Tuple
+from .job_service import JobProgress
+from .file_writers import _open_arrow_writer
+
+MERGE_CHUNK_SIZE = 1024 * 1024
+
+class PartitionProgress:
+    """
+    Progress handle for one partition of a parallel export. Counts are forwarded
+    to the job's progress and also reported per partition under `partitions`.
+    """
+
+    def __init__(self, parent: Optional[JobProgress], states: List[dict], index: int):
+        self.parent = parent
+        self.states = states
+        self.state = states[index]
+        self._lock = threading.Lock()
+
+    def advance(self, rows: int = 0, bytes: int = 0):
+        with self._lock:
+            self.state["rows_done"] += rows
+            self.state["bytes_done"] += bytes
+        if self.parent:
+            self.parent.update(partitions=self.states)
+            self.parent.advance(rows=rows, bytes=bytes)
+
+    def add_timing(self, stage: str, seconds: float):
+        if self.parent:
+            self.parent.add_timing(stage, seconds)
+
+    def check_cancelled(self):
+        if self.parent:
+            self.parent.check_cancelled()
+
+    def set_status(self, status: str):
+        self.state["status"] = status
+        if self.parent:
+            self.parent.update(partitions=self.states)
+
+def get_sorting_key(client, table: str) -> List[str]:
+    result = client.query(
+        "SELECT sorting_key FROM system.tables WHERE database = currentDatabase() AND name = {table:String}",
+        parameters={"table": table}
+    ).result_rows
+    if not result or not result[0][0]:
+        return []
+    return [expr.strip() for expr in result[0][0].split(",")]
+
+def plan_partitions(
+    client, table: str, strategy: str, partitions: int, column: Optional[str]
+) -> Tuple[List[str], Optional[int]]:
+    """
+    Split `table` into at most `partitions` WHERE predicates that together cover
+    every row exactly once, plus the row count they must add up to when that can
+    change under the export (None otherwise).
+
+    - hash:  cityHash64(column) modulo `partitions`; NULL keys go to the first
+    - part:  the table's data parts, grouped into partitions of similar row counts.
+             A background merge renames the parts it reads, so their rows would
+             match no predicate; the planned count lets the export detect that.
+    - range: value ranges of `column` between approximate quantiles
+    """
+    if strategy == "hash":
+        predicates = [f"cityHash64({column}) % {partitions} = {i}" for i in range(partitions)]
+        predicates[0] = f"{predicates[0]} OR {column} IS NULL"
+        return predicates, None
+    if strategy == "part":
+        return _plan_part_partitions(client, table, partitions)
+    if strategy == "range":
+        return _plan_range_partitions(client, table, partitions, column), None
+    raise HTTPException(status_code=400, detail=f"Unsupported partition strategy: {strategy}")
+
+def _plan_part_partitions(client, table: str, partitions: int) -> Tuple[List[str], Optional[int]]:
+    parts = client.query(f"SELECT _part, count() FROM {table} GROUP BY _part ORDER BY _part").result_rows
+    if not parts:
+        return ["1"], None
+    # Largest parts first, each into the currently smallest group
+    groups: List[Tuple[int, List[str]]] = [(0, []) for _ in range(min(partitions, len(parts)))]
+    for name, rows in sorted(parts, key=lambda p: -p[1]):
+        i = min(range(len(groups)), key=lambda g: groups[g][0])
+        groups[i] = (groups[i][0] + rows, groups[i][1] + [name])
+    predicates = [
+        f"_part IN ({', '.join(format_query_value(name) for name in sorted(names))})"
+        for _, names in sorted(groups, key=lambda g: min(g[1]))
+    ]
+    return predicates, sum(rows for _, rows in parts)
+
+def _plan_range_partitions(client, table: str, partitions: int, column: str) -> List[str]:
+    levels = ", ".join(str(round(i / partitions, 6)) for i in range(1, partitions))
+    row = client.query(f"SELECT quantiles({levels})({column}), toTypeName({column}) FROM {table}").result_rows
+    bounds = sorted({b for b in row[0][0] if b is not None}) if row and row[0][0] else []
+    nullable = bool(row) and row[0][1].startswith("Nullable")
+    if not bounds:
+        return ["1"]
+    literals = [format_query_value(b) for b in bounds]
+    predicates = [f"{column} < {literals[0]}"]
+    predicates += [f"{column} >= {lo} AND {column} < {hi}" for lo, hi in zip(literals, literals[1:])]
+    predicates.append(f"{column} >= {literals[-1]}")
+    if nullable:
+        predicates[-1] = f"({predicates[-1]}) OR {column} IS NULL"
+    return predicates
+
+def part_file_path(output_path: str, index: int) -> str:
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.part-{index:04d}{ext}"
+
+def merge_part_files(
+    part_paths: List[str], output_path: str, output_format: str,
+    compression: Optional[str] = None, compression_level: Optional[int] = None
+):
+    """
+    Concatenate part files into `output_path` in the order given. CSV headers of
+    all but the first part are dropped; Parquet and Arrow parts are re-framed
+    batch by batch, Native blocks are copied as-is.
+    """
+    if output_format in ("csv", "native"):
+        with open(output_path, "wb") as out:
+            for i, path in enumerate(part_paths):
+                with open(path, "rb") as f:
+                    if output_format == "csv" and i > 0:
+                        f.readline()
+                    shutil.copyfileobj(f, out, MERGE_CHUNK_SIZE)
+    elif output_format in ("parquet", "arrow"):
+        writer = None
+        try:
+            for path in part_paths:
+                if output_format == "parquet":
+                    part = pq.ParquetFile(path)
+                    schema = part.schema_arrow
+                    tables = (part.read_row_group(i) for i in range(part.num_row_groups))
+                else:
+                    reader = pa.ipc.open_file(pa.memory_map(path))
+                    schema = reader.schema
+                    tables = (pa.Table.from_batches([reader.get_batch(i)]) for i in range(reader.num_record_batches))
+                if writer is None:
+                    writer = _open_arrow_writer(output_path, output_format, schema, compression, compression_level)
+                for table in tables:
+                    writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported output format: {output_format}")
+
+def partition_states(predicates: List[str]) -> List[Dict]:
+    return [
+        {"partition": i, "predicate": p, "status": "queued", "rows_done": 0, "bytes_done": 0}
+        for i, p in enumerate(predicates)
+    ]
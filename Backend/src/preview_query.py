@@ -0,0 +1,98 @@
+from fastapi import HTTPException
+import base64
+import json
+from typing import Any, Dict, List, Tuple
+
+COMPARISON_OPERATORS = {"eq": "=", "ne": "!=", "lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+
+def _base_type(column_type: str) -> str:
+    for wrapper in ("LowCardinality(", "Nullable("):
+        if column_type.startswith(wrapper):
+            column_type = column_type[len(wrapper):-1]
+    return column_type
+
+def _placeholder(name: str, column_type: str) -> str:
+    # DateTime parameters are parsed best-effort so ISO strings with offsets or
+    # fractional seconds are accepted
+    base_type = _base_type(column_type)
+    if base_type.startswith("DateTime"):
+        return f"parseDateTime64BestEffort({{{name}:String}}, 9)"
+    return f"{{{name}:{base_type}}}"
+
+def compile_filters(filters: List[Any], column_types: Dict[str, str]) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Turn typed preview filters into WHERE conditions with server-side bound
+    parameters. Columns must exist in `column_types`; values never reach the
+    SQL text.
+    """
+    conditions = []
+    parameters = {}
+    for i, f in enumerate(filters or []):
+        if f.column not in column_types:
+            raise HTTPException(status_code=400, detail=f"Unknown filter column: {f.column}")
+        column = f"`{f.column}`"
+        column_type = column_types[f.column]
+        op = f.op.value if hasattr(f.op, "value") else f.op
+        name = f"f{i}"
+        if op == "is_null":
+            conditions.append(f"{column} IS NULL")
+            continue
+        if op == "is_not_null":
+            conditions.append(f"{column} IS NOT NULL")
+            continue
+        if f.value is None:
+            raise HTTPException(status_code=400, detail=f"Filter on {f.column} needs a value")
+        if op in COMPARISON_OPERATORS:
+            conditions.append(f"{column} {COMPARISON_OPERATORS[op]} {_placeholder(name, column_type)}")
+            parameters[name] = f.value
+        elif op in ("in", "not_in"):
+            if not isinstance(f.value, list) or not f.value:
+                raise HTTPException(status_code=400, detail=f"Filter on {f.column} needs a non-empty list")
+            base_type = _base_type(column_type)
+            if base_type.startswith("DateTime"):
+                values = f"arrayMap(x -> parseDateTime64BestEffort(x, 9), {{{name}:Array(String)}})"
+                parameters[name] = [str(v) for v in f.value]
+            else:
+                values = f"{{{name}:Array({base_type})}}"
+                parameters[name] = f.value
+            conditions.append(f"{column} {'NOT IN' if op == 'not_in' else 'IN'} {values}")
+        elif op == "contains":
+            conditions.append(f"positionCaseInsensitiveUTF8(toString({column}), {{{name}:String}}) > 0")
+            parameters[name] = str(f.value)
+        elif op == "starts_with":
+            conditions.append(f"startsWith(toString({column}), {{{name}:String}})")
+            parameters[name] = str(f.value)
+        else:
+            raise HTTPException(status_code=400, detail=f"Unsupported filter operator: {op}")
+    return conditions, parameters
+
+def keyset_condition(
+    order_by: List[str], column_types: Dict[str, str], cursor: str, descending: bool
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Condition selecting rows after the cursor's sort-key values, so a page costs
+    the same at any depth.
+    """
+    values = decode_cursor(cursor)
+    if len(values) != len(order_by):
+        raise HTTPException(status_code=400, detail="Cursor does not match order_by")
+    placeholders = []
+    parameters = {}
+    for i, (col, value) in enumerate(zip(order_by, values)):
+        name = f"k{i}"
+        placeholders.append(_placeholder(name, column_types[col]))
+        parameters[name] = value
+    columns = ", ".join(f"`{c}`" for c in order_by)
+    return f"({columns}) {'<' if descending else '>'} ({', '.join(placeholders)})", parameters
+
+def encode_cursor(values: List[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
@@ -0,0 +1,101 @@
+from fastapi import HTTPException
+import re
+from typing import Dict, List, Tuple
+from .models import JoinTable, JoinType
+
+_SELECT_PATTERN = r"^\s*(?:SELECT|WITH)\b"
+_FORBIDDEN_PATTERN = r"\bINTO\s+OUTFILE\b|\bFORMAT\s+[A-Za-z]+\s*$"
+JOIN_KEYWORDS = {
+    JoinType.inner: "INNER JOIN", JoinType.left: "LEFT JOIN",
+    JoinType.right: "RIGHT JOIN", JoinType.full: "FULL OUTER JOIN"
+}
+
+def validate_select_query(query: str) -> str:
+    """
+    Accept a single SELECT (or WITH ... SELECT) statement. This only rejects the
+    obvious; the query also runs with readonly settings, so the server refuses
+    anything that writes.
+    """
+    query = (query or "").strip().rstrip(";").strip()
+    if not re.match(_SELECT_PATTERN, query, re.IGNORECASE):
+        raise HTTPException(status_code=400, detail="Query must be a SELECT statement")
+    if ";" in query:
+        raise HTTPException(status_code=400, detail="Query must be a single statement")
+    if re.search(_FORBIDDEN_PATTERN, query, re.IGNORECASE):
+        raise HTTPException(status_code=400, detail="Query must not set an output file or format")
+    return query
+
+def read_only_settings(client) -> Dict[str, int]:
+    # readonly=2 still lets the client send its own format settings with the query
+    current = client.server_settings.get("readonly")
+    if current is not None and current.value != "0":
+        return {}
+    return {"readonly": 2}
+
+def plan_join_query(tables: List[JoinTable], table_columns: Dict[str, List[str]]) -> Tuple[str, List[str]]:
+    """
+    Build the SELECT for a multi-table export. Each table is read through a
+    subquery of only its exported columns and join keys, so ClickHouse never
+    reads the rest. Output columns keep their names unless two tables export the
+    same name, in which case they become `table_column`. Returns the query and
+    the output column names.
+    """
+    if not tables:
+        raise HTTPException(status_code=400, detail="At least one table is required")
+    names = [t.table for t in tables]
+    for name in names:
+        if not re.match(r"^[a-zA-Z0-9_]+$", name):
+            raise HTTPException(status_code=400, detail=f"Invalid table name: {name}")
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Each table can only be joined once")
+
+    selected = {}
+    needed = {name: [] for name in names}
+    joins = []
+    for position, t in enumerate(tables):
+        columns = t.columns if t.columns is not None else table_columns[t.table]
+        unknown = [col for col in columns if col not in table_columns[t.table]]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns in {t.table}: {', '.join(unknown)}")
+        selected[t.table] = columns
+        needed[t.table].extend(columns)
+        if position == 0:
+            continue
+        if not t.on:
+            raise HTTPException(status_code=400, detail=f"Join keys required for {t.table}")
+        conditions = []
+        for col, reference in t.on.items():
+            other, _, other_col = reference.partition(".")
+            if col not in table_columns[t.table]:
+                raise HTTPException(status_code=400, detail=f"Unknown join key in {t.table}: {col}")
+            if other not in names[:position] or other_col not in table_columns[other]:
+                raise HTTPException(
+                    status_code=400, detail=f"Join key {reference} must be a column of an earlier table"
+                )
+            needed[t.table].append(col)
+            needed[other].append(other_col)
+            conditions.append(f"{other}.`{other_col}` = {t.table}.`{col}`")
+        joins.append((t, " AND ".join(conditions)))
+
+    counts = {}
+    for columns in selected.values():
+        for col in columns:
+            counts[col] = counts.get(col, 0) + 1
+    output_names = []
+    projections = []
+    for name, columns in selected.items():
+        for col in columns:
+            alias = col if counts[col] == 1 else f"{name}_{col}"
+            output_names.append(alias)
+            projections.append(f"{name}.`{col}` AS `{alias}`")
+    if not projections:
+        raise HTTPException(status_code=400, detail="No columns selected for export")
+
+    def subquery(name: str) -> str:
+        columns = ", ".join(f"`{col}`" for col in dict.fromkeys(needed[name]))
+        return f"(SELECT {columns} FROM {name}) AS {name}"
+
+    query = f"SELECT {', '.join(projections)} FROM {subquery(names[0])}"
+    for t, condition in joins:
+        query += f" {JOIN_KEYWORDS[t.join_type or JoinType.inner]} {subquery(t.table)} ON {condition}"
+    return query, output_names
@@ -0,0 +1,26 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+STATE_DB = os.getenv("PIPEMAN_STATE_DB", os.path.join("Uploads", ".pipeman", "state.db"))
+
+@contextmanager
+def state_db() -> Iterator[sqlite3.Connection]:
+    """
+    Open the local SQLite store used to persist job and transfer state across
+    restarts. The block runs in a transaction that commits on success.
+    """
+    os.makedirs(os.path.dirname(STATE_DB), exist_ok=True)
+    conn = sqlite3.connect(STATE_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def ensure_schema(ddl: str):
+    with state_db() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(ddl)
@@ -0,0 +1,123 @@
+from fastapi import HTTPException
+import re
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, List, Optional
+from .models import TableSpec
+
+SUGGESTED_ORDER_BY_COLUMNS = 3
+
+_ENGINE_PATTERN = r"^(Replacing|Summing|Aggregating|Collapsing|VersionedCollapsing)?MergeTree$"
+_IDENTIFIER_PATTERN = r"^[a-zA-Z0-9_]+$"
+# Column references, function calls, arithmetic, literals and INTERVAL clauses; no statement separators
+_EXPRESSION_PATTERN = r"^[A-Za-z0-9_(),.+\-*/%' `]+$"
+_CODEC_PATTERN = (
+    r"^(Delta|DoubleDelta|Gorilla|T64|FPC|LZ4|LZ4HC|ZSTD|NONE)(\([0-9]+\))?"
+    r"(\s*,\s*(Delta|DoubleDelta|Gorilla|T64|FPC|LZ4|LZ4HC|ZSTD|NONE)(\([0-9]+\))?)*$"
+)
+
+def _check_expression(expression: str, what: str) -> str:
+    if not expression or not re.match(_EXPRESSION_PATTERN, expression):
+        raise HTTPException(status_code=400, detail=f"Invalid {what}: {expression}")
+    return expression
+
+def build_create_table_sql(
+    table: str, column_names: List[str], column_types: List[str],
+    spec: Optional[TableSpec] = None, order_by: Optional[List[str]] = None,
+    settings: Optional[Dict[str, int]] = None
+) -> str:
+    """
+    CREATE TABLE statement for an ingestion target. Without a spec this is the
+    historical MergeTree ORDER BY tuple(); `order_by` is the resolved sort key
+    and `settings` are table-level engine settings.
+    """
+    spec = spec or TableSpec()
+    engine = spec.engine or "MergeTree"
+    if not re.match(_ENGINE_PATTERN, engine):
+        raise HTTPException(status_code=400, detail=f"Unsupported table engine: {engine}")
+    for param in spec.engine_params or []:
+        if not re.match(_IDENTIFIER_PATTERN, param):
+            raise HTTPException(status_code=400, detail=f"Invalid engine parameter: {param}")
+    codecs = spec.codecs or {}
+    unknown = [col for col in codecs if col not in column_names]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns in codecs: {', '.join(unknown)}")
+
+    column_defs = []
+    for col, col_type in zip(column_names, column_types):
+        definition = f"`{col}` {col_type}"
+        if col in codecs:
+            if not re.match(_CODEC_PATTERN, codecs[col]):
+                raise HTTPException(status_code=400, detail=f"Invalid codec for {col}: {codecs[col]}")
+            definition += f" CODEC({codecs[col]})"
+        column_defs.append(definition)
+
+    clauses = [f"ENGINE = {engine}({', '.join(spec.engine_params or [])})"]
+    if spec.partition_by:
+        clauses.append(f"PARTITION BY {_check_expression(spec.partition_by, 'PARTITION BY expression')}")
+    keys = [_check_expression(key, "ORDER BY expression") for key in order_by or []]
+    clauses.append(f"ORDER BY ({', '.join(keys)})" if keys else "ORDER BY tuple()")
+    if spec.ttl:
+        clauses.append(f"TTL {_check_expression(spec.ttl, 'TTL expression')}")
+    if settings:
+        clauses.append("SETTINGS " + ", ".join(f"{name} = {int(value)}" for name, value in settings.items()))
+    return f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(column_defs)}) " + " ".join(clauses)
+
+def suggest_order_by(column_stats: List[dict], max_columns: int = SUGGESTED_ORDER_BY_COLUMNS) -> List[str]:
+    """
+    Suggest a sort key from sampled column statistics: non-Nullable, non-float
+    columns in increasing order of cardinality, so the leading columns split the
+    data into long runs that compress and prune well. Names are backtick-quoted
+    so ones with spaces or dashes stay single identifiers in ORDER BY; names
+    build_create_table_sql would reject are not suggested.
+    """
+    candidates = [
+        c for c in column_stats
+        if c.get("distinct_count", 0) > 1 and "Nullable" not in c["type"] and "Float" not in c["type"]
+        and re.match(_EXPRESSION_PATTERN, f"`{c['name']}`") and "`" not in c["name"]
+    ]
+    candidates.sort(key=lambda c: c["distinct_count"])
+    return [f"`{c['name']}`" for c in candidates[:max_columns]]
+
+def resolve_order_by(spec: Optional[TableSpec], column_stats: List[dict]) -> List[str]:
+    if spec and spec.order_by:
+        return spec.order_by
+    if spec and spec.suggest_order_by:
+        return suggest_order_by(column_stats)
+    return []
+
+def sort_columns(order_by: List[str], column_names: List[str]) -> List[str]:
+    """
+    Leading sort-key entries that are plain columns of the batch. Batches are
+    pre-sorted on these; sorting stops at the first expression.
+    """
+    columns = []
+    for key in order_by:
+        name = key.strip()
+        name = name[1:-1] if len(name) > 1 and name[0] == name[-1] == "`" else name
+        if name not in column_names:
+            break
+        columns.append(name)
+    return columns
+
+def sort_frame(chunk: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    if not columns:
+        return chunk
+    return chunk.sort_values(columns, kind="stable", na_position="first", ignore_index=True)
+
+def sort_arrow_table(batch: pa.Table, columns: List[str]) -> pa.Table:
+    if not columns:
+        return batch
+    return batch.sort_by([(col, "ascending") for col in columns])
+
+def arrow_column_stats(batch: pa.Table, column_types: List[str]) -> List[dict]:
+    # Sample statistics for Arrow sources, which skip text type inference
+    stats = []
+    for name, col_type in zip(batch.column_names, column_types):
+        try:
+            distinct_count = len(pc.unique(batch.column(name)))
+        except (pa.ArrowNotImplementedError, pa.ArrowInvalid):
+            distinct_count = 0
+        stats.append({"name": name, "type": col_type, "distinct_count": distinct_count})
+    return stats
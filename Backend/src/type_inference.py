@@ -0,0 +1,250 @@
+from fastapi import HTTPException
+import csv
+import io
+import os
+import random
+import re
+from decimal import Decimal, InvalidOperation
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+INFERENCE_HEAD_ROWS = int(os.getenv("PIPEMAN_INFERENCE_HEAD_ROWS", "1000"))
+INFERENCE_RANDOM_ROWS = int(os.getenv("PIPEMAN_INFERENCE_RANDOM_ROWS", "1000"))
+LOW_CARDINALITY_RATIO = float(os.getenv("PIPEMAN_LOW_CARDINALITY_RATIO", "0.05"))
+LOW_CARDINALITY_MAX_DISTINCT = int(os.getenv("PIPEMAN_LOW_CARDINALITY_MAX_DISTINCT", "10000"))
+
+INTEGER_TYPES = [
+    ("UInt8", 0, 2**8 - 1), ("UInt16", 0, 2**16 - 1), ("UInt32", 0, 2**32 - 1), ("UInt64", 0, 2**64 - 1),
+    ("Int8", -2**7, 2**7 - 1), ("Int16", -2**15, 2**15 - 1), ("Int32", -2**31, 2**31 - 1),
+    ("Int64", -2**63, 2**63 - 1)
+]
+DATE_RANGE = (pd.Timestamp("1970-01-01"), pd.Timestamp("2149-06-06"))
+
+_INTEGER_PATTERN = r"[+-]?(0|[1-9][0-9]*)"
+_DATE_PATTERN = r"[0-9]{4}-[0-9]{2}-[0-9]{2}"
+_DATETIME_PATTERN = r"[0-9]{4}-[0-9]{2}-[0-9]{2}[T ][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]{1,9})?)?(Z|[+-][0-9]{2}:?[0-9]{2})?"
+_TIMEZONE_PATTERN = r"(?:Z|[+-][0-9]{2}:?[0-9]{2})$"
+_LEADING_ZERO_PATTERN = r"[+-]?0[0-9]"
+_BOOL_VALUES = {"true": True, "false": False}
+_CLICKHOUSE_TYPE_PATTERN = r"^[A-Za-z][A-Za-z0-9_]*(\([A-Za-z0-9_, ']*(\([A-Za-z0-9_, ']*\))?[A-Za-z0-9_, ']*\))?$"
+
+def sample_flatfile_text(
+    file_path: str, delimiter: Optional[str], columns: Optional[List[str]] = None,
+    head_rows: int = INFERENCE_HEAD_ROWS, random_rows: int = INFERENCE_RANDOM_ROWS, seed: int = 0,
+    encoding: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Read a sample of a CSV or Excel file as text: the first `head_rows` rows plus,
+    for CSV, up to `random_rows` rows picked by seeking to random byte offsets
+    in the rest of the file. Empty and NA-like cells become NaN.
+    """
+    if file_path.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(file_path, usecols=columns, nrows=head_rows, dtype=str)
+        return df[columns] if columns else df
+    df = pd.read_csv(file_path, sep=delimiter, usecols=columns, nrows=head_rows, dtype=str, encoding=encoding)
+    if random_rows and len(df) >= head_rows:
+        header = pd.read_csv(file_path, sep=delimiter, nrows=0, encoding=encoding).columns
+        lines = random_csv_lines(file_path, delimiter, len(header), random_rows, seed)
+        if lines:
+            extra = pd.read_csv(
+                io.BytesIO(b"".join(lines)), sep=delimiter, header=None, names=header, dtype=str, encoding=encoding
+            )
+            df = pd.concat([df, extra[df.columns]], ignore_index=True)
+    return df[columns] if columns else df
+
+def random_csv_lines(file_path: str, delimiter: str, field_count: int, count: int, seed: int) -> List[bytes]:
+    size = os.path.getsize(file_path)
+    lines = []
+    seen = set()
+    with open(file_path, "rb") as f:
+        f.readline()
+        data_start = f.tell()
+        if size <= data_start:
+            return lines
+        rng = random.Random(seed)
+        for offset in sorted(rng.randrange(data_start, size) for _ in range(count)):
+            # Skip to the start of the next line. A newline inside a quoted field can
+            # misalign a row: lines that start or end inside a quoted field have an odd
+            # quote count or fail the strict parse, and rows with the wrong field count
+            # are dropped
+            f.seek(offset)
+            f.readline()
+            start = f.tell()
+            line = f.readline()
+            if not line or start in seen:
+                continue
+            seen.add(start)
+            if line.count(b'"') % 2:
+                continue
+            try:
+                fields = next(csv.reader([line.decode("utf-8", errors="replace")], delimiter=delimiter, strict=True), [])
+            except csv.Error:
+                continue
+            if len(fields) == field_count:
+                lines.append(line if line.endswith(b"\n") else line + b"\n")
+    return lines
+
+def infer_clickhouse_types(
+    sample: pd.DataFrame, low_cardinality_ratio: float = LOW_CARDINALITY_RATIO
+) -> List[dict]:
+    """
+    Pick the narrowest ClickHouse type that holds every sampled value of each column,
+    with per-column sample statistics. Columns are only Nullable when the sample
+    contains nulls.
+    """
+    return [_infer_column(name, sample[name], low_cardinality_ratio) for name in sample.columns]
+
+def _infer_column(name: str, values: pd.Series, low_cardinality_ratio: float) -> dict:
+    present = values.dropna().astype(str).str.strip()
+    present = present[present != ""]
+    null_count = len(values) - len(present)
+    distinct_count = int(present.nunique())
+    base_type = _infer_base_type(present, distinct_count, low_cardinality_ratio)
+    column_type = base_type
+    if null_count:
+        if base_type.startswith("LowCardinality("):
+            column_type = f"LowCardinality(Nullable({base_type[len('LowCardinality('):-1]}))"
+        else:
+            column_type = f"Nullable({base_type})"
+    return {
+        "name": name,
+        "type": column_type,
+        "nullable": bool(null_count),
+        "sample_size": len(values),
+        "null_count": int(null_count),
+        "distinct_count": distinct_count
+    }
+
+def _infer_base_type(present: pd.Series, distinct_count: int, low_cardinality_ratio: float) -> str:
+    if present.empty:
+        return "String"
+    # Numbers with leading zeros stay strings so codes like "007" survive
+    if present.str.match(_LEADING_ZERO_PATTERN).any():
+        return _infer_string_type(present, distinct_count, low_cardinality_ratio)
+    if present.str.fullmatch(_INTEGER_PATTERN).all():
+        numbers = pd.to_numeric(present, errors="coerce")
+        if numbers.notna().all():
+            low, high = int(numbers.min()), int(numbers.max())
+            for type_name, type_min, type_max in INTEGER_TYPES:
+                if type_min <= low and high <= type_max:
+                    return type_name
+    numbers = pd.to_numeric(present, errors="coerce")
+    if numbers.notna().all():
+        return "Float32" if _fits_float32(numbers.to_numpy(dtype=np.float64)) else "Float64"
+    if present.str.lower().isin(_BOOL_VALUES).all():
+        return "Bool"
+    if present.str.fullmatch(_DATE_PATTERN).all():
+        dates = pd.to_datetime(present, format="%Y-%m-%d", errors="coerce")
+        if dates.notna().all():
+            return "Date" if DATE_RANGE[0] <= dates.min() and dates.max() <= DATE_RANGE[1] else "Date32"
+    if present.str.fullmatch(_DATETIME_PATTERN).all():
+        timezone = present.str.contains(_TIMEZONE_PATTERN).any()
+        timestamps = pd.to_datetime(present, format="ISO8601", errors="coerce", utc=timezone)
+        if timestamps.notna().all():
+            fraction = present.str.extract(r"\.([0-9]+)")[0].str.len().max()
+            precision = 0 if pd.isna(fraction) else 3 if fraction <= 3 else 6 if fraction <= 6 else 9
+            return f"DateTime64({precision}, 'UTC')" if timezone else f"DateTime64({precision})"
+    return _infer_string_type(present, distinct_count, low_cardinality_ratio)
+
+def _fits_float32(values: np.ndarray) -> bool:
+    # Float32 only when every finite value prints back to the same Float64
+    finite = np.isfinite(values)
+    as_float32 = values[finite].astype(np.float32)
+    return bool(np.isfinite(as_float32).all() and (as_float32.astype(str).astype(np.float64) == values[finite]).all())
+
+def _infer_string_type(present: pd.Series, distinct_count: int, low_cardinality_ratio: float) -> str:
+    if distinct_count <= LOW_CARDINALITY_MAX_DISTINCT and distinct_count <= len(present) * low_cardinality_ratio:
+        return "LowCardinality(String)"
+    return "String"
+
+def validate_clickhouse_type(column_type: str) -> str:
+    if not re.match(_CLICKHOUSE_TYPE_PATTERN, column_type):
+        raise HTTPException(status_code=400, detail=f"Invalid column type: {column_type}")
+    return column_type
+
+def apply_type_overrides(column_types: List[dict], overrides: Optional[Dict[str, str]]) -> List[dict]:
+    if not overrides:
+        return column_types
+    names = {c["name"] for c in column_types}
+    unknown = [name for name in overrides if name not in names]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns in column_types: {', '.join(unknown)}")
+    return [
+        {**c, "type": validate_clickhouse_type(overrides[c["name"]])} if c["name"] in overrides else c
+        for c in column_types
+    ]
+
+def _unwrap(column_type: str) -> tuple:
+    if column_type.startswith("LowCardinality("):
+        column_type = column_type[len("LowCardinality("):-1]
+    if column_type.startswith("Nullable("):
+        return column_type[len("Nullable("):-1], True
+    return column_type, False
+
+def convert_chunk_to_clickhouse_types(chunk: pd.DataFrame, column_types: List[str]) -> pd.DataFrame:
+    """
+    Convert a chunk read as text into the pandas values clickhouse_connect expects
+    for each target type. Values that don't parse raise a 422, and so do nulls in
+    non-Nullable columns other than strings, which would otherwise be stored as a
+    made-up 0, false or 1970-01-01; empty strings stay empty strings.
+    """
+    converted = {}
+    for (name, values), column_type in zip(chunk.items(), column_types):
+        base_type, nullable = _unwrap(column_type)
+        text = values.where(values.isna(), values.astype(str).str.strip()).replace({"": np.nan})
+        missing = text.isna()
+        if not nullable and base_type != "String" and not base_type.startswith("FixedString") and missing.any():
+            raise HTTPException(
+                status_code=422,
+                detail=f"Column {name} has empty values but is {column_type}; "
+                       f"override its type with Nullable({base_type}) or increase the inference sample"
+            )
+        try:
+            converted[name] = _convert_column(values, text, missing, base_type, nullable)
+        except (ValueError, TypeError, OverflowError, InvalidOperation):
+            raise HTTPException(
+                status_code=422,
+                detail=f"Column {name} has values that are not {column_type}; "
+                       f"override its type or increase the inference sample"
+            )
+    return pd.DataFrame(converted, index=chunk.index)
+
+def _convert_column(
+    values: pd.Series, text: pd.Series, missing: pd.Series, base_type: str, nullable: bool
+) -> pd.Series:
+    integer_range = next(((low, high) for name, low, high in INTEGER_TYPES if name == base_type), None)
+    if integer_range:
+        numbers = pd.to_numeric(text, errors="raise")
+        present = numbers.dropna()
+        if (present % 1 != 0).any() or (present < integer_range[0]).any() or (present > integer_range[1]).any():
+            raise ValueError(f"Value out of range for {base_type}")
+        if nullable:
+            return numbers.astype("Int64" if base_type.startswith("Int") else "UInt64") \
+                .astype(object).where(~missing, None)
+        return numbers.astype(base_type.lower())
+    if base_type in ("Float32", "Float64"):
+        numbers = pd.to_numeric(text, errors="raise")
+        if base_type == "Float32":
+            # The sample only showed Float32 was lossless there; later values must not be rounded either
+            if not _fits_float32(numbers.to_numpy(dtype=np.float64)):
+                raise ValueError("Value not representable as Float32")
+            return numbers.astype(np.float32)
+        return numbers.astype(np.float64)
+    if base_type.startswith("Decimal"):
+        decimals = text.map(Decimal, na_action="ignore")
+        return decimals.astype(object).where(~missing, None)
+    if base_type == "Bool":
+        flags = text.str.lower().map(_BOOL_VALUES)
+        if flags[~missing].isna().any():
+            raise ValueError("Invalid boolean")
+        return flags.astype(object).where(~missing, None) if nullable else flags.astype(bool)
+    if base_type in ("Date", "Date32"):
+        return pd.to_datetime(text, format="%Y-%m-%d", errors="raise")
+    if base_type.startswith("DateTime"):
+        timezone = "UTC" in base_type
+        return pd.to_datetime(text, format="ISO8601", errors="raise", utc=timezone)
+    # Strings keep their original text, including surrounding whitespace
+    if nullable:
+        return values.astype(object).where(~missing, None)
+    return values.where(~missing, "").astype(str)
@@ -0,0 +1,210 @@
+from fastapi import HTTPException
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from .metadata_cache import metadata_cache
+from .state_store import ensure_schema, state_db
+
+UPLOAD_TMP_DIR = os.getenv("PIPEMAN_UPLOAD_TMP_DIR", os.path.join("Uploads", ".pipeman", "uploads"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("PIPEMAN_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+HASH_BUFFER_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    status TEXT NOT NULL,
+    ranges TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+class _RunningHash:
+    # sha256 of the contiguous prefix [0, offset) received so far
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.offset = 0
+
+_hashes: Dict[str, _RunningHash] = {}
+_lock = threading.Lock()
+
+def init_uploads():
+    ensure_schema(_SCHEMA)
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_TMP_DIR, f"{upload_id}.part")
+
+def _merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    merged = []
+    for lo, hi in sorted(ranges + [[start, end]]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+def _missing_ranges(ranges: List[List[int]], size: int) -> List[List[int]]:
+    missing = []
+    position = 0
+    for lo, hi in ranges:
+        if lo > position:
+            missing.append([position, lo])
+        position = max(position, hi)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+def _load_upload(upload_id: str) -> dict:
+    with state_db() as conn:
+        row = conn.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    upload = dict(row)
+    upload["ranges"] = json.loads(upload["ranges"])
+    return upload
+
+def init_upload(filename: str, size: int, sha256: Optional[str] = None) -> dict:
+    """
+    Start a chunked upload: reserve a temporary file of `size` bytes that chunks
+    are written into at their offsets until the upload is completed.
+    """
+    if not re.match(r"^[a-zA-Z0-9_\-\.]+$", filename):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    upload_id = uuid.uuid4().hex
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    with open(_part_path(upload_id), "wb") as f:
+        f.truncate(size)
+    now = time.time()
+    with state_db() as conn:
+        conn.execute(
+            "INSERT INTO uploads (id, filename, size, sha256, status, ranges, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'uploading', '[]', ?, ?)",
+            (upload_id, filename, size, sha256.lower() if sha256 else None, now, now)
+        )
+    return {"upload_id": upload_id, "chunk_size": UPLOAD_CHUNK_SIZE}
+
+def get_upload_status(upload_id: str) -> dict:
+    upload = _load_upload(upload_id)
+    return {
+        "upload_id": upload_id,
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "status": upload["status"],
+        "received_bytes": sum(hi - lo for lo, hi in upload["ranges"]),
+        "received_ranges": upload["ranges"],
+        "missing_ranges": _missing_ranges(upload["ranges"], upload["size"])
+    }
+
+class ChunkWriter:
+    """
+    Writes one chunk into the upload's temporary file piece by piece as it is
+    received. The chunk only counts as received once `commit` succeeds; an
+    optional `sha256` of the chunk is checked first.
+    """
+
+    def __init__(self, upload_id: str, offset: int, sha256: Optional[str] = None):
+        upload = _load_upload(upload_id)
+        if upload["status"] != "uploading":
+            raise HTTPException(status_code=409, detail=f"Upload is already {upload['status']}")
+        if offset < 0 or offset >= max(upload["size"], 1):
+            raise HTTPException(status_code=400, detail="Chunk offset outside the file")
+        self.upload_id = upload_id
+        self.size = upload["size"]
+        self.offset = offset
+        self.position = offset
+        self.expected_sha256 = sha256.lower() if sha256 else None
+        self.chunk_hasher = hashlib.sha256() if sha256 else None
+        with _lock:
+            running = _hashes.get(upload_id)
+            # Extend the whole-file hash while writing when this chunk continues its prefix
+            self.file_hasher = running.hasher.copy() if running and running.offset == offset else None
+            if running is None and offset == 0:
+                self.file_hasher = hashlib.sha256()
+        self.f = open(_part_path(upload_id), "r+b")
+        self.f.seek(offset)
+
+    def write(self, data: bytes):
+        if self.position + len(data) > self.size:
+            raise HTTPException(status_code=400, detail="Chunk extends past the declared file size")
+        self.f.write(data)
+        self.position += len(data)
+        if self.chunk_hasher:
+            self.chunk_hasher.update(data)
+        if self.file_hasher:
+            self.file_hasher.update(data)
+
+    def close(self):
+        self.f.close()
+
+    def commit(self) -> dict:
+        if self.chunk_hasher and self.chunk_hasher.hexdigest() != self.expected_sha256:
+            raise HTTPException(status_code=422, detail="Chunk checksum mismatch")
+        with _lock:
+            upload = _load_upload(self.upload_id)
+            ranges = _merge_range(upload["ranges"], self.offset, self.position) \
+                if self.position > self.offset else upload["ranges"]
+            with state_db() as conn:
+                conn.execute(
+                    "UPDATE uploads SET ranges = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(ranges), time.time(), self.upload_id)
+                )
+            if self.file_hasher:
+                running = _hashes.setdefault(self.upload_id, _RunningHash())
+                if running.offset == self.offset:
+                    running.hasher = self.file_hasher
+                    running.offset = self.position
+        return {"upload_id": self.upload_id, "offset": self.offset, "received": self.position - self.offset}
+
+def complete_upload(upload_id: str, sha256: Optional[str] = None) -> dict:
+    """
+    Check that every byte has arrived, verify the whole-file sha256 when one was
+    given, and move the file into the upload directory.
+    """
+    upload = _load_upload(upload_id)
+    if upload["status"] != "uploading":
+        raise HTTPException(status_code=409, detail=f"Upload is already {upload['status']}")
+    missing = _missing_ranges(upload["ranges"], upload["size"])
+    if missing:
+        raise HTTPException(status_code=409, detail=f"Upload incomplete, missing ranges: {missing}")
+
+    with _lock:
+        running = _hashes.pop(upload_id, None) or _RunningHash()
+    # Hash whatever arrived out of order (or before a restart) from disk
+    with open(_part_path(upload_id), "rb") as f:
+        f.seek(running.offset)
+        for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+            running.hasher.update(block)
+    digest = running.hasher.hexdigest()
+    expected = (sha256 or upload["sha256"] or "").lower()
+    if expected and digest != expected:
+        raise HTTPException(status_code=422, detail=f"File checksum mismatch: expected {expected}, got {digest}")
+
+    file_path = os.path.join("Uploads", upload["filename"])
+    os.replace(_part_path(upload_id), file_path)
+    metadata_cache.invalidate(("flatfile", upload["filename"]))
+    with state_db() as conn:
+        conn.execute(
+            "UPDATE uploads SET status = 'completed', updated_at = ? WHERE id = ?", (time.time(), upload_id)
+        )
+    return {"filename": upload["filename"], "path": file_path, "size": upload["size"], "sha256": digest}
+
+def abort_upload(upload_id: str) -> dict:
+    upload = _load_upload(upload_id)
+    if upload["status"] != "uploading":
+        raise HTTPException(status_code=409, detail=f"Upload is already {upload['status']}")
+    with _lock:
+        _hashes.pop(upload_id, None)
+    if os.path.exists(_part_path(upload_id)):
+        os.remove(_part_path(upload_id))
+    with state_db() as conn:
+        conn.execute("UPDATE uploads SET status = 'aborted', updated_at = ? WHERE id = ?", (time.time(), upload_id))
+    return {"upload_id": upload_id, "status": "aborted", "filename": upload["filename"]}
@@ -1,17 +1,77 @@
-import pandas as pd
+import pyarrow as pa
+import zlib
+import zstandard
+from typing import Iterable, Iterator, List, Optional, Set
 
-def map_pandas_to_clickhouse_types(dtypes: pd.Series) -> list:
+# Preferred first when the client accepts several
+SUPPORTED_CONTENT_ENCODINGS = ["zstd", "gzip"]
+
+def map_arrow_to_clickhouse_types(schema: pa.Schema, nullable: Optional[Set[str]] = None) -> List[str]:
+    """
+    Map Arrow field types to ClickHouse types for table creation. Only fields
+    named in `nullable`, the ones known to hold nulls, are wrapped in Nullable;
+    ClickHouse's Arrow input stores nulls in other columns as column defaults
+    (input_format_null_as_default).
+    """
+    return [_arrow_type_to_clickhouse(field.type, field.name in (nullable or ())) for field in schema]
+
+def _arrow_type_to_clickhouse(arrow_type: pa.DataType, nullable: bool = False) -> str:
+    if pa.types.is_dictionary(arrow_type):
+        return f"LowCardinality({_arrow_type_to_clickhouse(arrow_type.value_type, nullable)})"
+    base_type = _arrow_base_type(arrow_type)
+    return f"Nullable({base_type})" if nullable else base_type
+
+def _arrow_base_type(arrow_type: pa.DataType) -> str:
+    if pa.types.is_boolean(arrow_type):
+        return "Bool"
+    if pa.types.is_integer(arrow_type):
+        prefix = "UInt" if pa.types.is_unsigned_integer(arrow_type) else "Int"
+        return f"{prefix}{arrow_type.bit_width}"
+    if pa.types.is_floating(arrow_type):
+        return "Float64" if arrow_type.bit_width == 64 else "Float32"
+    if pa.types.is_decimal(arrow_type):
+        return f"Decimal({arrow_type.precision}, {arrow_type.scale})"
+    if pa.types.is_date(arrow_type):
+        return "Date32"
+    if pa.types.is_timestamp(arrow_type):
+        precision = {"s": 0, "ms": 3, "us": 6, "ns": 9}[arrow_type.unit]
+        return f"DateTime64({precision}, '{arrow_type.tz}')" if arrow_type.tz else f"DateTime64({precision})"
+    return "String"
+
+def negotiate_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the response compression from an Accept-Encoding header, or None for identity.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in SUPPORTED_CONTENT_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def encode_stream(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
     """
-    Map pandas dtypes to ClickHouse data types for table creation.
+    Compress a byte stream on the fly with the negotiated content encoding.
     """
-    type_mapping = {
-        "int64": "Int64",
-        "int32": "Int32",
-        "float64": "Float64",
-        "float32": "Float32",
-        "object": "String",
-        "string": "String",
-        "bool": "UInt8",
-        "datetime64[ns]": "DateTime"
-    }
-    return [type_mapping.get(str(dtype), "String") for dtype in dtypes]
\ No newline at end of file
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "gzip":
+        compressor = zlib.compressobj(wbits=31)
+    elif encoding == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError(f"Unsupported content encoding: {encoding}")
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,88 @@
+from clickhouse_connect.driver.binding import format_query_value
+import datetime
+import time
+from typing import Any, Optional
+from .state_store import ensure_schema, state_db
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS export_watermarks (
+    connection TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    output_file TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    watermark TEXT,
+    status TEXT NOT NULL,
+    run_file TEXT,
+    run_target TEXT,
+    checkpoint_offset INTEGER,
+    checkpoint_watermark TEXT,
+    rows_exported INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (connection, table_name, output_file)
+);
+"""
+
+def init_watermarks():
+    ensure_schema(_SCHEMA)
+
+def watermark_literal(value: Any) -> str:
+    """
+    SQL literal for a watermark value. Datetimes keep their sub-second part,
+    which format_query_value drops.
+    """
+    if isinstance(value, datetime.datetime):
+        return f"parseDateTime64BestEffort('{value.isoformat()}', 6)"
+    return str(format_query_value(value))
+
+def get_watermark(connection: str, table: str, output_file: str) -> Optional[dict]:
+    with state_db() as conn:
+        row = conn.execute(
+            "SELECT * FROM export_watermarks WHERE connection = ? AND table_name = ? AND output_file = ?",
+            (connection, table, output_file)
+        ).fetchone()
+    return dict(row) if row else None
+
+def begin_run(
+    connection: str, table: str, output_file: str, column: str,
+    run_file: str, run_target: str, start_offset: int
+):
+    """
+    Record the start of an export run: its file, the upper bound it exports up to,
+    and the file offset to truncate back to if it is interrupted before its first
+    checkpoint.
+    """
+    with state_db() as conn:
+        conn.execute(
+            "INSERT INTO export_watermarks (connection, table_name, output_file, column_name, status, run_file, "
+            "run_target, checkpoint_offset, updated_at) VALUES (?, ?, ?, ?, 'running', ?, ?, ?, ?) "
+            "ON CONFLICT (connection, table_name, output_file) DO UPDATE SET column_name = excluded.column_name, "
+            "status = 'running', run_file = excluded.run_file, run_target = excluded.run_target, "
+            "checkpoint_offset = excluded.checkpoint_offset, checkpoint_watermark = NULL, "
+            "updated_at = excluded.updated_at",
+            (connection, table, output_file, column, run_file, run_target, start_offset, time.time())
+        )
+
+def checkpoint_run(connection: str, table: str, output_file: str, offset: int, watermark: str, rows: int):
+    with state_db() as conn:
+        conn.execute(
+            "UPDATE export_watermarks SET checkpoint_offset = ?, checkpoint_watermark = ?, "
+            "rows_exported = rows_exported + ?, updated_at = ? "
+            "WHERE connection = ? AND table_name = ? AND output_file = ?",
+            (offset, watermark, rows, time.time(), connection, table, output_file)
+        )
+
+def complete_run(connection: str, table: str, output_file: str, watermark: str, rows: int):
+    with state_db() as conn:
+        conn.execute(
+            "UPDATE export_watermarks SET status = 'completed', watermark = ?, run_file = NULL, run_target = NULL, "
+            "checkpoint_offset = NULL, checkpoint_watermark = NULL, rows_exported = rows_exported + ?, "
+            "updated_at = ? WHERE connection = ? AND table_name = ? AND output_file = ?",
+            (watermark, rows, time.time(), connection, table, output_file)
+        )
+
+def reset_watermark(connection: str, table: str, output_file: str):
+    with state_db() as conn:
+        conn.execute(
+            "DELETE FROM export_watermarks WHERE connection = ? AND table_name = ? AND output_file = ?",
+            (connection, table, output_file)
+        )
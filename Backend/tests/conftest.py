@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.mock_client import MockServer
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # The services resolve Uploads/ and their state store relative to the working directory
+    os.makedirs(tmp_path / "Uploads")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    from src.clickhouse_service import client_pool
+    server = MockServer()
+    client_pool.clear()
+    monkeypatch.setattr(client_pool, "factory", server.client)
+    yield server
+    client_pool.clear()
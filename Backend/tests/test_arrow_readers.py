@@ -0,0 +1,28 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.flatfile_service import resolve_flatfile_columns
+
+def test_parquet_columns_with_nulls_are_nullable(workdir):
+    table = pa.table({"with_nulls": [1, 2, None], "complete": [1, 2, 3], "labels": ["a", None, "b"]})
+    pq.write_table(table, workdir / "Uploads" / "nulls.parquet")
+    names, types, _ = resolve_flatfile_columns("nulls.parquet", None, None, 100, None, None)
+    assert dict(zip(names, types)) == {
+        "with_nulls": "Nullable(Int64)", "complete": "Int64", "labels": "Nullable(String)"
+    }
+
+def test_parquet_without_statistics_is_treated_as_nullable(workdir):
+    pq.write_table(pa.table({"x": [1, 2]}), workdir / "Uploads" / "bare.parquet", write_statistics=False)
+    _, types, _ = resolve_flatfile_columns("bare.parquet", None, None, 100, None, None)
+    assert types == ["Nullable(Int64)"]
+
+def test_streamed_formats_find_nulls_after_the_first_batch(workdir):
+    import gzip
+    rows = 200_000
+    with open(workdir / "Uploads" / "late.ndjson", "w") as f:
+        f.write("".join(f'{{"x": {i}}}\n' for i in range(rows)) + '{"x": null}\n')
+    with gzip.open(workdir / "Uploads" / "late.csv.gz", "wt") as f:
+        f.write("x,y\n" + "".join(f"{i},{i}\n" for i in range(rows)) + "0,\n")
+    _, types, _ = resolve_flatfile_columns("late.ndjson", None, None, 100, None, None)
+    assert types == ["Nullable(Int64)"]
+    _, types, _ = resolve_flatfile_columns("late.csv.gz", ",", None, 100, None, None)
+    assert types == ["Int64", "Nullable(Int64)"]
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import threading
+import pytest
+from fastapi import HTTPException
+from benchmarks.datasets import write_csv
+from src.batch_ingest import ingest_flatfiles_batch, shutdown_parse_pool
+from src.job_service import JobProgress, init_jobs
+from src.state_store import state_db
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def parse_pool():
+    # The pool's workers keep the working directory they were spawned in
+    shutdown_parse_pool()
+    yield
+    shutdown_parse_pool()
+
+def write_parts(count: int, rows: int = 3000):
+    for i in range(count):
+        write_csv(os.path.join("Uploads", f"part_{i}.csv"), "mixed", rows, i)
+    with open(os.path.join("Uploads", "part_0.csv")) as f:
+        good = f.read()
+    with open(os.path.join("Uploads", "part_bad.csv"), "w") as f:
+        f.write(good.replace("\n1", "\nnot-a-number", 5))
+
+def test_importing_main_leaves_running_jobs_alone(workdir):
+    # Spawned parse workers import src.main; only server startup may mark jobs interrupted
+    init_jobs()
+    with state_db() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, params, created_at) VALUES ('job', 'batch_ingest', 'running', '{}', 0)"
+        )
+    subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", "import src.main"], cwd=workdir, check=True,
+        env={**os.environ, "PYTHONPATH": BACKEND_DIR}
+    )
+    with state_db() as conn:
+        assert conn.execute("SELECT status FROM jobs WHERE id = 'job'").fetchone()["status"] == "running"
+
+def test_batch_ingest_skips_failing_files(workdir, mock_server, parse_pool):
+    init_jobs()
+    write_parts(2)
+    progress = JobProgress("test", threading.Event(), "test")
+    result = ingest_flatfiles_batch(
+        None, "part_*.csv", ",", "localhost", "8123", "default", "default", "parts", None,
+        batch_size=1000, parallelism=2, on_error="skip", progress=progress
+    )
+    statuses = {f["filename"]: (f["status"], f["record_count"]) for f in result["files"]}
+    assert statuses == {
+        "part_0.csv": ("completed", 3000), "part_1.csv": ("completed", 3000), "part_bad.csv": ("failed", 0)
+    }
+    assert result["record_count"] == mock_server.inserted_rows == 6000
+    assert progress.extra["failed_files"] == 1
+
+def test_batch_ingest_aborts_on_failing_file(workdir, mock_server, parse_pool):
+    init_jobs()
+    write_parts(1)
+    with pytest.raises(HTTPException) as error:
+        ingest_flatfiles_batch(
+            None, "part_*.csv", ",", "localhost", "8123", "default", "default", "parts", None, batch_size=1000
+        )
+    assert "part_bad.csv" in error.value.detail
@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from src.csv_index import MappedCSVReader, build_row_index
+
+def write_rows(path, rows):
+    with open(path, "w") as f:
+        f.write("id,description\n" + "\n".join(rows) + "\n")
+
+def test_stray_quote_in_unquoted_field_is_literal(workdir):
+    path = workdir / "Uploads" / "stray.csv"
+    write_rows(path, ['0,12" pipe'] + [f'{i},"quoted\nnewline ""here"""' if i % 7 == 0 else f"{i},plain" for i in range(1, 2501)])
+    assert build_row_index(str(path)).row_count == len(pd.read_csv(path)) == 2501
+    with MappedCSVReader(str(path)) as reader:
+        frames = [reader.read_rows(start, stop) for start, stop in reader.row_ranges(1000)]
+    assert sum(len(frame) for frame in frames) == 2501
+
+def test_miscounted_index_fails_loudly(workdir):
+    # A stray quote right before a newline looks like a closing quote to the scan
+    path = workdir / "Uploads" / "unbalanced.csv"
+    write_rows(path, ['0,ab"'] + [f"{i},ab" for i in range(1, 3000)])
+    with MappedCSVReader(str(path)) as reader, pytest.raises(HTTPException) as error:
+        for start, stop in reader.row_ranges(1000):
+            reader.read_rows(start, stop)
+    assert error.value.status_code == 422
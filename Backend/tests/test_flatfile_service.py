@@ -0,0 +1,28 @@
+import threading
+from src.flatfile_service import get_flatfile_column_types, ingest_flatfile_to_clickhouse
+from src.job_service import JobProgress, init_jobs
+
+def test_latin1_csv_ingests(workdir, mock_server):
+    init_jobs()
+    with open(workdir / "Uploads" / "latin1.csv", "wb") as f:
+        f.write("name,count\n".encode() + "".join(f"café {i},{i}\n" for i in range(2000)).encode("latin-1"))
+    # Ingestion samples more rows than the upload-time index, so it takes the sampling path
+    types = get_flatfile_column_types("latin1.csv", ",", head_rows=10000)
+    assert [c["name"] for c in types] == ["name", "count"]
+    result = ingest_flatfile_to_clickhouse(
+        "latin1.csv", ",", "localhost", "8123", "default", "default", "latin1", [],
+        progress=JobProgress("test", threading.Event(), "test")
+    )
+    assert result["record_count"] == mock_server.inserted_rows == 2000
+
+def test_idempotent_rerun_inserts_nothing(workdir, mock_server):
+    from src.ingest_manifest import init_manifest
+    init_jobs()
+    init_manifest()
+    with open(workdir / "Uploads" / "rows.csv", "w") as f:
+        f.write("id,value\n" + "".join(f"{i},{i * 2}\n" for i in range(3000)))
+    args = ("rows.csv", ",", "localhost", "8123", "default", "default", "rows", [])
+    first = ingest_flatfile_to_clickhouse(*args, batch_size=1000, idempotent=True)
+    second = ingest_flatfile_to_clickhouse(*args, batch_size=1000, idempotent=True)
+    assert first["record_count"] == 3000
+    assert second["record_count"] == 0 and second["skipped_batches"] == first["skipped_batches"] + 3
@@ -0,0 +1,35 @@
+import pytest
+from fastapi import HTTPException
+from src.flatfile_service import ensure_deduplication_window
+from src.ingest_manifest import DEDUPLICATION_WINDOW
+from src.models import TableSpec
+from src.table_spec import build_create_table_sql
+
+class FakeClient:
+    def __init__(self, engine: str, create_query: str):
+        self.row = (engine, create_query)
+        self.commands = []
+
+    def query(self, sql, parameters=None):
+        return type("Result", (), {"result_rows": [self.row]})()
+
+    def command(self, sql):
+        self.commands.append(sql)
+
+def test_new_tables_get_the_window_in_create():
+    sql = build_create_table_sql(
+        "t", ["a"], ["Int64"], TableSpec(), [], {"non_replicated_deduplication_window": DEDUPLICATION_WINDOW}
+    )
+    assert sql.endswith(f"ORDER BY tuple() SETTINGS non_replicated_deduplication_window = {DEDUPLICATION_WINDOW}")
+
+@pytest.mark.parametrize("window, altered", [(None, True), (DEDUPLICATION_WINDOW // 2, True), (DEDUPLICATION_WINDOW * 10, False)])
+def test_existing_window_is_only_raised(window, altered):
+    settings = f" SETTINGS non_replicated_deduplication_window = {window}" if window is not None else ""
+    client = FakeClient("MergeTree", f"CREATE TABLE default.t (a Int64) ENGINE = MergeTree ORDER BY a{settings}")
+    ensure_deduplication_window(client, "t")
+    assert bool(client.commands) == altered
+
+def test_non_mergetree_tables_are_rejected():
+    with pytest.raises(HTTPException) as error:
+        ensure_deduplication_window(FakeClient("Log", "CREATE TABLE default.t (a Int64) ENGINE = Log"), "t")
+    assert error.value.status_code == 400
@@ -0,0 +1,22 @@
+import threading
+from src.connection_pool import ClientPool
+from src.insert_pipeline import run_insert_pipeline
+
+def test_insert_workers_leave_clients_for_other_requests():
+    pool = ClientPool(lambda key: object(), max_size=3, checkout_timeout=0.5, reserved=1)
+    in_use = []
+    lock = threading.Lock()
+
+    def insert_batch(client, batch) -> int:
+        # Stands in for a preview arriving mid-load: it must get a client without waiting
+        with pool.connection("key"):
+            with lock:
+                in_use.append(pool.stats()["in_use"])
+        return batch
+
+    rows = run_insert_pipeline(
+        range(50), lambda: pool.connection("key"), insert_batch, parallelism=pool.job_capacity
+    )
+    assert rows == sum(range(50))
+    assert max(in_use) <= pool.max_size
+    assert pool.stats()["timeouts"] == 0
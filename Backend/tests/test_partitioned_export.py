@@ -0,0 +1,44 @@
+import threading
+import pytest
+from src.clickhouse_service import export_clickhouse_partitioned
+from src.job_service import JobProgress, init_jobs
+
+ROWS = 5000
+
+@pytest.mark.parametrize("with_progress", [False, True])
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_partitioned_export_writes_every_partition(workdir, mock_server, with_progress, output_format):
+    init_jobs()
+    mock_server.register_table("events", "narrow_numeric", ROWS)
+    progress = JobProgress("test", threading.Event(), "test") if with_progress else None
+    result = export_clickhouse_partitioned(
+        "localhost", "8123", "default", "default", "events", ["c00_int", "c02_float"],
+        f"events.{output_format}", ",", partitions=3, output_format=output_format, progress=progress
+    )
+    # The mock ignores the partition predicates, so every partition holds the whole table
+    assert result["partition_counts"] == [ROWS] * 3
+    assert result["files"] == [f"events.{output_format}"]
+    assert (workdir / "Uploads" / f"events.{output_format}").exists()
+    if progress:
+        assert progress.rows_done == 3 * ROWS
+        assert "fetch" in progress.timings
+        assert [p["status"] for p in progress.extra["partitions"]] == ["completed"] * 3
+
+def test_hash_partitions_keep_null_keys():
+    from src.partitioned_export import plan_partitions
+    predicates, planned_rows = plan_partitions(None, "events", "hash", 3, "key")
+    assert predicates[0].endswith("OR key IS NULL")
+    assert sum("IS NULL" in p for p in predicates) == 1 and planned_rows is None
+
+def test_part_export_fails_when_parts_change(workdir, mock_server, monkeypatch):
+    from fastapi import HTTPException
+    import src.clickhouse_service as clickhouse_service
+    mock_server.register_table("events", "narrow_numeric", ROWS)
+    # Parts planned to hold ROWS rows, but the (predicate-blind) mock returns them three times
+    monkeypatch.setattr(clickhouse_service, "plan_partitions", lambda *args: (["1", "1", "1"], ROWS))
+    with pytest.raises(HTTPException) as error:
+        export_clickhouse_partitioned(
+            "localhost", "8123", "default", "default", "events", ["c00_int"], "events.csv", ",",
+            strategy="part", partitions=3
+        )
+    assert error.value.status_code == 409
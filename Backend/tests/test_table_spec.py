@@ -0,0 +1,14 @@
+from src.table_spec import build_create_table_sql, sort_columns, suggest_order_by
+
+def test_suggested_order_by_quotes_column_names():
+    stats = [
+        {"name": "event type", "type": "String", "distinct_count": 5},
+        {"name": "user-id", "type": "UInt64", "distinct_count": 50},
+        {"name": "score", "type": "Float64", "distinct_count": 2},
+    ]
+    order_by = suggest_order_by(stats)
+    assert order_by == ["`event type`", "`user-id`"]
+    sql = build_create_table_sql("events", ["event type", "user-id", "score"], ["String", "UInt64", "Float64"],
+                                 order_by=order_by)
+    assert sql.endswith("ORDER BY (`event type`, `user-id`)")
+    assert sort_columns(order_by, ["event type", "user-id", "score"]) == ["event type", "user-id"]
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from src.type_inference import convert_chunk_to_clickhouse_types, infer_clickhouse_types
+
+def test_float32_inferred_only_when_lossless():
+    types = infer_clickhouse_types(pd.DataFrame({"short": ["1.5", "0.25"], "long": ["16777217.5", "1"]}))
+    assert [c["type"] for c in types] == ["Float32", "Float64"]
+
+def test_float32_conversion_rejects_values_it_would_round():
+    converted = convert_chunk_to_clickhouse_types(pd.DataFrame({"x": ["1.5", "2.25"]}), ["Float32"])
+    assert converted["x"].tolist() == [1.5, 2.25]
+    with pytest.raises(HTTPException) as error:
+        convert_chunk_to_clickhouse_types(pd.DataFrame({"x": ["1.5", "16777217.5"]}), ["Float32"])
+    assert error.value.status_code == 422
+
+def test_nulls_in_non_nullable_columns_are_rejected_not_defaulted():
+    for column_type in ("Int32", "Float64", "Bool", "Date", "DateTime", "Decimal(10, 2)"):
+        with pytest.raises(HTTPException) as error:
+            convert_chunk_to_clickhouse_types(pd.DataFrame({"x": ["1", ""]}), [column_type])
+        assert error.value.status_code == 422 and "Nullable" in error.value.detail
+    converted = convert_chunk_to_clickhouse_types(pd.DataFrame({"x": ["1", ""], "s": ["a", ""]}),
+                                                  ["Nullable(Int32)", "String"])
+    assert converted["x"].tolist() == [1, None]
+    assert converted["s"].tolist() == ["a", ""]
+
+def test_random_sample_skips_lines_inside_quoted_fields(tmp_path):
+    from src.type_inference import sample_flatfile_text
+    path = tmp_path / "multiline.csv"
+    with open(path, "w") as f:
+        f.write("id,note\n" + "".join(f'{i},"first line\nsecond, line {i}"\n' for i in range(3000)))
+    sample = sample_flatfile_text(str(path), ",", head_rows=1000, random_rows=1000)
+    assert len(sample) >= 1000
+    assert sample["id"].str.fullmatch(r"[0-9]+").all()
+
+def test_index_job_handles_quoted_newlines(workdir):
+    from src.csv_index import index_csv_file
+    path = workdir / "Uploads" / "multiline.csv"
+    with open(path, "w") as f:
+        f.write("id,note\n" + "".join(f'{i},"first line\nsecond line"\n' for i in range(3000)))
+    index = index_csv_file(str(path))
+    assert index.row_count == 3000
+    assert [c["type"] for c in index.column_stats][0] == "UInt16"
@@ -327,6 +327,23 @@ const Sidebar: React.FC<SidebarProps> = ({
     }
   }, [clickhouseInputs, fileInputs, source, selectedTable, columns, setPreviewData, setShowPreview, setStatus, toast]);
 
+  const waitForJob = useCallback(async (jobId: string) => {
+    // Ingestion runs as a background job; poll until it finishes
+    for (;;) {
+      const { data: job } = await axios.get(`${baseUrl}/api/jobs/${jobId}`);
+      if (job.progress?.percent != null) {
+        setProgress(job.progress.percent);
+      }
+      if (job.status === 'completed') {
+        return job.result;
+      }
+      if (job.status !== 'queued' && job.status !== 'running') {
+        throw { response: { data: { detail: job.error || `Ingestion ${job.status}` } } };
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  }, [setProgress]);
+
   const handleStartIngestion = useCallback(async () => {
     try {
       setStatus('ingesting');
@@ -447,12 +464,13 @@ const Sidebar: React.FC<SidebarProps> = ({
           columns: selectedColumns,
         });
       }
-      setRecordCount(response.data.record_count);
+      const result = await waitForJob(response.data.job_id);
+      setRecordCount(result.record_count);
       setProgress(100);
       setStatus('completed');
       toast({
         title: 'Success',
-        description: `Ingested ${response.data.record_count} records`,
+        description: `Ingested ${result.record_count} records`,
       });
     } catch (error: any) {
       setStatus('error');
@@ -472,6 +490,7 @@ const Sidebar: React.FC<SidebarProps> = ({
     columns,
     isConnected,
     uploadFile,
+    waitForJob,
     setRecordCount,
     setProgress,
     setStatus,